@@ -14,3 +14,8 @@ from django.core.asgi import get_asgi_application
 os.environ.setdefault('DJANGO_SETTINGS_MODULE', 'core.settings')
 
 application = get_asgi_application()
+
+# Build the autocomplete index now rather than in the first request
+from games.autocomplete import warm_title_index  # noqa: E402
+
+warm_title_index()
@@ -100,6 +100,22 @@ DATABASES = {
 }
 
 
+# Cache
+# Set CACHE_URL (usually the broker's Redis) whenever Celery workers run, so
+# web and worker processes agree on catalog version stamps, refresh locks and
+# debounce markers. Without it each process gets its own local memory cache.
+
+REDIS_URL = os.getenv('REDIS_URL', 'redis://localhost:6379/0')
+
+if os.getenv('CACHE_URL'):
+    CACHES = {
+        'default': {
+            'BACKEND': 'django.core.cache.backends.redis.RedisCache',
+            'LOCATION': os.getenv('CACHE_URL'),
+        }
+    }
+
+
 # Password validation
 # https://docs.djangoproject.com/en/5.2/ref/settings/#auth-password-validators
 
@@ -161,8 +177,8 @@ CORS_ALLOW_ALL_ORIGINS = DEBUG
 CORS_ALLOWED_ORIGINS = os.getenv('CORS_ALLOWED_ORIGINS', 'http://localhost:3000').split(',')
 
 # Celery settings
-CELERY_BROKER_URL = os.getenv('REDIS_URL', 'redis://localhost:6379/0')
-CELERY_RESULT_BACKEND = os.getenv('REDIS_URL', 'redis://localhost:6379/0')
+CELERY_BROKER_URL = REDIS_URL
+CELERY_RESULT_BACKEND = REDIS_URL
 CELERY_ACCEPT_CONTENT = ['json']
 CELERY_TASK_SERIALIZER = 'json'
 CELERY_RESULT_SERIALIZER = 'json'
@@ -189,7 +205,65 @@ CELERY_BEAT_SCHEDULE = {
         'schedule': crontab(hour=4, minute=0),  # Every day at 4 AM
         'kwargs': {'batch_size': 20},  # Process in small batches
     },
+    # Rebuild the item-item similarity index nightly (at 4:30 AM)
+    'rebuild-similarity-index-nightly': {
+        'task': 'recommendations.tasks.rebuild_similarity_index',
+        'schedule': crontab(hour=4, minute=30),
+    },
+    # Re-rank the description similarity neighbors nightly (at 4:40 AM)
+    'refresh-description-neighbors-nightly': {
+        'task': 'recommendations.tasks.refresh_description_neighbors',
+        'schedule': crontab(hour=4, minute=40),
+    },
+    # Retrain the collaborative filtering model before the nightly refresh (at 4:45 AM)
+    'train-collaborative-model-nightly': {
+        'task': 'recommendations.tasks.train_collaborative_model',
+        'schedule': crontab(hour=4, minute=45),
+    },
+    # Delete recommendations superseded by newer generations (hourly)
+    'collect-stale-recommendations-hourly': {
+        'task': 'recommendations.tasks.collect_stale_recommendations',
+        'schedule': crontab(minute=15),
+    },
+    # Refresh everyone's recommendations nightly (at 5 AM)
+    'refresh-recommendations-nightly': {
+        'task': 'recommendations.tasks.generate_recommendations_for_all_users',
+        'schedule': crontab(hour=5, minute=0),
+    },
 }
 
+# Recommendation engine
+# Directory for precomputed recommendation artifacts (similarity index, ...)
+RECOMMENDATION_DATA_DIR = os.getenv('RECOMMENDATION_DATA_DIR', os.path.join(BASE_DIR, 'data', 'recommendations'))
+# Share the catalog features between processes through memory-mapped files
+RECOMMENDATION_CATALOG_ARTIFACT = os.getenv('RECOMMENDATION_CATALOG_ARTIFACT', 'False') == 'True'
+RECOMMENDATION_CATALOG_ARTIFACT_KEEP = 3  # Versions kept on disk
+# Number of users per shard and scoring batch in full refreshes
+RECOMMENDATION_BATCH_SIZE = int(os.getenv('RECOMMENDATION_BATCH_SIZE', '500'))
+# Ranked candidates kept below each user's list to backfill after new ratings
+RECOMMENDATION_OVERFLOW_SIZE = 50
+RECOMMENDATION_OVERFLOW_TIMEOUT = 60 * 60 * 24 * 7  # One week
+# In-process cache of ranked candidate lists shared by users with identical preferences
+RECOMMENDATION_RANKING_CACHE_SIZE = 1024
+RECOMMENDATION_RANKING_CACHE_TTL = 60 * 60  # One hour
+RECOMMENDATION_RANKING_CACHE_DEPTH = 200
+# Per-user refreshes requested within this window are collapsed into one task
+RECOMMENDATION_REFRESH_DEBOUNCE_SECONDS = int(os.getenv('RECOMMENDATION_REFRESH_DEBOUNCE_SECONDS', '10'))
+RECOMMENDATION_REFRESH_LOCK_TIMEOUT = 60 * 5
+# Neighbors kept per game in the item-item similarity index
+RECOMMENDATION_SIMILAR_GAMES = 20
+# Games kept per precomputed segment list served before a user's own list lands
+RECOMMENDATION_SEGMENT_SIZE = 40
+# Share of the collaborative filtering score in the blended ranking (0 turns it off)
+RECOMMENDATION_COLLABORATIVE_WEIGHT = float(os.getenv('RECOMMENDATION_COLLABORATIVE_WEIGHT', '0.3'))
+# Ratings at or above this count as a like in the "players who liked X also liked Y" index
+RECOMMENDATION_COOCCURRENCE_MIN_RATING = 8
+# Co-occurring games kept per game
+RECOMMENDATION_COOCCURRENCE_NEIGHBORS = 20
+# Share of the co-occurrence score in the blended ranking (0 turns it off)
+RECOMMENDATION_COOCCURRENCE_WEIGHT = float(os.getenv('RECOMMENDATION_COOCCURRENCE_WEIGHT', '0.2'))
+# Dotted path to a callable that receives each engine run's stage metrics
+RECOMMENDATION_METRICS_SINK = os.getenv('RECOMMENDATION_METRICS_SINK') or None
+
 # API Keys
 RAWG_API_KEY = os.environ.get('RAWG_API_KEY', '')
@@ -0,0 +1,210 @@
+import bisect
+import logging
+import re
+import threading
+import unicodedata
+from collections import defaultdict
+import numpy as np
+from django.db import connection
+
+from .models import Game
+from .utils.catalog_version import get_catalog_version
+
+
+logger = logging.getLogger(__name__)
+
+# Typo-tolerant matches need this share of the query's trigrams in the title
+MIN_TRIGRAM_SHARE = 0.4
+
+
+def normalize(text):
+    """Lowercase, strip accents and punctuation, and collapse whitespace."""
+    text = unicodedata.normalize('NFKD', text)
+    text = ''.join(char for char in text if not unicodedata.combining(char))
+    return ' '.join(re.findall(r'\w+', text.lower()))
+
+
+def trigrams(text):
+    """Character trigrams of a normalized string, padded so word edges count."""
+    padded = f'  {text} '
+    return {padded[i:i + 3] for i in range(len(padded) - 2)}
+
+
+class TitleIndex:
+    """
+    In-memory autocomplete index over game titles.
+
+    Prefix lookups are binary searches in a sorted array of keys: every
+    title is stored once per word it contains, as the rest of the title
+    from that word on, so "zel" finds "The Legend of Zelda". This does what
+    a trie would with two bisections and no per-node objects. A trigram
+    map scores near misses when too few titles start with the query.
+
+    Titles are ranked by metacritic score; whole-title prefix matches come
+    before matches on a later word, and both before near misses.
+    """
+
+    def __init__(self, version, game_ids, titles, metacritic_scores):
+        self.version = version
+        self.game_ids = game_ids
+        self.titles = titles
+
+        # Position of each title in the ranking, best first
+        normalized = [normalize(title) for title in titles]
+        order = np.lexsort((np.array(normalized, dtype=str), -np.asarray(metacritic_scores, dtype=np.float64)))
+        self.popularity = np.empty(len(titles), dtype=np.int64)
+        self.popularity[order] = np.arange(len(titles))
+
+        keys = []
+        postings = defaultdict(list)
+        for row, name in enumerate(normalized):
+            words = name.split(' ')
+            for start in range(len(words)):
+                keys.append((' '.join(words[start:]), start > 0, row))
+            for trigram in trigrams(name):
+                postings[trigram].append(row)
+        keys.sort()
+
+        self.keys = [key for key, _, _ in keys]
+        self.key_rows = np.array([row for _, _, row in keys], dtype=np.int64)
+        later_word = np.array([later for _, later, _ in keys], dtype=bool)
+        self.key_ranks = later_word * len(titles) + self.popularity[self.key_rows]
+        # A title can match one prefix at most once per word
+        self.max_keys_per_title = max((len(name.split(' ')) for name in normalized), default=1)
+        self.trigrams = {trigram: np.array(rows, dtype=np.int64) for trigram, rows in postings.items()}
+
+    @classmethod
+    def build(cls, version):
+        rows = list(Game.objects.order_by().values_list('id', 'title', 'metacritic_score'))
+        return cls(
+            version,
+            np.array([game_id for game_id, _, _ in rows], dtype=np.int64),
+            [title for _, title, _ in rows],
+            [score if score is not None else -1 for _, _, score in rows],
+        )
+
+    def complete(self, query, limit=10):
+        """
+        Find the titles best matching what has been typed so far.
+
+        Returns:
+            List of (game_id, title) tuples, best first
+        """
+        query = normalize(query)
+        if not query or not len(self.titles) or limit <= 0:
+            return []
+
+        rows = self._prefix_matches(query, limit)
+        if len(rows) < limit:
+            near = self._near_matches(query)
+            rows = np.concatenate([rows, near[~np.isin(near, rows)]])[:limit]
+
+        return [(int(self.game_ids[row]), self.titles[row]) for row in rows]
+
+    def _prefix_matches(self, query, limit):
+        first = bisect.bisect_left(self.keys, query)
+        last = bisect.bisect_left(self.keys, query + '\U0010ffff')
+        if first == last:
+            return np.zeros(0, dtype=np.int64)
+
+        # Only the best few keys can hold the top titles, however short the query
+        ranks = self.key_ranks[first:last]
+        candidates = limit * self.max_keys_per_title
+        if len(ranks) > candidates:
+            order = np.argpartition(ranks, candidates - 1)[:candidates]
+            order = order[np.argsort(ranks[order])]
+        else:
+            order = np.argsort(ranks)
+
+        # A title matching both from its start and on a later word keeps its best rank
+        rows = self.key_rows[first:last][order]
+        _, first_seen = np.unique(rows, return_index=True)
+        return rows[np.sort(first_seen)][:limit]
+
+    def _near_matches(self, query):
+        query_trigrams = [trigram for trigram in trigrams(query) if trigram in self.trigrams]
+        if not query_trigrams:
+            return np.zeros(0, dtype=np.int64)
+
+        shared = np.bincount(
+            np.concatenate([self.trigrams[trigram] for trigram in query_trigrams]), minlength=len(self.titles)
+        )
+        needed = max(2, int(np.ceil(MIN_TRIGRAM_SHARE * len(trigrams(query)))))
+        rows = np.flatnonzero(shared >= needed)
+        return rows[np.lexsort((self.popularity[rows], -shared[rows]))]
+
+
+_index = None
+_index_lock = threading.Lock()
+_rebuilding = False
+_rebuild_lock = threading.Lock()
+
+
+def get_title_index():
+    """
+    Get the worker's title index.
+
+    Checking freshness is a single cache read of the catalog version stamp,
+    so lookups never touch the database. When the catalog changed, the
+    previous index keeps serving while a background thread builds the new
+    one and swaps it in; only a worker that has no index yet builds inline.
+
+    Returns:
+        TitleIndex instance
+    """
+    global _index
+
+    version = get_catalog_version()
+    index = _index
+    if index is None:
+        with _index_lock:
+            if _index is None:
+                _index = TitleIndex.build(version)
+            return _index
+
+    if index.version != version:
+        start_rebuild(version)
+    return index
+
+
+def start_rebuild(version):
+    """Build the index for a catalog version in a background thread, unless a build is running."""
+    global _rebuilding
+
+    with _rebuild_lock:
+        if _rebuilding:
+            return
+        _rebuilding = True
+    threading.Thread(target=_rebuild_in_thread, args=(version,), name='title-index-rebuild', daemon=True).start()
+
+
+def rebuild_title_index(version):
+    """Build the index for a catalog version and swap it in."""
+    global _index, _rebuilding
+
+    try:
+        index = TitleIndex.build(version)
+        with _index_lock:
+            _index = index
+    except Exception as e:
+        logger.exception(f"Error rebuilding the title index: {str(e)}")
+    finally:
+        _rebuilding = False
+
+
+def _rebuild_in_thread(version):
+    try:
+        rebuild_title_index(version)
+    finally:
+        # Database connections are per thread
+        connection.close()
+
+
+def warm_title_index():
+    """Start building the index when a web process starts, so no request waits for it."""
+    start_rebuild(get_catalog_version())
+
+
+def autocomplete(query, limit=10):
+    """Get (game_id, title) suggestions for a partially typed title."""
+    return get_title_index().complete(query, limit)
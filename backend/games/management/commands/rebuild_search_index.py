@@ -0,0 +1,12 @@
+from django.core.management.base import BaseCommand
+from django.db import connection
+
+from games.search import install_search_index
+
+
+class Command(BaseCommand):
+    help = 'Recreate the full-text search index of the games table and its triggers'
+
+    def handle(self, *args, **options):
+        install_search_index(connection)
+        self.stdout.write(self.style.SUCCESS(f"Rebuilt the {connection.vendor} game search index"))
@@ -0,0 +1,27 @@
+from django.db import migrations
+
+
+def install_search_index(apps, schema_editor):
+    from games.search import install_search_index
+    install_search_index(schema_editor.connection)
+
+
+def uninstall_search_index(apps, schema_editor):
+    from games.search import uninstall_search_index
+    uninstall_search_index(schema_editor.connection)
+
+
+class Migration(migrations.Migration):
+    """
+    Full-text index over game titles, publishers, developers and descriptions:
+    a tsvector column with a GIN index on PostgreSQL, an FTS5 table on SQLite.
+    Neither is part of the model state; triggers keep them current on save.
+    """
+
+    dependencies = [
+        ('games', '0002_gameimage_game_cached_image'),
+    ]
+
+    operations = [
+        migrations.RunPython(install_search_index, uninstall_search_index),
+    ]
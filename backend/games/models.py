@@ -1,4 +1,8 @@
 from django.db import models
+from django.db.models.signals import post_save, post_delete, m2m_changed
+from django.dispatch import receiver
+
+from .utils.catalog_version import bump_catalog_version
 
 # Create your models here.
 
@@ -64,6 +68,19 @@ class GameImage(models.Model):
             return "https://via.placeholder.com/300x400?text=No+Game+Image"
 
 
+class GameQuerySet(models.QuerySet):
+    def for_list(self):
+        """
+        Load everything GameListSerializer reads up front.
+        
+        Genres and platforms are fetched with one query each for all rows,
+        so serializing a list costs the same few queries however long it is.
+        Related lists (recommendations, ratings) prefetch their games with
+        Prefetch('game', queryset=Game.objects.for_list()).
+        """
+        return self.select_related('cached_image').prefetch_related('genres', 'platforms')
+
+
 class Game(models.Model):
     """Game model for storing game information."""
     title = models.CharField(max_length=255)
@@ -95,6 +112,8 @@ class Game(models.Model):
     source_name = models.CharField(max_length=100, blank=True)  # Name of the source (e.g., "Steam", "IGN")
     last_updated = models.DateTimeField(auto_now=True)
     
+    objects = GameQuerySet.as_manager()
+    
     def __str__(self):
         return self.title
     
@@ -120,3 +139,30 @@ class GameReview(models.Model):
     
     def __str__(self):
         return f"{self.source} review for {self.game.title}"
+
+
+# Fields whose changes do not affect any derived catalog data (images only)
+IMAGE_ONLY_FIELDS = {'image_url', 'cached_image', 'last_updated'}
+
+
+@receiver([post_save, post_delete], sender=Game)
+def game_changed(sender, instance, update_fields=None, **kwargs):
+    """Bump the catalog version when a game is created, updated or deleted."""
+    if update_fields and set(update_fields) <= IMAGE_ONLY_FIELDS:
+        return
+    bump_catalog_version()
+
+
+@receiver([post_save, post_delete], sender=Genre)
+@receiver([post_save, post_delete], sender=Platform)
+def catalog_taxonomy_changed(sender, instance, **kwargs):
+    """Bump the catalog version when a genre or platform changes."""
+    bump_catalog_version()
+
+
+@receiver(m2m_changed, sender=Game.genres.through)
+@receiver(m2m_changed, sender=Game.platforms.through)
+def game_relations_changed(sender, instance, action, **kwargs):
+    """Bump the catalog version when a game's genres or platforms change."""
+    if action in ('post_add', 'post_remove', 'post_clear'):
+        bump_catalog_version()
@@ -0,0 +1,227 @@
+import re
+from django.db import connection, connections
+from django.db.models import BooleanField, FloatField, Q
+from django.db.models.expressions import RawSQL
+
+from .models import Game
+
+
+# Share of the metacritic score (scaled to 0-1) in the blended search score
+METACRITIC_WEIGHT = 0.2
+
+# PostgreSQL: a weighted tsvector column on games_game, kept current by a trigger
+POSTGRESQL_INSTALL = [
+    "ALTER TABLE games_game ADD COLUMN IF NOT EXISTS search_vector tsvector",
+    "CREATE INDEX IF NOT EXISTS games_game_search_vector_idx ON games_game USING gin (search_vector)",
+    """
+    CREATE OR REPLACE FUNCTION games_game_search_vector_update() RETURNS trigger AS $$
+    BEGIN
+        NEW.search_vector :=
+            setweight(to_tsvector('english', coalesce(NEW.title, '')), 'A') ||
+            setweight(to_tsvector('english', coalesce(NEW.publisher, '') || ' ' || coalesce(NEW.developer, '')), 'B') ||
+            setweight(to_tsvector('english', coalesce(NEW.description, '')), 'C');
+        RETURN NEW;
+    END
+    $$ LANGUAGE plpgsql
+    """,
+    "DROP TRIGGER IF EXISTS games_game_search_vector_trigger ON games_game",
+    """
+    CREATE TRIGGER games_game_search_vector_trigger
+    BEFORE INSERT OR UPDATE OF title, publisher, developer, description ON games_game
+    FOR EACH ROW EXECUTE FUNCTION games_game_search_vector_update()
+    """,
+    # Fires the trigger once for every existing row
+    "UPDATE games_game SET title = title",
+]
+
+POSTGRESQL_UNINSTALL = [
+    "DROP TRIGGER IF EXISTS games_game_search_vector_trigger ON games_game",
+    "DROP FUNCTION IF EXISTS games_game_search_vector_update()",
+    "DROP INDEX IF EXISTS games_game_search_vector_idx",
+    "ALTER TABLE games_game DROP COLUMN IF EXISTS search_vector",
+]
+
+# SQLite: an FTS5 shadow table over games_game, kept current by triggers
+SQLITE_INSTALL = [
+    """
+    CREATE VIRTUAL TABLE IF NOT EXISTS games_game_fts USING fts5(
+        title, publisher, developer, description,
+        content='games_game', content_rowid='id', tokenize='porter unicode61'
+    )
+    """,
+    """
+    CREATE TRIGGER IF NOT EXISTS games_game_fts_insert AFTER INSERT ON games_game BEGIN
+        INSERT INTO games_game_fts(rowid, title, publisher, developer, description)
+        VALUES (new.id, new.title, new.publisher, new.developer, new.description);
+    END
+    """,
+    """
+    CREATE TRIGGER IF NOT EXISTS games_game_fts_delete AFTER DELETE ON games_game BEGIN
+        INSERT INTO games_game_fts(games_game_fts, rowid, title, publisher, developer, description)
+        VALUES ('delete', old.id, old.title, old.publisher, old.developer, old.description);
+    END
+    """,
+    """
+    CREATE TRIGGER IF NOT EXISTS games_game_fts_update
+    AFTER UPDATE OF title, publisher, developer, description ON games_game BEGIN
+        INSERT INTO games_game_fts(games_game_fts, rowid, title, publisher, developer, description)
+        VALUES ('delete', old.id, old.title, old.publisher, old.developer, old.description);
+        INSERT INTO games_game_fts(rowid, title, publisher, developer, description)
+        VALUES (new.id, new.title, new.publisher, new.developer, new.description);
+    END
+    """,
+    "INSERT INTO games_game_fts(games_game_fts) VALUES ('rebuild')",
+]
+
+# Objects that must exist for the index to stay current
+POSTGRESQL_INSTALLED = (
+    "SELECT count(*) = 1 FROM pg_trigger WHERE tgname = 'games_game_search_vector_trigger' AND NOT tgisinternal"
+)
+SQLITE_INSTALLED = """
+    SELECT count(*) = 4 FROM sqlite_master
+    WHERE name IN ('games_game_fts', 'games_game_fts_insert', 'games_game_fts_delete', 'games_game_fts_update')
+"""
+
+SQLITE_UNINSTALL = [
+    "DROP TRIGGER IF EXISTS games_game_fts_insert",
+    "DROP TRIGGER IF EXISTS games_game_fts_delete",
+    "DROP TRIGGER IF EXISTS games_game_fts_update",
+    "DROP TABLE IF EXISTS games_game_fts",
+]
+
+
+def install_search_index(connection):
+    """
+    Create (or repair) the full-text index of the games table and fill it.
+
+    Safe to run again: on SQLite, Django rebuilds a table to alter it and
+    drops its triggers along the way, so ensure_search_index re-runs this
+    after such migrations.
+    """
+    statements = {'postgresql': POSTGRESQL_INSTALL, 'sqlite': SQLITE_INSTALL}.get(connection.vendor, [])
+    with connection.cursor() as cursor:
+        for statement in statements:
+            cursor.execute(statement)
+
+
+def search_index_installed(connection):
+    """Whether the full-text index and the triggers keeping it current all exist."""
+    query = {'postgresql': POSTGRESQL_INSTALLED, 'sqlite': SQLITE_INSTALLED}.get(connection.vendor)
+    if query is None:
+        return True
+    with connection.cursor() as cursor:
+        cursor.execute(query)
+        return bool(cursor.fetchone()[0])
+
+
+def ensure_search_index(sender, using='default', **kwargs):
+    """post_migrate receiver reinstalling the index when a migration dropped part of it."""
+    connection = connections[using]
+    if 'games_game' not in connection.introspection.table_names():
+        return
+    if not search_index_installed(connection):
+        install_search_index(connection)
+
+
+def uninstall_search_index(connection):
+    statements = {'postgresql': POSTGRESQL_UNINSTALL, 'sqlite': SQLITE_UNINSTALL}.get(connection.vendor, [])
+    with connection.cursor() as cursor:
+        for statement in statements:
+            cursor.execute(statement)
+
+
+def search_terms(query):
+    """Split a search string into words; the last one may be incomplete."""
+    return re.findall(r'\w+', query.lower())
+
+
+def search_games(queryset, query, limit=20):
+    """
+    Find the games of a queryset matching a search string, best first.
+
+    Every word must match (the last one as a prefix) in the title, publisher,
+    developer or description. Matches are ranked by text relevance, title
+    hits weighing most, blended with the metacritic score. A query made only
+    of stopwords, which PostgreSQL's parser drops, falls back to LIKE.
+
+    Args:
+        queryset: Game queryset with any filters already applied
+        query: Search string as typed by the user
+        limit: Maximum number of games
+
+    Returns:
+        List of Game instances
+    """
+    terms = search_terms(query)
+    if not terms:
+        return []
+
+    if connection.vendor == 'postgresql':
+        return _search_postgresql(queryset, terms, limit)
+    if connection.vendor == 'sqlite':
+        return _search_sqlite(queryset, terms, limit)
+
+    # No full-text index on other databases
+    return _search_like(queryset, terms, limit)
+
+
+def _search_like(queryset, terms, limit):
+    """Scan with LIKE, best metacritic score first."""
+    search_query = Q()
+    for term in terms:
+        search_query &= (
+            Q(title__icontains=term) | Q(description__icontains=term) |
+            Q(publisher__icontains=term) | Q(developer__icontains=term)
+        )
+    return list(queryset.filter(search_query).order_by('-metacritic_score', 'id')[:limit])
+
+
+def _search_postgresql(queryset, terms, limit):
+    tsquery = ' & '.join(terms[:-1] + [f'{terms[-1]}:*'])
+    # Stopwords are dropped while parsing, and an empty tsquery matches nothing
+    with connection.cursor() as cursor:
+        cursor.execute("SELECT numnode(to_tsquery('english', %s))", [tsquery])
+        if not cursor.fetchone()[0]:
+            return _search_like(queryset, terms, limit)
+
+    score = (
+        f"(1 - {METACRITIC_WEIGHT}) * ts_rank_cd(games_game.search_vector, to_tsquery('english', %s), 32)"
+        f" + {METACRITIC_WEIGHT} * coalesce(games_game.metacritic_score, 0) / 100.0"
+    )
+    return list(
+        queryset
+        .annotate(
+            search_match=RawSQL(
+                "games_game.search_vector @@ to_tsquery('english', %s)", [tsquery], output_field=BooleanField()
+            ),
+            search_score=RawSQL(score, [tsquery], output_field=FloatField()),
+        )
+        .filter(search_match=True)
+        .order_by('-search_score', 'id')[:limit]
+    )
+
+
+def _search_sqlite(queryset, terms, limit):
+    match = ' '.join([f'"{term}"' for term in terms[:-1]] + [f'"{terms[-1]}"*'])
+    # Correlated with each match, so filters cost one lookup per match instead of a scan
+    filtered = queryset.order_by().filter(pk=RawSQL('games_game_fts.rowid', [])).values('id')
+    filtered_sql, filtered_params = filtered.query.sql_with_params()
+
+    # bm25 is negative, lower is better; r / (1 + r) maps it onto 0-1
+    sql = f"""
+        SELECT game.id,
+               (1 - {METACRITIC_WEIGHT}) * (-bm25(games_game_fts, 10.0, 4.0, 4.0, 1.0)
+                   / (1 - bm25(games_game_fts, 10.0, 4.0, 4.0, 1.0)))
+               + {METACRITIC_WEIGHT} * coalesce(game.metacritic_score, 0) / 100.0 AS score
+        FROM games_game_fts
+        JOIN games_game AS game ON game.id = games_game_fts.rowid
+        WHERE games_game_fts MATCH %s AND EXISTS ({filtered_sql})
+        ORDER BY score DESC, game.id
+        LIMIT %s
+    """
+    with connection.cursor() as cursor:
+        cursor.execute(sql, [match, *filtered_params, limit])
+        ranked_ids = [row[0] for row in cursor.fetchall()]
+
+    games = Game.objects.for_list().in_bulk(ranked_ids)
+    return [games[game_id] for game_id in ranked_ids if game_id in games]
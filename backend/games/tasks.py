@@ -1,9 +1,50 @@
 from celery import shared_task
 import logging
-from games.utils.image_cache import verify_all_game_images
+from django.core.cache import cache
+from games.models import Game
+from games.utils.image_cache import cache_game_image, verify_all_game_images
 
 logger = logging.getLogger(__name__)
 
+# How long a game stays marked as being warmed up if its task never finishes
+IMAGE_WARMUP_TIMEOUT = 60 * 10
+
+
+def image_warmup_key(game_id):
+    return f'games:image-warmup:{game_id}'
+
+
+def schedule_image_warmup(game_ids):
+    """
+    Enqueue a background warm-up of the images of some games.
+    
+    Each game is marked as in flight until its warm-up finishes, so
+    concurrent requests listing the same games do not enqueue them again.
+    
+    Args:
+        game_ids: IDs of the games without a cached image
+    
+    Returns:
+        list: IDs of the games that were enqueued
+    """
+    keys = {image_warmup_key(game_id): game_id for game_id in game_ids}
+    in_flight = cache.get_many(keys)
+    claimed = [
+        game_id for key, game_id in keys.items()
+        if key not in in_flight and cache.add(key, True, timeout=IMAGE_WARMUP_TIMEOUT)
+    ]
+    if not claimed:
+        return []
+    
+    try:
+        warm_game_images.delay(claimed)
+    except Exception as e:
+        logger.error(f"Error enqueuing image warm-up: {str(e)}")
+        cache.delete_many([image_warmup_key(game_id) for game_id in claimed])
+        return []
+    
+    return claimed
+
 @shared_task
 def cache_game_images(batch_size=20, limit=None):
     """
@@ -27,4 +68,34 @@ def cache_game_images(batch_size=20, limit=None):
         return summary
     except Exception as e:
         logger.error(f"Error in game image caching task: {str(e)}")
-        return f"Error: {str(e)}" 
\ No newline at end of file
+        return f"Error: {str(e)}"
+
+
+@shared_task
+def warm_game_images(game_ids):
+    """
+    Celery task to cache the images of games listed without one.
+    
+    Args:
+        game_ids: IDs of the games claimed by schedule_image_warmup
+    
+    Returns:
+        str: Summary of the warm-up
+    """
+    success_count = 0
+    try:
+        for game in Game.objects.filter(id__in=game_ids).select_related('cached_image'):
+            try:
+                if cache_game_image(game):
+                    success_count += 1
+            except Exception as e:
+                logger.error(f"Error caching image for game {game.id}: {str(e)}")
+            finally:
+                cache.delete(image_warmup_key(game.id))
+        
+        summary = f"Image warm-up completed. Success: {success_count}, Failure: {len(game_ids) - success_count}"
+        logger.info(summary)
+        return summary
+    finally:
+        # Games deleted in the meantime must not stay marked either
+        cache.delete_many([image_warmup_key(game_id) for game_id in game_ids])
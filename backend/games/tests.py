@@ -1,3 +1,237 @@
+from unittest import mock
+
+from django.apps import apps
+from django.contrib.auth.models import User
+from django.core.cache import cache
+from django.db import connection
 from django.test import TestCase
+from django.test.utils import CaptureQueriesContext
+from redis.exceptions import ConnectionError as RedisConnectionError
+
+from users.models import GameRating
+from .autocomplete import autocomplete, rebuild_title_index
+from .models import Game, GameImage, Genre, Platform
+from .search import ensure_search_index, search_index_installed
+from .tasks import image_warmup_key, warm_game_images
+from .utils.catalog_version import get_catalog_version
+
+
+class TopRatedTestCase(TestCase):
+    """Tests for the image-tiered top_rated endpoint."""
+
+    def setUp(self):
+        cache.clear()
+        verified = GameImage.objects.create(identifier='verified', primary_url='https://img.test/v.jpg', is_verified=True)
+        unverified = GameImage.objects.create(identifier='unverified', backup_url1='https://img.test/u.jpg')
+
+        self.no_image = Game.objects.create(title="No Image", metacritic_score=99)
+        self.uncached = Game.objects.create(title="Uncached", metacritic_score=98, image_url='https://img.test/a.jpg')
+        self.unverified = Game.objects.create(title="Unverified", metacritic_score=97, cached_image=unverified)
+        self.verified_low = Game.objects.create(title="Verified Low", metacritic_score=70, cached_image=verified)
+        self.verified_high = Game.objects.create(title="Verified High", metacritic_score=90, cached_image=verified)
+        Game.objects.create(title="Unscored", cached_image=verified)
+
+    def test_games_are_ordered_by_image_tier_then_score(self):
+        with mock.patch('games.tasks.warm_game_images.delay'):
+            response = self.client.get('/api/games/top_rated/')
+
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual([game['id'] for game in response.json()], [
+            self.verified_high.id, self.verified_low.id, self.unverified.id, self.uncached.id, self.no_image.id,
+        ])
+
+    def test_limit_is_applied_in_the_database(self):
+        with mock.patch('games.tasks.warm_game_images.delay'), \
+                self.assertNumQueries(3) as queries:
+            response = self.client.get('/api/games/top_rated/?limit=3')
+
+        self.assertEqual(len(response.json()), 3)
+        games_query = queries.captured_queries[0]['sql']
+        self.assertIn('LIMIT 3', games_query)
+        self.assertNotIn('description', games_query)
+
+    def test_limit_is_clamped(self):
+        with mock.patch('games.tasks.warm_game_images.delay'):
+            self.assertEqual(len(self.client.get('/api/games/top_rated/?limit=-1').json()), 1)
+            self.assertEqual(len(self.client.get('/api/games/top_rated/?limit=0').json()), 1)
+
+    def test_missing_images_are_warmed_up_once_in_the_background(self):
+        with mock.patch('games.tasks.warm_game_images.delay') as delay, \
+                mock.patch('games.tasks.cache_game_image') as cache_game_image:
+            self.client.get('/api/games/top_rated/')
+            self.client.get('/api/games/top_rated/')
+
+            # Nothing is fetched inside the request, and in-flight games are not enqueued twice
+            cache_game_image.assert_not_called()
+            delay.assert_called_once_with([self.uncached.id, self.no_image.id])
+            self.assertTrue(cache.get(image_warmup_key(self.uncached.id)))
+
+            warm_game_images(*delay.call_args.args)
+            self.assertEqual(cache_game_image.call_count, 2)
+            self.assertIsNone(cache.get(image_warmup_key(self.uncached.id)))
+
+            self.client.get('/api/games/top_rated/')
+            self.assertEqual(delay.call_count, 2)
+
+
+class ListQueryCountTestCase(TestCase):
+    """Tests that game lists are serialized in a constant number of queries."""
+
+    def setUp(self):
+        cache.clear()
+        self.genres = [Genre.objects.create(name=name) for name in ["Action", "Puzzle"]]
+        self.platforms = [Platform.objects.create(name=name) for name in ["PC", "Switch"]]
+        self.user = User.objects.create_user(username='player', password='secret')
+        self.client.force_login(self.user)
+        self.add_games(2)
+
+    def add_games(self, count):
+        for _ in range(count):
+            number = Game.objects.count()
+            image = GameImage.objects.create(identifier=f'game-{number}', primary_url='https://img.test/g.jpg')
+            game = Game.objects.create(
+                title=f"Game {number}", metacritic_score=80, release_date='2020-01-01', cached_image=image
+            )
+            game.genres.set(self.genres)
+            game.platforms.set(self.platforms)
+            GameRating.objects.create(user_profile=self.user.profile, game=game, rating=7)
+
+    def count_queries(self, url):
+        with CaptureQueriesContext(connection) as queries:
+            response = self.client.get(url)
+        self.assertEqual(response.status_code, 200)
+        return len(queries)
+
+    def test_query_count_does_not_grow_with_rows(self):
+        urls = [
+            '/api/games/', '/api/games/search/?q=Game', '/api/games/recent/', '/api/games/top_rated/',
+            '/api/profile/', '/api/profile/game_ratings/',
+        ]
+        few = {url: self.count_queries(url) for url in urls}
+        self.add_games(6)
+        many = {url: self.count_queries(url) for url in urls}
+
+        self.assertEqual(many, few)
+        self.assertEqual(len(self.client.get('/api/games/recent/').json()), 8)
+
+
+class SearchTestCase(TestCase):
+    """Tests for the full-text game search."""
+
+    def setUp(self):
+        self.action = Genre.objects.create(name="Action")
+        self.title_hit = Game.objects.create(title="Dragon Quest", metacritic_score=70)
+        self.description_hit = Game.objects.create(
+            title="Knights", description="Fight a dragon in a castle.", metacritic_score=95
+        )
+        self.other = Game.objects.create(title="Tetris", description="Falling blocks.", developer="Dragonfly")
+        self.title_hit.genres.add(self.action)
+        self.other.genres.add(self.action)
+        for i in range(20):
+            Game.objects.create(title=f"Racer {i}", description="Drive fast cars.", metacritic_score=99)
+
+    def search(self, query, **params):
+        with CaptureQueriesContext(connection) as queries:
+            response = self.client.get('/api/games/search/', {'q': query, **params})
+        self.assertEqual(response.status_code, 200)
+        self.assertFalse(any('LIKE' in query['sql'] for query in queries))
+        return [game['id'] for game in response.json()['results']]
+
+    def test_results_are_ranked_by_relevance(self):
+        # A title match outranks a description match with a better metacritic score
+        self.assertEqual(self.search("dragon castle"), [self.description_hit.id])
+        # The last word matches as a prefix, other words by their stem
+        self.assertEqual(self.search("dragon"), [self.title_hit.id, self.description_hit.id, self.other.id])
+        self.assertEqual(self.search("fighting drag"), [self.description_hit.id])
+        self.assertEqual(self.search("drag", genre=self.action.id), [self.title_hit.id, self.other.id])
+        self.assertEqual(self.search("?!"), [])
+
+    def test_index_follows_saves_and_deletes(self):
+        self.other.description = "Stack blocks to clear a dragon from the board."
+        self.other.save()
+        self.title_hit.delete()
+
+        self.assertEqual(self.search("dragons board"), [self.other.id])
+        self.assertEqual(self.search("quest"), [])
+        self.assertEqual(self.search("falling"), [])
+
+    def test_index_is_repaired_after_migrations(self):
+        # Altering the table on SQLite recreates it without the triggers
+        with connection.cursor() as cursor:
+            cursor.execute("DROP TRIGGER games_game_fts_update")
+        self.assertFalse(search_index_installed(connection))
+
+        ensure_search_index(sender=apps.get_app_config('games'), using=connection.alias)
+
+        self.assertTrue(search_index_installed(connection))
+        self.other.title = "Dragon Tetris"
+        self.other.save()
+        self.assertEqual(self.search("tetris"), [self.other.id])
+
+
+class AutocompleteTestCase(TestCase):
+    """Tests for the in-memory title autocomplete."""
+
+    def setUp(self):
+        cache.clear()
+        # Start without an index, so the first lookup builds it inline
+        index = mock.patch('games.autocomplete._index', None)
+        index.start()
+        self.addCleanup(index.stop)
+        self.zelda = Game.objects.create(title="The Legend of Zelda: Breath of the Wild", metacritic_score=97)
+        self.zelda_classic = Game.objects.create(title="Zelda II", metacritic_score=73)
+        self.pokemon = Game.objects.create(title="Pokémon Red", metacritic_score=89)
+        self.portal = Game.objects.create(title="Portal 2", metacritic_score=95)
+
+    def suggest(self, query, **params):
+        response = self.client.get('/api/games/autocomplete/', {'q': query, **params})
+        self.assertEqual(response.status_code, 200)
+        return [game['id'] for game in response.json()['results']]
+
+    def test_prefixes_typos_and_ranking(self):
+        # Whole-title prefixes first, then titles with a later word matching
+        self.assertEqual(self.suggest("zel"), [self.zelda_classic.id, self.zelda.id])
+        self.assertEqual(self.suggest("legend of z"), [self.zelda.id])
+        self.assertEqual(self.suggest("po"), [self.portal.id, self.pokemon.id])
+        self.assertEqual(self.suggest("po", limit=1), [self.portal.id])
+        self.assertEqual(self.suggest("POKEMON r"), [self.pokemon.id])
+        # Near misses are suggested once no title starts with the query
+        self.assertEqual(self.suggest("protal")[:1], [self.portal.id])
+        self.assertEqual(self.suggest("xyz"), [])
+        self.assertEqual(self.suggest(""), [])
+
+    def test_non_positive_limit(self):
+        self.assertEqual(self.suggest("zel", limit=-3), [self.zelda_classic.id])
+        self.assertEqual(self.suggest("zel", limit=0), [self.zelda_classic.id])
+        self.assertEqual(autocomplete("zel", limit=-3), [])
+
+    def test_lookups_skip_the_database_until_the_catalog_changes(self):
+        self.suggest("zel")
+        with self.assertNumQueries(0):
+            self.assertEqual(self.suggest("zel"), [self.zelda_classic.id, self.zelda.id])
+
+        # After a catalog change the previous index keeps serving until the new one is swapped in
+        added = Game.objects.create(title="Zelda's Adventure", metacritic_score=40)
+        with mock.patch('games.autocomplete.start_rebuild') as start_rebuild, self.assertNumQueries(0):
+            self.assertEqual(self.suggest("zel"), [self.zelda_classic.id, self.zelda.id])
+            self.assertEqual(self.suggest("zel"), [self.zelda_classic.id, self.zelda.id])
+        self.assertEqual(start_rebuild.call_count, 2)
+
+        rebuild_title_index(*start_rebuild.call_args.args)
+        self.assertEqual(self.suggest("zel"), [self.zelda_classic.id, added.id, self.zelda.id])
+
+
+class CatalogVersionTestCase(TestCase):
+    """Tests for the shared catalog version stamp."""
+
+    def test_catalog_writes_survive_an_unreachable_cache(self):
+        error = RedisConnectionError("Error 111 connecting to localhost:6379. Connection refused.")
+        with mock.patch.object(cache, 'incr', side_effect=error), \
+                mock.patch.object(cache, 'get', side_effect=error):
+            before = get_catalog_version()
+            game = Game.objects.create(title="Offline")
+            game.genres.add(Genre.objects.create(name="Action"))
 
-# Create your tests here.
+            # This process still sees its own change
+            self.assertNotEqual(get_catalog_version(), before)
+        self.assertEqual(list(game.genres.values_list('name', flat=True)), ["Action"])
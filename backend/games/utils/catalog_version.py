@@ -0,0 +1,70 @@
+import logging
+import time
+from django.core.cache import cache
+from redis.exceptions import RedisError
+
+logger = logging.getLogger(__name__)
+
+CATALOG_VERSION_KEY = 'games:catalog_version'
+
+# Errors of an unreachable cache server; catalog writes must not fail on them
+CACHE_ERRORS = (RedisError, OSError)
+
+# Version used by this process while the shared cache is unreachable
+_local_version = time.time_ns()
+
+
+def get_catalog_version():
+    """
+    Get the current catalog version stamp.
+
+    The stamp lives in the shared cache so every web and Celery process sees
+    the same value. It is seeded from the clock, so a flushed cache never
+    hands out a version number that a worker has already built against.
+    While the cache is unreachable, a process-local stamp is used instead.
+
+    Returns:
+        int: The current catalog version
+    """
+    try:
+        version = cache.get(CATALOG_VERSION_KEY)
+        if version is None:
+            cache.add(CATALOG_VERSION_KEY, time.time_ns(), timeout=None)
+            version = cache.get(CATALOG_VERSION_KEY)
+    except CACHE_ERRORS as e:
+        logger.warning(f"Catalog version unavailable, using the local one: {str(e)}")
+        return _local_version
+    return version
+
+
+def bump_catalog_version():
+    """
+    Mark the catalog as changed so in-process copies get rebuilt lazily.
+
+    Never raises on cache errors: the catalog row is already saved, so only
+    this process's local stamp moves and a warning is logged.
+
+    Returns:
+        int: The new catalog version
+    """
+    global _local_version
+
+    try:
+        return cache.incr(CATALOG_VERSION_KEY)
+    except ValueError:
+        pass
+    except CACHE_ERRORS as e:
+        _local_version = time.time_ns()
+        logger.warning(f"Could not bump the shared catalog version: {str(e)}")
+        return _local_version
+
+    # Key was never set or has been evicted, start a fresh version
+    version = time.time_ns()
+    try:
+        cache.set(CATALOG_VERSION_KEY, version, timeout=None)
+    except CACHE_ERRORS as e:
+        _local_version = version
+        logger.warning(f"Could not reset the shared catalog version: {str(e)}")
+        return version
+    logger.debug(f"Catalog version reset to {version}")
+    return version
@@ -3,15 +3,23 @@ from rest_framework import viewsets, permissions, filters
 from rest_framework.decorators import action
 from rest_framework.response import Response
 from django_filters.rest_framework import DjangoFilterBackend
-from django.db.models import Q
+from django.db.models import Case, IntegerField, Q, Value, When
 
 from .models import Game, Genre, Platform
+from .search import search_games
 from .serializers import (
     GameListSerializer, GameDetailSerializer,
     GenreSerializer, PlatformSerializer
 )
 
 
+# Game columns read by GameListSerializer (cached_image is followed by Game.objects.for_list)
+LIST_FIELDS = [
+    'id', 'title', 'release_date', 'publisher', 'developer', 'rating',
+    'metacritic_score', 'user_score', 'image_url', 'cached_image',
+]
+
+
 class GenreViewSet(viewsets.ReadOnlyModelViewSet):
     """API endpoint for game genres."""
     queryset = Genre.objects.all()
@@ -28,7 +36,7 @@ class PlatformViewSet(viewsets.ReadOnlyModelViewSet):
 
 class GameViewSet(viewsets.ReadOnlyModelViewSet):
     """API endpoint for games."""
-    queryset = Game.objects.all()
+    queryset = Game.objects.for_list()
     permission_classes = [permissions.AllowAny]
     filter_backends = [DjangoFilterBackend, filters.SearchFilter, filters.OrderingFilter]
     filterset_fields = ['genres', 'platforms', 'is_multiplayer', 'is_free_to_play']
@@ -51,19 +59,13 @@ class GameViewSet(viewsets.ReadOnlyModelViewSet):
         if not query:
             return Response({'results': []})
         
-        # Create a complex query with Q objects
-        search_query = Q(title__icontains=query) | \
-                      Q(description__icontains=query) | \
-                      Q(publisher__icontains=query) | \
-                      Q(developer__icontains=query)
-        
         # Apply filters from query params
         genre_id = request.query_params.get('genre')
         platform_id = request.query_params.get('platform')
         multiplayer = request.query_params.get('multiplayer')
         free_to_play = request.query_params.get('free_to_play')
         
-        queryset = self.get_queryset().filter(search_query)
+        queryset = self.get_queryset()
         
         if genre_id:
             queryset = queryset.filter(genres__id=genre_id)
@@ -79,12 +81,30 @@ class GameViewSet(viewsets.ReadOnlyModelViewSet):
             free_bool = free_to_play.lower() == 'true'
             queryset = queryset.filter(is_free_to_play=free_bool)
         
-        # Limit to 20 results for performance
-        queryset = queryset[:20]
+        # Ranked by the full-text index, limited to 20 results for performance
+        results = search_games(queryset, query, limit=20)
         
-        serializer = GameListSerializer(queryset, many=True)
+        serializer = GameListSerializer(results, many=True)
         return Response({'results': serializer.data})
     
+    @action(detail=False, methods=['get'], permission_classes=[permissions.AllowAny], authentication_classes=[])
+    def autocomplete(self, request):
+        """
+        Suggest game titles for a partially typed query.
+        
+        Served from an in-process title index, without authentication or any
+        database query, so it can run on every keystroke.
+        """
+        from .autocomplete import autocomplete
+        
+        try:
+            limit = max(1, min(int(request.query_params.get('limit', '10')), 20))
+        except ValueError:
+            limit = 10
+        
+        suggestions = autocomplete(request.query_params.get('q', ''), limit)
+        return Response({'results': [{'id': game_id, 'title': title} for game_id, title in suggestions]})
+    
     @action(detail=False, methods=['get'], permission_classes=[permissions.AllowAny])
     def top_rated(self, request):
         """Get top rated games."""
@@ -92,68 +112,100 @@ class GameViewSet(viewsets.ReadOnlyModelViewSet):
         limit_param = request.query_params.get('limit', '50')
         try:
             limit = int(limit_param)
-            # Cap at 100 for performance
-            limit = min(limit, 100)
+            # Cap at 100 for performance; negative slices are not allowed
+            limit = max(1, min(limit, 100))
         except ValueError:
             limit = 50
         
         print(f"API: Requesting top {limit} rated games")
         
-        # Get games with metacritic scores, sorted by score descending
-        base_queryset = self.get_queryset().exclude(metacritic_score__isnull=True).order_by('-metacritic_score')
-        
-        # Count total qualifying games
-        total_qualifying = base_queryset.count()
-        print(f"API: Found {total_qualifying} qualifying games with metacritic scores")
-        
-        # Force evaluation to a list to avoid query issues
-        all_qualifying_games = list(base_queryset)
-        
-        # Sort the games so that those with verified cached images are first
-        games_with_verified_images = [g for g in all_qualifying_games if g.cached_image and g.cached_image.is_verified]
-        games_with_unverified_images = [g for g in all_qualifying_games if g.cached_image and not g.cached_image.is_verified]
-        games_with_uncached_images = [g for g in all_qualifying_games if g.image_url and not g.cached_image]
-        games_without_images = [g for g in all_qualifying_games if not g.image_url and not g.cached_image]
-        
-        # Build the result list in priority order, respecting the limit
-        result_list = []
-        result_list.extend(games_with_verified_images[:limit])
-        
-        # If we need more games, add those with unverified cached images
-        if len(result_list) < limit:
-            remaining = limit - len(result_list)
-            result_list.extend(games_with_unverified_images[:remaining])
-        
-        # If we need more games, add those with uncached images
-        if len(result_list) < limit:
-            remaining = limit - len(result_list)
-            result_list.extend(games_with_uncached_images[:remaining])
-        
-        # If we need more games, add those without images
-        if len(result_list) < limit:
-            remaining = limit - len(result_list)
-            result_list.extend(games_without_images[:remaining])
+        # Games with verified cached images come first, then unverified cached
+        # images, then uncached image URLs, then games without any image;
+        # the tier is computed and sorted in SQL so only `limit` rows are read
+        image_tier = Case(
+            When(cached_image__is_verified=True, then=Value(0)),
+            When(cached_image__isnull=False, then=Value(1)),
+            When(~Q(image_url=''), then=Value(2)),
+            default=Value(3),
+            output_field=IntegerField(),
+        )
+        queryset = (
+            self.get_queryset()
+            .exclude(metacritic_score__isnull=True)
+            .only(*LIST_FIELDS)
+            .annotate(image_tier=image_tier)
+            .order_by('image_tier', '-metacritic_score', 'id')
+        )
+        result_list = list(queryset[:limit])
         
         final_count = len(result_list)
         print(f"API: Returning {final_count} total games")
         
-        # Cache images for games without cached images - in a background process if possible
-        uncached_games = [g for g in result_list if not g.cached_image]
-        if uncached_games:
-            print(f"API: Found {len(uncached_games)} games without cached images - scheduling caching")
-            try:
-                from games.utils.image_cache import cache_game_image
-                for game in uncached_games[:10]:  # Limit to 10 to avoid blocking the API
-                    cache_game_image(game)
-            except Exception as e:
-                print(f"API: Error caching images: {e}")
+        # Cache images for games without cached images in the background, so
+        # the response never waits on image hosts
+        uncached_ids = [g.id for g in result_list if not g.cached_image_id]
+        if uncached_ids:
+            from games.tasks import schedule_image_warmup
+            scheduled = schedule_image_warmup(uncached_ids)
+            print(f"API: Found {len(uncached_ids)} games without cached images - scheduled {len(scheduled)} for caching")
         
         serializer = GameListSerializer(result_list, many=True)
         return Response(serializer.data)
     
+    @action(detail=True, methods=['get'])
+    def similar(self, request, pk=None):
+        """Get the games most similar to this one from the precomputed neighbor index."""
+        from recommendations.similarity import get_similarity_index
+        
+        game = self.get_object()
+        index = get_similarity_index()
+        if index is None:
+            return Response([])
+        return _neighbor_response(game.id, index.similar_games, request.query_params.get('limit'))
+    
+    @action(detail=True, methods=['get'])
+    def similar_descriptions(self, request, pk=None):
+        """Get the games whose descriptions read most like this one's."""
+        from recommendations.descriptions import get_description_index
+        
+        game = self.get_object()
+        index = get_description_index()
+        if index is None:
+            return Response([])
+        return _neighbor_response(game.id, index.similar_games, request.query_params.get('limit'))
+    
+    @action(detail=True, methods=['get'])
+    def also_liked(self, request, pk=None):
+        """Get the games most often liked by the players who liked this one."""
+        from recommendations.cooccurrence import also_liked
+        
+        return _neighbor_response(self.get_object().id, also_liked, request.query_params.get('limit'))
+    
     @action(detail=False, methods=['get'])
     def recent(self, request):
         """Get recently released games."""
         queryset = self.get_queryset().exclude(release_date__isnull=True).order_by('-release_date')[:10]
         serializer = GameListSerializer(queryset, many=True)
         return Response(serializer.data)
+
+
+def _neighbor_response(pk, neighbors_fn, limit):
+    """
+    Serialize a game's nearest neighbors, best first.
+    
+    Args:
+        pk: ID of the game
+        neighbors_fn: Callable taking (game_id, limit) and returning
+            (game_id, score) tuples
+        limit: Requested number of games (query string value, 10 by default,
+            clamped to 1-50)
+    """
+    try:
+        limit = max(1, min(int(limit or 10), 50))
+    except ValueError:
+        limit = 10
+    
+    neighbors = neighbors_fn(pk, limit)
+    games = Game.objects.for_list().in_bulk([game_id for game_id, _ in neighbors])
+    serializer = GameListSerializer([games[game_id] for game_id, _ in neighbors if game_id in games], many=True)
+    return Response(serializer.data)
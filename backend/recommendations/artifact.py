@@ -0,0 +1,128 @@
+import logging
+import os
+import shutil
+import tempfile
+import numpy as np
+from django.conf import settings
+
+from .features import CatalogFeatures
+
+
+logger = logging.getLogger(__name__)
+
+# File naming the latest published version
+CURRENT_FILE = 'CURRENT'
+
+
+def artifact_root():
+    return os.path.join(settings.RECOMMENDATION_DATA_DIR, 'catalog')
+
+
+def artifact_path(version, root=None):
+    return os.path.join(root or artifact_root(), f'v{version}')
+
+
+def write_catalog_artifact(catalog, root=None):
+    """
+    Publish a catalog feature store as a versioned directory of .npy files.
+
+    The files are written to a temporary directory that is renamed into
+    place, so readers never see a partial version. If another process
+    already published the same version its files are kept. The CURRENT
+    pointer is then moved forward and old versions are removed.
+
+    Args:
+        catalog: CatalogFeatures to write
+        root: Artifact directory (defaults to artifact_root())
+
+    Returns:
+        Path of the version directory
+    """
+    root = root or artifact_root()
+    path = artifact_path(catalog.version, root)
+    os.makedirs(root, exist_ok=True)
+
+    if not os.path.isdir(path):
+        tmp_path = tempfile.mkdtemp(dir=root, prefix='.tmp-')
+        try:
+            for name, array in catalog.to_arrays().items():
+                np.save(os.path.join(tmp_path, f'{name}.npy'), np.asarray(array))
+            os.rename(tmp_path, path)
+            logger.info(f"Wrote catalog artifact for {len(catalog)} games to {path}")
+        except OSError:
+            shutil.rmtree(tmp_path, ignore_errors=True)
+            if not os.path.isdir(path):
+                raise
+            # Another process published this version first
+
+    current = read_current_version(root)
+    if current is None or current < catalog.version:
+        _write_current_version(root, catalog.version)
+
+    remove_old_artifacts(root)
+    return path
+
+
+def load_catalog_artifact(version, root=None):
+    """
+    Memory-map a published catalog version read-only.
+
+    Returns:
+        CatalogFeatures backed by the mapped files, or None if that version
+        has not been published or is being removed by remove_old_artifacts
+        in another process
+    """
+    path = artifact_path(version, root)
+    if not os.path.isdir(path):
+        return None
+
+    try:
+        arrays = {}
+        for filename in os.listdir(path):
+            name, extension = os.path.splitext(filename)
+            if extension == '.npy':
+                arrays[name] = np.load(os.path.join(path, filename), mmap_mode='r')
+        catalog = CatalogFeatures.from_arrays(version, arrays)
+    except (OSError, KeyError) as e:
+        # Files vanished between listing and mapping, or only some were left
+        logger.warning(f"Could not map catalog artifact {path}: {str(e)}")
+        return None
+
+    logger.info(f"Mapped catalog artifact {path}")
+    return catalog
+
+
+def read_current_version(root=None):
+    """Return the latest published version, or None if nothing was published."""
+    try:
+        with open(os.path.join(root or artifact_root(), CURRENT_FILE)) as f:
+            return int(f.read().strip())
+    except (FileNotFoundError, ValueError):
+        return None
+
+
+def _write_current_version(root, version):
+    fd, tmp_path = tempfile.mkstemp(dir=root, prefix='.tmp-')
+    with os.fdopen(fd, 'w') as f:
+        f.write(f'{version}\n')
+    os.replace(tmp_path, os.path.join(root, CURRENT_FILE))
+
+
+def remove_old_artifacts(root=None, keep=None):
+    """
+    Delete all but the newest published versions.
+
+    Processes still mapping a removed version keep working: the mapped
+    files stay readable until they are unmapped.
+    """
+    root = root or artifact_root()
+    keep = keep or settings.RECOMMENDATION_CATALOG_ARTIFACT_KEEP
+    current = read_current_version(root)
+
+    versions = sorted(
+        int(name[1:]) for name in os.listdir(root)
+        if name.startswith('v') and name[1:].isdigit()
+    )
+    for version in versions[:-keep]:
+        if version != current:
+            shutil.rmtree(artifact_path(version, root), ignore_errors=True)
@@ -0,0 +1,238 @@
+import time
+import tracemalloc
+import numpy as np
+
+from django.contrib.auth.hashers import make_password
+from django.contrib.auth.models import User
+from django.db import connection
+from django.test.utils import CaptureQueriesContext
+
+from games.models import Game, Genre, Platform
+from games.utils.catalog_version import bump_catalog_version
+from users.models import UserProfile, GenrePreference, PlatformPreference, GameRating, UserGamePreferences
+from .engine import RecommendationEngine
+from .features import get_catalog_features
+from .ranking_cache import ranking_cache
+
+
+GENRES = [
+    'Action', 'Adventure', 'RPG', 'Strategy', 'Shooter', 'Puzzle', 'Platformer', 'Racing',
+    'Sports', 'Simulation', 'Fighting', 'Horror', 'Survival', 'Stealth', 'Roguelike',
+    'Sandbox', 'MMO', 'Music', 'Visual Novel',
+]
+
+# Platforms with their share of the catalog
+PLATFORMS = {
+    'PC': 0.75, 'PlayStation 5': 0.35, 'Xbox Series X': 0.3, 'Nintendo Switch': 0.3,
+    'PlayStation 4': 0.25, 'Xbox One': 0.2, 'iOS': 0.15, 'Android': 0.15,
+}
+
+INSERT_BATCH_SIZE = 5000
+
+
+def create_synthetic_dataset(num_games, num_users, ratings_per_user=10, seed=0):
+    """
+    Fill the database with a synthetic catalog, users and ratings.
+
+    Genre popularity follows a Zipf-like curve and each game gets one to three
+    genres; platforms are drawn from their market share. Rated games are
+    biased towards popular titles. Rows are inserted with bulk_create, so the
+    catalog version is bumped once at the end.
+
+    Args:
+        num_games: Number of games to create
+        num_users: Number of users with completed surveys to create
+        ratings_per_user: Average number of GameRating rows per user
+        seed: Random seed, so runs are comparable
+
+    Returns:
+        List of the created UserProfile IDs
+    """
+    rng = np.random.default_rng(seed)
+
+    genres = Genre.objects.bulk_create([Genre(name=name) for name in GENRES])
+    platforms = Platform.objects.bulk_create([Platform(name=name) for name in PLATFORMS])
+    genre_weights = 1.0 / np.arange(1, len(genres) + 1)
+    genre_weights /= genre_weights.sum()
+    platform_shares = np.array(list(PLATFORMS.values()))
+
+    metacritic = np.clip(rng.normal(72, 12, num_games), 20, 99).astype(int)
+    has_metacritic = rng.random(num_games) < 0.7
+    user_scores = np.round(np.clip(rng.normal(7, 1.5, num_games), 1, 10), 1)
+    has_user_score = rng.random(num_games) < 0.8
+    is_multiplayer = rng.random(num_games) < 0.4
+    is_free_to_play = rng.random(num_games) < 0.1
+    has_in_app_purchases = is_free_to_play | (rng.random(num_games) < 0.15)
+
+    games = Game.objects.bulk_create([
+        Game(
+            title=f"Benchmark Game {i}",
+            metacritic_score=int(metacritic[i]) if has_metacritic[i] else None,
+            user_score=float(user_scores[i]) if has_user_score[i] else None,
+            is_multiplayer=bool(is_multiplayer[i]),
+            is_free_to_play=bool(is_free_to_play[i]),
+            has_in_app_purchases=bool(has_in_app_purchases[i]),
+        )
+        for i in range(num_games)
+    ], batch_size=INSERT_BATCH_SIZE)
+
+    genre_links = []
+    platform_links = []
+    for game in games:
+        for index in rng.choice(len(genres), size=rng.integers(1, 4), replace=False, p=genre_weights):
+            genre_links.append(Game.genres.through(game_id=game.id, genre_id=genres[index].id))
+
+        on_platform = rng.random(len(platforms)) < platform_shares
+        if not on_platform.any():
+            on_platform[0] = True
+        for index in np.flatnonzero(on_platform):
+            platform_links.append(Game.platforms.through(game_id=game.id, platform_id=platforms[index].id))
+
+    Game.genres.through.objects.bulk_create(genre_links, batch_size=INSERT_BATCH_SIZE)
+    Game.platforms.through.objects.bulk_create(platform_links, batch_size=INSERT_BATCH_SIZE)
+
+    # bulk_create skips the post_save signals that create profiles
+    password = make_password(None)
+    users = User.objects.bulk_create([
+        User(username=f"benchmark_user_{i}", password=password) for i in range(num_users)
+    ], batch_size=INSERT_BATCH_SIZE)
+    profiles = UserProfile.objects.bulk_create([
+        UserProfile(user=user, survey_completed=True) for user in users
+    ], batch_size=INSERT_BATCH_SIZE)
+
+    game_popularity = 1.0 / np.arange(1, num_games + 1) ** 0.8
+    game_popularity /= game_popularity.sum()
+
+    genre_preferences = []
+    platform_preferences = []
+    game_preferences = []
+    ratings = []
+    for profile in profiles:
+        for rank, index in enumerate(rng.choice(len(genres), size=rng.integers(2, 6), replace=False, p=genre_weights)):
+            genre_preferences.append(GenrePreference(user_profile=profile, genre=genres[index], rank=rank))
+        for rank, index in enumerate(rng.choice(len(platforms), size=rng.integers(1, 4), replace=False)):
+            platform_preferences.append(PlatformPreference(user_profile=profile, platform=platforms[index], rank=rank))
+
+        game_preferences.append(UserGamePreferences(
+            user_profile=profile,
+            prefers_multiplayer=bool(rng.random() < 0.3),
+            willing_to_pay=str(rng.choice(['free_only', 'under_20', 'under_60', 'any_price'], p=[0.05, 0.15, 0.3, 0.5])),
+            accepts_in_app_purchases=bool(rng.random() < 0.7),
+        ))
+
+        num_ratings = min(int(rng.poisson(ratings_per_user)), num_games)
+        for index in rng.choice(num_games, size=num_ratings, replace=False, p=game_popularity):
+            ratings.append(GameRating(user_profile=profile, game=games[index], rating=int(rng.integers(1, 11))))
+
+    GenrePreference.objects.bulk_create(genre_preferences, batch_size=INSERT_BATCH_SIZE)
+    PlatformPreference.objects.bulk_create(platform_preferences, batch_size=INSERT_BATCH_SIZE)
+    UserGamePreferences.objects.bulk_create(game_preferences, batch_size=INSERT_BATCH_SIZE)
+    GameRating.objects.bulk_create(ratings, batch_size=INSERT_BATCH_SIZE)
+
+    bump_catalog_version()
+    ranking_cache.clear()
+
+    return [profile.id for profile in profiles]
+
+
+def summarize(durations, query_counts, peak_memory, items=1):
+    """
+    Summarize the timed runs of one stage.
+
+    Args:
+        durations: Wall times in seconds, one per run
+        query_counts: Database queries, one per run
+        peak_memory: Peak traced allocation in bytes during a single run
+        items: Number of users each run handled
+    """
+    durations_ms = np.array(durations) * 1000
+    return {
+        'runs': len(durations),
+        'users_per_run': items,
+        'p50_ms': round(float(np.percentile(durations_ms, 50)), 3),
+        'p95_ms': round(float(np.percentile(durations_ms, 95)), 3),
+        'mean_ms': round(float(durations_ms.mean()), 3),
+        'queries_p50': int(np.percentile(query_counts, 50)),
+        'queries_max': int(max(query_counts)),
+        'peak_memory_mb': round(peak_memory / 2 ** 20, 3),
+    }
+
+
+def measure(func, calls):
+    """
+    Time each call with its query count, then trace one extra call's memory.
+
+    Memory is traced in a separate run because tracemalloc slows down the
+    code it watches and would skew the timings.
+    """
+    durations = []
+    query_counts = []
+    for call in calls:
+        with CaptureQueriesContext(connection) as queries:
+            start = time.perf_counter()
+            func(call)
+            durations.append(time.perf_counter() - start)
+        query_counts.append(len(queries))
+
+    tracemalloc.start()
+    try:
+        func(calls[0])
+        _, peak_memory = tracemalloc.get_traced_memory()
+    finally:
+        tracemalloc.stop()
+
+    return durations, query_counts, peak_memory
+
+
+def run_benchmark(user_profile_ids, samples=20, batch_size=100, seed=0):
+    """
+    Time the recommendation paths against the data in the database.
+
+    Stages:
+        catalog_build: building the catalog feature store from scratch
+        single: RecommendationEngine.generate_recommendations for one user,
+            with the ranking cache cleared so every run scores the catalog
+        batch: generate_recommendations_batch for chunks of batch_size users
+        task: the generate_recommendations_for_user Celery task run in-process
+
+    Returns:
+        dict of stage name -> summary
+    """
+    from .tasks import generate_recommendations_for_user
+
+    rng = np.random.default_rng(seed)
+    sample_ids = rng.choice(user_profile_ids, size=min(samples, len(user_profile_ids)), replace=False).tolist()
+    profiles = UserProfile.objects.in_bulk(sample_ids)
+    engine = RecommendationEngine()
+    results = {}
+
+    def build_catalog(_):
+        bump_catalog_version()
+        get_catalog_features()
+
+    results['catalog_build'] = summarize(*measure(build_catalog, [None] * 3))
+
+    def generate_single(user_profile_id):
+        ranking_cache.clear()
+        engine.generate_recommendations(profiles[user_profile_id])
+
+    results['single'] = summarize(*measure(generate_single, sample_ids))
+
+    chunks = [
+        user_profile_ids[start:start + batch_size]
+        for start in range(0, len(user_profile_ids), batch_size)
+    ]
+
+    def generate_batch(chunk):
+        ranking_cache.clear()
+        engine.generate_recommendations_batch(chunk)
+
+    results['batch'] = summarize(*measure(generate_batch, chunks), items=batch_size)
+
+    def run_task(user_profile_id):
+        ranking_cache.clear()
+        generate_recommendations_for_user.apply(args=(user_profile_id,))
+
+    results['task'] = summarize(*measure(run_task, sample_ids))
+
+    return results
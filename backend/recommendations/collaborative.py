@@ -0,0 +1,286 @@
+import itertools
+import logging
+import os
+import time
+import numpy as np
+from scipy import sparse
+from django.conf import settings
+
+from users.models import GameRating
+from .engine import top_k
+from .storage import BLOCK_ELEMENTS, MtimeCachedLoader, save_npz_atomic
+
+
+logger = logging.getLogger(__name__)
+
+# Training defaults
+FACTORS = 32
+ITERATIONS = 15
+# Iterations when starting from the previous model's factors
+WARM_START_ITERATIONS = 5
+REGULARIZATION = 0.1
+# Confidence gained per rating point (out of 10) in the implicit model
+ALPHA = 40.0
+
+
+class FactorModel:
+    """
+    User and game factors of a matrix factorization trained on GameRating rows.
+
+    user_factors[i] (float32) belongs to user_ids[i] and item_factors[j] to
+    game_ids[j]. Both id arrays are sorted, so finding a row is a binary
+    search. A user's predicted preference for a game is the dot product of
+    their factors.
+    """
+
+    def __init__(self, version, user_ids, game_ids, user_factors, item_factors, implicit=True):
+        self.version = version
+        self.user_ids = user_ids
+        self.game_ids = game_ids
+        self.user_factors = user_factors
+        self.item_factors = item_factors
+        self.implicit = implicit
+
+    @property
+    def factors(self):
+        return self.item_factors.shape[1]
+
+    def user_row(self, user_profile_id):
+        """Return the factor row of a user, or None if they had no ratings at training time."""
+        position = np.searchsorted(self.user_ids, user_profile_id)
+        if position < len(self.user_ids) and self.user_ids[position] == user_profile_id:
+            return int(position)
+        return None
+
+    def has_user(self, user_profile_id):
+        return self.user_row(user_profile_id) is not None
+
+    def score_games(self, user_profile_id, game_ids):
+        """
+        Predict a user's preference for some games, clipped to 0-1 like the content score.
+
+        Games the model has never seen, and every game for an unknown user,
+        score 0.
+
+        Returns:
+            float32 numpy array aligned with game_ids
+        """
+        game_ids = np.asarray(game_ids, dtype=np.int64)
+        scores = np.zeros(len(game_ids), dtype=np.float32)
+        row = self.user_row(user_profile_id)
+        if row is None or len(self.game_ids) == 0:
+            return scores
+
+        positions = np.minimum(np.searchsorted(self.game_ids, game_ids), len(self.game_ids) - 1)
+        known = self.game_ids[positions] == game_ids
+        scores[known] = self.item_factors[positions[known]] @ self.user_factors[row]
+        return np.clip(scores, 0.0, 1.0)
+
+    def recommend(self, user_profile_id, limit=20, exclude_game_ids=()):
+        """
+        Rank every game for a user with one matrix-vector product.
+
+        Args:
+            user_profile_id: ID of the UserProfile
+            limit: Maximum number of games
+            exclude_game_ids: Games to leave out, such as the ones already rated
+
+        Returns:
+            List of (game_id, score) tuples, best first
+        """
+        row = self.user_row(user_profile_id)
+        if row is None:
+            return []
+
+        scores = self.item_factors @ self.user_factors[row]
+        if len(exclude_game_ids):
+            scores[np.isin(self.game_ids, list(exclude_game_ids))] = -np.inf
+
+        ranked = top_k(scores, limit)
+        ranked = ranked[np.isfinite(scores[ranked])]
+        return list(zip(self.game_ids[ranked].tolist(), scores[ranked].tolist()))
+
+    def save(self, path):
+        """Write the model to disk atomically."""
+        save_npz_atomic(
+            path,
+            version=np.array(self.version, dtype=np.int64),
+            implicit=np.array(self.implicit),
+            user_ids=self.user_ids,
+            game_ids=self.game_ids,
+            user_factors=self.user_factors,
+            item_factors=self.item_factors,
+        )
+
+    @classmethod
+    def load(cls, path):
+        with np.load(path) as data:
+            return cls(
+                version=int(data['version']),
+                user_ids=data['user_ids'],
+                game_ids=data['game_ids'],
+                user_factors=data['user_factors'],
+                item_factors=data['item_factors'],
+                implicit=bool(data['implicit']),
+            )
+
+
+def load_ratings(chunk_size=10000):
+    """
+    Read every GameRating as (user_profile_id, game_id, rating) rows of an int64 array.
+
+    Rows are streamed straight into the array instead of building model
+    instances, so millions of ratings fit comfortably in memory.
+    """
+    rows = GameRating.objects.order_by().values_list('user_profile_id', 'game_id', 'rating')
+    flat = itertools.chain.from_iterable(rows.iterator(chunk_size=chunk_size))
+    return np.fromiter(flat, dtype=np.int64).reshape(-1, 3)
+
+
+def rating_matrix(ratings, implicit=True, alpha=ALPHA):
+    """
+    Build the sparse user x game matrix of a ratings array.
+
+    The implicit model stores the confidence of each observed preference,
+    1 + alpha * rating / 10; the explicit model stores the rating scaled to
+    0-1.
+
+    In the implicit model only likes (ratings of at least
+    RECOMMENDATION_COOCCURRENCE_MIN_RATING) are preferences: the solver
+    treats every stored entry as p = 1, so lower ratings are left out and
+    count as unobserved, p = 0, instead of pulling similar games up.
+
+    Returns:
+        Tuple of (user_ids, game_ids, CSR matrix with one row per user)
+    """
+    if implicit:
+        ratings = ratings[ratings[:, 2] >= settings.RECOMMENDATION_COOCCURRENCE_MIN_RATING]
+    user_ids, user_index = np.unique(ratings[:, 0], return_inverse=True)
+    game_ids, game_index = np.unique(ratings[:, 1], return_inverse=True)
+
+    scaled = ratings[:, 2].astype(np.float32) / 10
+    values = 1 + alpha * scaled if implicit else scaled
+
+    matrix = sparse.csr_matrix((values, (user_index, game_index)), shape=(len(user_ids), len(game_ids)))
+    return user_ids, game_ids, matrix
+
+
+def solve_factors(matrix, fixed, regularization, implicit):
+    """
+    Solve the factors of every row of a matrix against the other side's fixed factors.
+
+    Each row's normal equations only involve its observed entries: the
+    weighted Gram matrix of those entries is one small BLAS product, the
+    right-hand sides of all rows are a single sparse product, and the
+    systems are solved in batches of rows whose size bounds memory at
+    BLOCK_ELEMENTS.
+
+    Implicit rows solve (YtY + Yt(C - I)Y + reg I) x = Yt C p with p = 1 on
+    observed entries; explicit rows solve (YtY + reg n I) x = Yt r over the
+    observed entries only.
+
+    Returns:
+        float32 array with one factor row per matrix row
+    """
+    n_rows = matrix.shape[0]
+    n_factors = fixed.shape[1]
+    fixed = fixed.astype(np.float64)
+    eye = np.eye(n_factors)
+    counts = np.diff(matrix.indptr)
+    weights = matrix.data - 1 if implicit else np.ones_like(matrix.data)
+    rhs = matrix @ fixed
+    base = fixed.T @ fixed + regularization * eye if implicit else None
+    block_rows = max(1, BLOCK_ELEMENTS // (n_factors * n_factors))
+
+    solved = np.zeros((n_rows, n_factors), dtype=np.float32)
+    for start in range(0, n_rows, block_rows):
+        end = min(start + block_rows, n_rows)
+        if implicit:
+            a = np.broadcast_to(base, (end - start, n_factors, n_factors)).copy()
+        else:
+            a = regularization * np.maximum(counts[start:end], 1)[:, None, None] * eye
+
+        for i, (first, last) in enumerate(zip(matrix.indptr[start:end], matrix.indptr[start + 1:end + 1])):
+            y = fixed[matrix.indices[first:last]]
+            a[i] += (y * weights[first:last, None]).T @ y
+
+        solved[start:end] = np.linalg.solve(a, rhs[start:end, :, None])[:, :, 0]
+
+    return solved
+
+
+def train_factor_model(ratings=None, factors=FACTORS, iterations=None, regularization=REGULARIZATION,
+                       alpha=ALPHA, implicit=True, previous=None, seed=0):
+    """
+    Train user and game factors with alternating least squares.
+
+    When a previous model is given, users and games it already knows start
+    from their old factors, so a nightly retrain converges in a few
+    iterations instead of starting over.
+
+    Args:
+        ratings: (user_profile_id, game_id, rating) array (defaults to every GameRating)
+        factors: Number of latent factors
+        iterations: ALS sweeps (defaults to ITERATIONS, or WARM_START_ITERATIONS
+            when warm-starting)
+        regularization: L2 penalty on the factors
+        alpha: Confidence gained per rating point in the implicit model
+        implicit: Train on rating confidences (True) or fit the ratings (False)
+        previous: FactorModel to warm-start from
+        seed: Random seed for the initial factors
+
+    Returns:
+        FactorModel
+    """
+    start = time.perf_counter()
+    ratings = load_ratings() if ratings is None else ratings
+    user_ids, game_ids, matrix = rating_matrix(ratings, implicit, alpha)
+
+    rng = np.random.default_rng(seed)
+    user_factors = (rng.standard_normal((len(user_ids), factors)) * 0.01).astype(np.float32)
+    item_factors = (rng.standard_normal((len(game_ids), factors)) * 0.01).astype(np.float32)
+
+    warm = previous is not None and previous.factors == factors and previous.implicit == implicit
+    if warm:
+        _copy_factors(previous.user_ids, previous.user_factors, user_ids, user_factors)
+        _copy_factors(previous.game_ids, previous.item_factors, game_ids, item_factors)
+    if iterations is None:
+        iterations = WARM_START_ITERATIONS if warm else ITERATIONS
+
+    by_game = matrix.T.tocsr()
+    for _ in range(iterations):
+        user_factors = solve_factors(matrix, item_factors, regularization, implicit)
+        item_factors = solve_factors(by_game, user_factors, regularization, implicit)
+
+    logger.info(
+        f"Trained {'implicit' if implicit else 'explicit'} factor model on {matrix.nnz} ratings "
+        f"({len(user_ids)} users, {len(game_ids)} games, {factors} factors, {iterations} iterations"
+        f"{', warm start' if warm else ''}) in {time.perf_counter() - start:.2f}s"
+    )
+    return FactorModel(time.time_ns(), user_ids, game_ids, user_factors, item_factors, implicit)
+
+
+def _copy_factors(old_ids, old_factors, new_ids, new_factors):
+    """Copy the factor rows of ids present in both sorted id arrays."""
+    if len(old_ids) == 0:
+        return
+    positions = np.minimum(np.searchsorted(old_ids, new_ids), len(old_ids) - 1)
+    known = old_ids[positions] == new_ids
+    new_factors[known] = old_factors[positions[known]]
+
+
+def factor_model_path():
+    return os.path.join(settings.RECOMMENDATION_DATA_DIR, 'collaborative.npz')
+
+
+_model_loader = MtimeCachedLoader(factor_model_path, FactorModel.load)
+
+
+def get_factor_model():
+    """
+    Get the worker's copy of the trained factor model, reloading it when retrained.
+
+    Returns:
+        FactorModel or None if no model has been trained yet
+    """
+    return _model_loader.get()
@@ -0,0 +1,283 @@
+import logging
+import math
+from collections import defaultdict
+import numpy as np
+from scipy import sparse
+from django.conf import settings
+from django.core.cache import cache
+from django.db import transaction
+from django.db.models import F, OuterRef, Q, Subquery
+
+from games.models import Game
+from users.models import GameRating, UserProfile
+from .models import GameCooccurrence
+
+
+logger = logging.getLogger(__name__)
+
+# Maximum number of ids per IN (...) lookup
+LOOKUP_CHUNK_SIZE = 500
+
+INSERT_BATCH_SIZE = 5000
+
+FavoriteGame = UserProfile.favorite_games.through
+
+
+def neighbor_cache_key(game_id):
+    return f'recommendations:cooccurrence:{game_id}'
+
+
+def liked_game_ids(user_profile_ids):
+    """
+    Get the games each user liked: rated at least RECOMMENDATION_COOCCURRENCE_MIN_RATING or favorited.
+
+    Returns:
+        Dict mapping user profile id to a set of game ids
+    """
+    liked = {profile_id: set() for profile_id in user_profile_ids}
+    ratings = GameRating.objects.filter(
+        user_profile_id__in=user_profile_ids, rating__gte=settings.RECOMMENDATION_COOCCURRENCE_MIN_RATING
+    ).values_list('user_profile_id', 'game_id')
+    favorites = FavoriteGame.objects.filter(userprofile_id__in=user_profile_ids).values_list('userprofile_id', 'game_id')
+
+    for profile_id, game_id in ratings.union(favorites):
+        liked[profile_id].add(game_id)
+    return liked
+
+
+def record_like_changes(user_profile_id, game_ids, liked):
+    """
+    Add or remove one user's likes of some games from the pair counts.
+
+    Only the pairs of those games with the user's other liked games change,
+    so the cost grows with the size of one user's likes, never with the
+    number of users or ratings. The games are applied one at a time, as if
+    liked (or un-liked) in turn, so pairs among them are counted once. The
+    cached neighbor lists of the touched games are dropped once the
+    transaction commits.
+
+    Args:
+        user_profile_id: ID of the UserProfile
+        game_ids: IDs of the games that became liked or stopped being liked
+        liked: True when the user now likes the games
+    """
+    game_ids = list(game_ids)
+    if not game_ids:
+        return
+
+    current = liked_game_ids([user_profile_id])[user_profile_id]
+    others = current - set(game_ids) if liked else current | set(game_ids)
+    delta = 1 if liked else -1
+    touched = others | set(game_ids)
+
+    with transaction.atomic():
+        for game_id in game_ids:
+            if liked:
+                GameCooccurrence.objects.bulk_create(
+                    [GameCooccurrence(game_id=game_id, other_game_id=game_id)]
+                    + [GameCooccurrence(game_id=game_id, other_game_id=other_id) for other_id in others]
+                    + [GameCooccurrence(game_id=other_id, other_game_id=game_id) for other_id in others],
+                    ignore_conflicts=True,
+                )
+            else:
+                others.discard(game_id)
+
+            GameCooccurrence.objects.filter(
+                Q(game_id=game_id, other_game_id__in=others | {game_id}) | Q(game_id__in=others, other_game_id=game_id)
+            ).update(count=F('count') + delta)
+
+            if liked:
+                others.add(game_id)
+            else:
+                GameCooccurrence.objects.filter(Q(game_id=game_id) | Q(other_game_id=game_id), count__lte=0).delete()
+
+        keys = [neighbor_cache_key(game_id) for game_id in touched]
+        transaction.on_commit(lambda: cache.delete_many(keys))
+
+
+def rating_changed(user_profile_id, game_id, old_rating, new_rating):
+    """
+    Apply a rating create, update or delete to the pair counts.
+
+    Only ratings crossing the like threshold matter, and only for games the
+    user has not also favorited.
+
+    Args:
+        user_profile_id: ID of the UserProfile
+        game_id: ID of the rated game
+        old_rating: Rating before the change (None for a new rating)
+        new_rating: Rating after the change (None for a deleted rating)
+    """
+    threshold = settings.RECOMMENDATION_COOCCURRENCE_MIN_RATING
+    was_liked = old_rating is not None and old_rating >= threshold
+    is_liked = new_rating is not None and new_rating >= threshold
+    if was_liked == is_liked:
+        return
+
+    if FavoriteGame.objects.filter(userprofile_id=user_profile_id, game_id=game_id).exists():
+        return
+    record_like_changes(user_profile_id, [game_id], is_liked)
+
+
+def favorites_changed(instance, action, reverse, pk_set):
+    """
+    Apply an m2m_changed event on UserProfile.favorite_games to the pair counts.
+
+    Removed links are looked up before the removal, since clear() does not
+    say which games it removes. Favorites of games the user already rated
+    highly do not change anything.
+    """
+    owner = 'game_id' if reverse else 'userprofile_id'
+    target = 'userprofile_id' if reverse else 'game_id'
+
+    if action in ('pre_remove', 'pre_clear'):
+        links = FavoriteGame.objects.filter(**{owner: instance.pk})
+        if pk_set is not None:
+            links = links.filter(**{f'{target}__in': pk_set})
+        instance._removed_favorites = list(links.values_list('userprofile_id', 'game_id'))
+        return
+
+    if action == 'post_add':
+        links, liked = [(pk, instance.pk) if reverse else (instance.pk, pk) for pk in pk_set], True
+    elif action in ('post_remove', 'post_clear'):
+        links, liked = getattr(instance, '_removed_favorites', []), False
+        instance._removed_favorites = []
+    else:
+        return
+
+    # Games the user also rated highly stay liked either way
+    threshold = settings.RECOMMENDATION_COOCCURRENCE_MIN_RATING
+    by_user = defaultdict(list)
+    for user_profile_id, game_id in links:
+        by_user[user_profile_id].append(game_id)
+
+    for user_profile_id, game_ids in by_user.items():
+        rated = set(GameRating.objects.filter(
+            user_profile_id=user_profile_id, game_id__in=game_ids, rating__gte=threshold
+        ).values_list('game_id', flat=True))
+        record_like_changes(user_profile_id, [game_id for game_id in game_ids if game_id not in rated], liked)
+
+
+def compute_neighbors(game_ids, top_n=None):
+    """
+    Rank the co-occurring games of some games by cosine similarity.
+
+    A pair's count is divided by the geometric mean of both games' like
+    counts, so games everyone likes do not dominate every list.
+
+    Returns:
+        Dict mapping game id to a list of (game_id, similarity) tuples,
+        best first
+    """
+    top_n = top_n or settings.RECOMMENDATION_COOCCURRENCE_NEIGHBORS
+    other_likes = GameCooccurrence.objects.filter(
+        game_id=OuterRef('other_game_id'), other_game_id=OuterRef('other_game_id')
+    ).values('count')
+
+    counts = defaultdict(dict)
+    game_ids = list(game_ids)
+    for start in range(0, len(game_ids), LOOKUP_CHUNK_SIZE):
+        pairs = GameCooccurrence.objects.filter(
+            game_id__in=game_ids[start:start + LOOKUP_CHUNK_SIZE], count__gt=0
+        ).annotate(other_likes=Subquery(other_likes[:1])).values_list('game_id', 'other_game_id', 'count', 'other_likes')
+        for game_id, other_id, count, likes in pairs:
+            counts[game_id][other_id] = (count, likes)
+
+    neighbors = {}
+    for game_id in game_ids:
+        row = counts.get(game_id, {})
+        likes = row.pop(game_id, (0, 0))[0]
+        scored = [
+            (other_id, count / math.sqrt(likes * other_likes))
+            for other_id, (count, other_likes) in row.items() if likes and other_likes
+        ]
+        scored.sort(key=lambda item: (-item[1], item[0]))
+        neighbors[game_id] = scored[:top_n]
+    return neighbors
+
+
+def get_neighbors(game_ids):
+    """
+    Get the top co-occurring games of some games.
+
+    Each game's list is one cache entry, so a lookup is a single cache read
+    however many users and ratings there are. Lists dropped by a like
+    change are recomputed here on first use.
+
+    Returns:
+        Dict mapping game id to a list of (game_id, similarity) tuples,
+        best first
+    """
+    keys = {neighbor_cache_key(game_id): game_id for game_id in game_ids}
+    neighbors = {keys[key]: value for key, value in cache.get_many(keys).items()}
+
+    missing = [game_id for game_id in keys.values() if game_id not in neighbors]
+    if missing:
+        computed = compute_neighbors(missing)
+        cache.set_many({neighbor_cache_key(game_id): computed[game_id] for game_id in missing}, timeout=None)
+        neighbors.update(computed)
+    return neighbors
+
+
+def also_liked(game_id, limit=None):
+    """Get the games most often liked by the players who liked a game, best first."""
+    return get_neighbors([game_id])[game_id][:limit]
+
+
+def cooccurrence_scores(liked_ids):
+    """
+    Score games by their average similarity to a user's liked games.
+
+    Returns:
+        Dict mapping game id to a score between 0 and 1
+    """
+    if not liked_ids:
+        return {}
+
+    scores = defaultdict(float)
+    for neighbors in get_neighbors(liked_ids).values():
+        for other_id, similarity in neighbors:
+            scores[other_id] += similarity
+    return {game_id: score / len(liked_ids) for game_id, score in scores.items()}
+
+
+def rebuild_cooccurrence():
+    """
+    Recount every pair from scratch with one sparse matrix product.
+
+    Only needed to backfill the table or to correct drift (for example
+    from favorites removed by deleting a profile); day to day the counts
+    are maintained by record_like_changes.
+
+    Returns:
+        Number of stored pairs
+    """
+    profile_ids = list(UserProfile.objects.values_list('id', flat=True))
+    pairs = []
+    for start in range(0, len(profile_ids), LOOKUP_CHUNK_SIZE):
+        for profile_id, liked in liked_game_ids(profile_ids[start:start + LOOKUP_CHUNK_SIZE]).items():
+            pairs.extend((profile_id, game_id) for game_id in liked)
+
+    pairs = np.array(pairs, dtype=np.int64).reshape(-1, 2)
+    user_ids, user_index = np.unique(pairs[:, 0], return_inverse=True)
+    game_ids, game_index = np.unique(pairs[:, 1], return_inverse=True)
+    likes = sparse.csr_matrix(
+        (np.ones(len(pairs), dtype=np.int32), (user_index, game_index)), shape=(len(user_ids), len(game_ids))
+    )
+    counts = (likes.T @ likes).tocoo()
+
+    with transaction.atomic():
+        GameCooccurrence.objects.all().delete()
+        GameCooccurrence.objects.bulk_create(
+            (
+                GameCooccurrence(game_id=int(game_ids[row]), other_game_id=int(game_ids[col]), count=int(count))
+                for row, col, count in zip(counts.row, counts.col, counts.data)
+            ),
+            batch_size=INSERT_BATCH_SIZE,
+        )
+
+    all_game_ids = list(Game.objects.values_list('id', flat=True))
+    transaction.on_commit(lambda: cache.delete_many([neighbor_cache_key(game_id) for game_id in all_game_ids]))
+
+    logger.info(f"Rebuilt co-occurrence counts: {counts.nnz} pairs over {len(game_ids)} liked games")
+    return counts.nnz
@@ -0,0 +1,346 @@
+import logging
+import os
+import numpy as np
+from scipy import sparse
+from sklearn.feature_extraction.text import HashingVectorizer
+from sklearn.preprocessing import normalize
+from django.conf import settings
+
+from games.models import Game
+from .storage import BLOCK_ELEMENTS, MtimeCachedLoader, save_npz_atomic
+
+
+logger = logging.getLogger(__name__)
+
+# Hashed vocabulary size; collisions are rare at this size for game descriptions
+N_FEATURES = 2 ** 18
+
+# Stateless, so a description is vectorized on its own without refitting a vocabulary
+vectorizer = HashingVectorizer(
+    n_features=N_FEATURES, stop_words='english', alternate_sign=False, norm=None, dtype=np.float32
+)
+
+
+class DescriptionIndex:
+    """
+    Hashed term counts of every game description and their top-N TF-IDF neighbors.
+
+    term_counts holds one row per entry of game_ids (in insertion order) and
+    document_frequency the number of descriptions containing each hashed
+    term. The IDF weights are derived from those counts when similarities
+    are computed, so changing one description only re-vectorizes that one.
+
+    neighbors[i] holds the ids (int64, -1 for padding) of the games whose
+    descriptions are most similar to game_ids[i], best first, with the
+    matching cosine similarities (float32) in similarities[i].
+    """
+
+    def __init__(self, game_ids, term_counts, document_frequency, neighbors, similarities, version=0):
+        self.game_ids = game_ids
+        self.term_counts = term_counts
+        self.document_frequency = document_frequency
+        self.neighbors = neighbors
+        self.similarities = similarities
+        self.version = version
+        self._index_ids()
+
+    @classmethod
+    def empty(cls, top_n=None):
+        top_n = top_n or settings.RECOMMENDATION_SIMILAR_GAMES
+        return cls(
+            game_ids=np.zeros(0, dtype=np.int64),
+            term_counts=sparse.csr_matrix((0, N_FEATURES), dtype=np.float32),
+            document_frequency=np.zeros(N_FEATURES, dtype=np.int32),
+            neighbors=np.full((0, top_n), -1, dtype=np.int64),
+            similarities=np.zeros((0, top_n), dtype=np.float32),
+        )
+
+    def _index_ids(self):
+        self._id_order = np.argsort(self.game_ids, kind='stable')
+        self._sorted_ids = self.game_ids[self._id_order]
+
+    def __len__(self):
+        return len(self.game_ids)
+
+    @property
+    def top_n(self):
+        return self.neighbors.shape[1]
+
+    def positions(self, game_ids):
+        """Map game ids to rows, -1 where a game is not indexed."""
+        game_ids = np.asarray(game_ids, dtype=np.int64)
+        positions = np.full(len(game_ids), -1, dtype=np.int64)
+        if not len(game_ids) or not len(self):
+            return positions
+
+        found = np.minimum(np.searchsorted(self._sorted_ids, game_ids), len(self) - 1)
+        known = self._sorted_ids[found] == game_ids
+        positions[known] = self._id_order[found[known]]
+        return positions
+
+    def similar_games(self, game_id, limit=None):
+        """
+        Look up the games with the most similar descriptions.
+
+        Returns:
+            List of (game_id, similarity) tuples, most similar first
+        """
+        row = self.positions([game_id])[0]
+        if row < 0:
+            return []
+
+        neighbors = self.neighbors[row][:limit]
+        similarities = self.similarities[row][:limit]
+        valid = neighbors >= 0
+        return list(zip(neighbors[valid].tolist(), similarities[valid].tolist()))
+
+    def weighted(self):
+        """Return the L2-normalized TF-IDF matrix (smoothed IDF, as sklearn's TfidfTransformer)."""
+        documents = np.count_nonzero(np.diff(self.term_counts.indptr))
+        idf = np.log((1 + documents) / (1 + self.document_frequency.astype(np.float64))) + 1
+        return normalize(self.term_counts @ sparse.diags(idf.astype(np.float32)), copy=False)
+
+    def update(self, descriptions, block_size=None):
+        """
+        Re-vectorize changed descriptions and patch the neighbor lists.
+
+        Only the given descriptions are tokenized. Games whose lists named a
+        changed game are re-ranked in full; every other game only checks
+        whether a changed game now makes its top N. An empty description
+        removes a game from every list.
+
+        Args:
+            descriptions: Dict mapping game id to its current description
+            block_size: Rows per dense similarity block
+
+        Returns:
+            Number of games updated
+        """
+        if not descriptions:
+            return 0
+
+        game_ids = np.array(sorted(descriptions), dtype=np.int64)
+        counts = vectorizer.transform([descriptions[game_id] or '' for game_id in game_ids.tolist()]).tocsr()
+
+        positions = self.positions(game_ids)
+        existing = positions >= 0
+        self._replace_rows(positions[existing], counts[np.flatnonzero(existing)])
+        self._append_rows(game_ids[~existing], counts[np.flatnonzero(~existing)])
+
+        changed = self.positions(game_ids)
+        self._patch_neighbors(changed, block_size)
+        self.version += 1
+        return len(game_ids)
+
+    def _replace_rows(self, positions, counts):
+        if not len(positions):
+            return
+
+        old = self.term_counts[positions]
+        self.document_frequency -= np.asarray((old > 0).sum(axis=0), dtype=np.int32).ravel()
+        self.document_frequency += np.asarray((counts > 0).sum(axis=0), dtype=np.int32).ravel()
+
+        # Swap the rows in place: subtract the old counts and add the new ones
+        placement = sparse.csr_matrix(
+            (np.ones(len(positions), dtype=np.float32), (positions, np.arange(len(positions)))),
+            shape=(len(self), len(positions)),
+        )
+        self.term_counts = (self.term_counts + placement @ (counts - old)).tocsr()
+        self.term_counts.eliminate_zeros()
+
+    def _append_rows(self, game_ids, counts):
+        if not len(game_ids):
+            return
+
+        self.document_frequency += np.asarray((counts > 0).sum(axis=0), dtype=np.int32).ravel()
+        self.term_counts = sparse.vstack([self.term_counts, counts], format='csr', dtype=np.float32)
+        self.game_ids = np.concatenate([self.game_ids, game_ids])
+        self.neighbors = np.vstack([self.neighbors, np.full((len(game_ids), self.top_n), -1, dtype=np.int64)])
+        self.similarities = np.vstack([self.similarities, np.zeros((len(game_ids), self.top_n), dtype=np.float32)])
+        self._index_ids()
+
+    def _patch_neighbors(self, changed, block_size=None):
+        weighted = self.weighted()
+        changed_ids = self.game_ids[changed]
+
+        stale = np.flatnonzero(np.isin(self.neighbors, changed_ids).any(axis=1))
+        recompute = np.union1d(stale, changed)
+        self._rank_rows(weighted, recompute, block_size)
+
+        # Everyone else keeps their list unless a changed game now beats its tail
+        rest = np.setdiff1d(np.arange(len(self)), recompute)
+        changed_vectors = weighted[changed].T.tocsc()
+        block_size = block_size or max(1, BLOCK_ELEMENTS // max(len(changed), 1))
+        for start in range(0, len(rest), block_size):
+            rows = rest[start:start + block_size]
+            block = (weighted[rows] @ changed_vectors).toarray()
+            hits = block.max(axis=1) > 0
+            if not hits.any():
+                continue
+
+            rows, block = rows[hits], block[hits]
+            candidates = np.hstack([self.neighbors[rows], np.broadcast_to(changed_ids, block.shape)])
+            scores = np.hstack([self.similarities[rows], block])
+            self.neighbors[rows], self.similarities[rows] = select_neighbors(candidates, scores, self.top_n)
+
+    def rebuild_neighbors(self, block_size=None):
+        """Re-rank every game's neighbors from the stored vectors, without re-vectorizing."""
+        self._rank_rows(self.weighted(), np.arange(len(self)), block_size)
+
+    def _rank_rows(self, weighted, rows, block_size=None):
+        """Compute the neighbors of some rows against the whole index, a block of rows at a time."""
+        block_size = block_size or max(1, BLOCK_ELEMENTS // max(len(self), 1))
+        columns = weighted.T.tocsc()
+        for start in range(0, len(rows), block_size):
+            block_rows = rows[start:start + block_size]
+            block = (weighted[block_rows] @ columns).toarray()
+
+            # A game is not its own neighbor
+            block[np.arange(len(block_rows)), block_rows] = 0
+
+            k = min(self.top_n, len(self))
+            candidates = np.argpartition(-block, k - 1, axis=1)[:, :k]
+            scores = np.take_along_axis(block, candidates, axis=1)
+            self.neighbors[block_rows], self.similarities[block_rows] = select_neighbors(
+                self.game_ids[candidates], scores, self.top_n
+            )
+
+    def save(self, path):
+        """Write the index to disk atomically."""
+        save_npz_atomic(
+            path,
+            version=np.array(self.version, dtype=np.int64),
+            game_ids=self.game_ids,
+            data=self.term_counts.data,
+            indices=self.term_counts.indices,
+            indptr=self.term_counts.indptr,
+            document_frequency=self.document_frequency,
+            neighbors=self.neighbors,
+            similarities=self.similarities,
+        )
+
+    @classmethod
+    def load(cls, path):
+        with np.load(path) as data:
+            game_ids = data['game_ids']
+            return cls(
+                game_ids=game_ids,
+                term_counts=sparse.csr_matrix(
+                    (data['data'], data['indices'], data['indptr']), shape=(len(game_ids), N_FEATURES)
+                ),
+                document_frequency=data['document_frequency'],
+                neighbors=data['neighbors'],
+                similarities=data['similarities'],
+                version=int(data['version']),
+            )
+
+
+def select_neighbors(candidates, scores, top_n):
+    """
+    Keep the top_n best-scoring candidate ids of each row.
+
+    Candidates with no similarity (or -1 padding) are dropped, and ties are
+    broken by game id so incremental and full runs agree.
+
+    Returns:
+        Tuple of (int64 ids padded with -1, float32 similarities), both rows x top_n
+    """
+    scores = np.where((candidates >= 0) & (scores > 0), scores, 0).astype(np.float32)
+    candidates = np.where(scores > 0, candidates, -1)
+
+    # Collapse duplicate ids (a changed game already in a list) to their best score
+    order = np.lexsort((-scores, candidates), axis=1)
+    candidates = np.take_along_axis(candidates, order, axis=1)
+    scores = np.take_along_axis(scores, order, axis=1)
+    duplicate = np.zeros_like(candidates, dtype=bool)
+    duplicate[:, 1:] = (candidates[:, 1:] == candidates[:, :-1]) & (candidates[:, 1:] >= 0)
+    scores[duplicate] = 0
+    candidates[duplicate] = -1
+
+    order = np.lexsort((np.where(candidates >= 0, candidates, np.iinfo(np.int64).max), -scores), axis=1)[:, :top_n]
+    candidates = np.take_along_axis(candidates, order, axis=1)
+    scores = np.take_along_axis(scores, order, axis=1)
+
+    if candidates.shape[1] < top_n:
+        padding = top_n - candidates.shape[1]
+        candidates = np.pad(candidates, ((0, 0), (0, padding)), constant_values=-1)
+        scores = np.pad(scores, ((0, 0), (0, padding)))
+    return candidates, scores
+
+
+def load_descriptions(game_ids=None):
+    """
+    Read the current descriptions of some games (all by default).
+
+    Games that no longer exist map to an empty description, which drops them
+    from every neighbor list.
+    """
+    games = Game.objects.all() if game_ids is None else Game.objects.filter(id__in=game_ids)
+    descriptions = dict(games.values_list('id', 'description'))
+    for game_id in game_ids or []:
+        descriptions.setdefault(game_id, '')
+    return descriptions
+
+
+def build_description_index(block_size=None):
+    """Vectorize every description and rank all neighbors from scratch."""
+    index = DescriptionIndex.empty()
+    index.update(load_descriptions(), block_size)
+    logger.info(f"Built description index for {len(index)} games")
+    return index
+
+
+def description_index_path():
+    return os.path.join(settings.RECOMMENDATION_DATA_DIR, 'descriptions.npz')
+
+
+def update_description_index(game_ids):
+    """
+    Apply changed descriptions to the index on disk.
+
+    Builds the whole index instead when none has been saved yet. Callers
+    must serialize writers (see tasks.update_description_index).
+
+    Returns:
+        The saved DescriptionIndex
+    """
+    path = description_index_path()
+    if not os.path.exists(path):
+        index = build_description_index()
+    else:
+        index = DescriptionIndex.load(path)
+        index.update(load_descriptions(game_ids))
+
+    index.save(path)
+    return index
+
+
+def refresh_description_neighbors():
+    """
+    Re-rank every neighbor list of the index on disk from its stored vectors.
+
+    Returns:
+        The saved DescriptionIndex
+    """
+    path = description_index_path()
+    if not os.path.exists(path):
+        index = build_description_index()
+    else:
+        index = DescriptionIndex.load(path)
+        index.rebuild_neighbors()
+
+    index.save(path)
+    return index
+
+
+_index_loader = MtimeCachedLoader(description_index_path, DescriptionIndex.load)
+
+
+def get_description_index():
+    """
+    Get the worker's copy of the description index, reloading it when updated.
+
+    Returns:
+        DescriptionIndex or None if it has not been built yet
+    """
+    return _index_loader.get()
@@ -1,19 +1,38 @@
-import pandas as pd
+import hashlib
+import json
+import logging
+from collections import Counter
+from functools import reduce
+from operator import or_
 import numpy as np
-from sklearn.metrics.pairwise import cosine_similarity
-from sklearn.preprocessing import MinMaxScaler
-from django.db.models import Count, Avg, Q
+from django.conf import settings
+from django.core.cache import cache
+from django.db import transaction
+from django.db.models import Case, F, Q, Value, When
+from django.utils import timezone
 
-from games.models import Game, Genre, Platform
-from users.models import UserProfile, GenrePreference, PlatformPreference, GameRating
-from .models import GameRecommendation
+from games.models import Game
+from users.models import GenrePreference, PlatformPreference, GameRating, UserGamePreferences
+from .cooccurrence import cooccurrence_scores, liked_game_ids
+from .models import GameRecommendation, RecommendationState
+from .features import get_catalog_features
+from .instrumentation import EngineMetrics
+from .ranking_cache import RankedCandidates, ranking_cache
+from .reasons import reason_codes
+from .scheduling import user_refresh_locks
 
 
+logger = logging.getLogger(__name__)
+
+# Users whose generation pointers are flipped per statement (bounds the WHERE clause)
+FLIP_CHUNK_SIZE = 100
+
 class RecommendationEngine:
     """Engine for generating personalized game recommendations."""
     
     def __init__(self):
-        self.scaler = MinMaxScaler()
+        # Stage timings of the latest generate/update/batch call
+        self.metrics = EngineMetrics()
     
     def generate_recommendations(self, user_profile, limit=20):
         """
@@ -24,158 +43,821 @@ class RecommendationEngine:
             limit: Maximum number of recommendations to generate
             
         Returns:
-            List of (game, score, reason) tuples
+            List of (game, score, reason_codes) tuples
         """
-        # Delete existing recommendations
-        GameRecommendation.objects.filter(user_profile=user_profile).delete()
+        self.metrics = EngineMetrics('generate')
         
-        # Get user preferences
-        genre_prefs = list(GenrePreference.objects.filter(user_profile=user_profile).order_by('rank'))
-        platform_prefs = list(PlatformPreference.objects.filter(user_profile=user_profile).order_by('rank'))
+        # Get user preferences, game preferences and rated games
+        with self.metrics.stage('load_preferences'):
+            prefs = load_preferences([user_profile.id])[user_profile.id]
+        return self._generate(user_profile, prefs, limit)
+    
+    def _generate(self, user_profile, prefs, limit):
+        """Full recompute for one user from already loaded preferences."""
+        # If user has no preferences yet, clear any stale recommendations
+        if not has_preferences(prefs):
+            cache.delete(overflow_cache_key(user_profile.id))
+            with self.metrics.stage('save'):
+                return self.save_recommendations(user_profile, [])
         
-        # Get game preferences if they exist
-        game_prefs = getattr(user_profile, 'game_preferences', None)
+        with self.metrics.stage('catalog'):
+            catalog = get_catalog_features()
+        overflow_size = settings.RECOMMENDATION_OVERFLOW_SIZE
+        rated_rows = catalog.rows_for(prefs['rated_game_ids'])
         
-        # If user has no preferences yet, return empty list
-        if not genre_prefs and not platform_prefs and not game_prefs:
-            return []
+        # Users with the same preferences share one ranking; only the removal
+        # of their own rated games is per user
+        ranking = self.rank_candidates(catalog, prefs, limit + overflow_size + len(rated_rows))
         
-        # Get games rated by the user
-        rated_game_ids = GameRating.objects.filter(user_profile=user_profile).values_list('game_id', flat=True)
+        keep = ~np.isin(ranking.rows, rated_rows)
+        with self.metrics.stage('blend'):
+            rows, scores = self.blend_signals(
+                self.factor_model(), self.cooccurrence_signals([user_profile.id])[user_profile.id],
+                catalog, user_profile.id, ranking.rows[keep], ranking.scores[keep]
+            )
         
-        # Get candidate games (games not yet rated by the user)
-        candidate_games = Game.objects.exclude(id__in=rated_game_ids)
+        with self.metrics.stage('overflow'):
+            # Keep the top N plus an overflow list for incremental updates
+            store_overflow(
+                user_profile.id, prefs, catalog,
+                catalog.game_ids[rows[limit:limit + overflow_size]], scores[limit:limit + overflow_size],
+                exhausted=ranking.complete and len(rows) <= limit + overflow_size
+            )
         
-        # Apply platform filter if user has platform preferences
-        if platform_prefs:
-            platform_ids = [p.platform_id for p in platform_prefs]
-            candidate_games = candidate_games.filter(platforms__id__in=platform_ids).distinct()
+        with self.metrics.stage('build_results'):
+            recommendation_results = self.build_results(catalog, rows[:limit], scores[:limit], prefs)
+        with self.metrics.stage('save'):
+            return self.save_recommendations(user_profile, recommendation_results)
+    
+    def rank_candidates(self, catalog, prefs, depth):
+        """
+        Rank the candidate games for a set of preferences, using the shared cache.
         
-        # Apply multiplayer filter if set
-        if game_prefs and game_prefs.prefers_multiplayer is not None:
-            candidate_games = candidate_games.filter(is_multiplayer=game_prefs.prefers_multiplayer)
+        The ranking is keyed by the preference fingerprint and catalog version
+        and does not exclude rated games, so every user with the same
+        preferences can reuse it.
         
-        # Apply price filter if set
-        if game_prefs and game_prefs.willing_to_pay:
-            if game_prefs.willing_to_pay == 'free_only':
-                candidate_games = candidate_games.filter(is_free_to_play=True)
+        Args:
+            catalog: CatalogFeatures snapshot
+            prefs: Preference dict as returned by load_preferences
+            depth: Number of ranked entries the caller needs
             
-            # Note: In a real implementation, you would have a price field to filter on
+        Returns:
+            RankedCandidates
+        """
+        key = (preference_fingerprint(prefs), catalog.version)
+        ranking = ranking_cache.get(key, depth)
+        if ranking is not None:
+            self.metrics.count('ranking_cache_hits')
+            return ranking
         
-        # Apply in-app purchases filter if set
-        if game_prefs and game_prefs.accepts_in_app_purchases is not None:
-            candidate_games = candidate_games.filter(has_in_app_purchases=game_prefs.accepts_in_app_purchases)
+        # Filter the cached catalog in memory instead of querying for candidates
+        with self.metrics.stage('candidates'):
+            rows = np.flatnonzero(candidate_mask(catalog, prefs, exclude_rated=False))
+        self.metrics.count('candidates', len(rows))
         
-        # Convert to DataFrame for easier processing
-        game_data = []
-        for game in candidate_games:
-            game_genres = set(game.genres.values_list('id', flat=True))
-            game_platforms = set(game.platforms.values_list('id', flat=True))
-            
-            game_data.append({
-                'id': game.id,
-                'title': game.title,
-                'genres': game_genres,
-                'platforms': game_platforms,
-                'rating': game.rating if game.rating else 0,
-                'metacritic_score': game.metacritic_score if game.metacritic_score else 0,
-                'user_score': game.user_score if game.user_score else 0,
-                'release_date': game.release_date,
-                'is_multiplayer': game.is_multiplayer,
-                'is_free_to_play': game.is_free_to_play,
-                'has_in_app_purchases': game.has_in_app_purchases,
-            })
+        # Score every candidate at once instead of walking the preferences per row
+        with self.metrics.stage('scoring'):
+            scores = self.score_candidates(catalog, rows, prefs['genre_prefs'], prefs['platform_prefs'])
+        
+        with self.metrics.stage('ranking'):
+            return self.store_ranking(key, rows, scores, depth)
+    
+    def store_ranking(self, key, rows, scores, depth):
+        """Keep the best entries of a scored candidate list in the shared cache."""
+        ranked = top_k(scores, max(depth, settings.RECOMMENDATION_RANKING_CACHE_DEPTH))
+        ranking = RankedCandidates(rows[ranked], scores[ranked], complete=len(ranked) == len(rows))
+        ranking_cache.set(key, ranking)
+        return ranking
+    
+    def factor_model(self):
+        """Get the collaborative filtering model to blend in, or None when blending is off."""
+        from .collaborative import get_factor_model
         
-        if not game_data:
-            return []
+        if settings.RECOMMENDATION_COLLABORATIVE_WEIGHT <= 0:
+            return None
+        return get_factor_model()
+    
+    def cooccurrence_signals(self, user_profile_ids):
+        """
+        Get each user's co-occurrence scores, or empty dicts when that signal is off.
         
-        # Convert to DataFrame
-        df = pd.DataFrame(game_data)
+        Returns:
+            Dict mapping user profile id to a dict of game id to score
+        """
+        if settings.RECOMMENDATION_COOCCURRENCE_WEIGHT <= 0:
+            return {profile_id: {} for profile_id in user_profile_ids}
+        
+        liked = liked_game_ids(user_profile_ids)
+        return {profile_id: cooccurrence_scores(liked[profile_id]) for profile_id in user_profile_ids}
+    
+    def blend_signals(self, model, also_liked, catalog, user_profile_id, rows, scores):
+        """
+        Re-rank a user's content-ranked rows with their collaborative and co-occurrence scores.
         
-        # Calculate scores based on user preferences
-        scores = []
-        reasons = []
+        The shared content ranking picks the candidates and the per-user
+        signals only re-order them, so the ranking cache keeps working and
+        the blend costs one small matrix-vector product plus dict lookups.
+        A signal the user has no data for (not in the factor model, no liked
+        games) leaves its weight with the content score.
         
-        for idx, row in df.iterrows():
-            score = 0
-            reason_parts = []
+        Args:
+            model: FactorModel or None
+            also_liked: Dict of game id to co-occurrence score for the user
+            catalog: CatalogFeatures snapshot
+            user_profile_id: ID of the UserProfile
+            rows: Catalog rows ranked by content score
+            scores: Content scores matching rows
             
-            # Score based on genre preferences
-            genre_score = 0
-            for i, genre_pref in enumerate(genre_prefs):
-                if genre_pref.genre_id in row['genres']:
-                    # Weighted by rank (first preferences get higher score)
-                    weight = 1.0 / (i + 1)
-                    genre_score += weight
-                    reason_parts.append(f"Matches your {genre_pref.genre.name} genre preference")
+        Returns:
+            Tuple of (rows, blended scores), best first
+        """
+        use_model = model is not None and model.has_user(user_profile_id)
+        if not use_model and not also_liked:
+            return rows, scores
+        
+        game_ids = catalog.game_ids[rows]
+        blended = np.array(scores, dtype=np.float64)
+        if use_model:
+            weight = settings.RECOMMENDATION_COLLABORATIVE_WEIGHT
+            blended = (1 - weight) * blended + weight * model.score_games(user_profile_id, game_ids)
+        if also_liked:
+            weight = settings.RECOMMENDATION_COOCCURRENCE_WEIGHT
+            signal = np.array([also_liked.get(game_id, 0.0) for game_id in game_ids.tolist()])
+            blended = (1 - weight) * blended + weight * signal
+        
+        order = np.lexsort((rows, -blended))
+        return rows[order], blended[order]
+    
+    def update_recommendations(self, user_profile, limit=20):
+        """
+        Bring a user's recommendations up to date after their ratings changed.
+        
+        Newly rated games are dropped from the current list and the gaps are
+        backfilled from the overflow candidates kept by the last full run;
+        games the user un-rated are scored and merged back in. Falls back to
+        a full recompute when the preferences or the catalog changed since
+        that run, or when the overflow list runs out.
+        
+        Args:
+            user_profile: UserProfile object
+            limit: Maximum number of recommendations to keep
             
-            # Normalize genre score (0-1)
-            if genre_prefs:
-                max_genre_score = sum(1.0 / (i + 1) for i in range(len(genre_prefs)))
-                genre_score = genre_score / max_genre_score if max_genre_score > 0 else 0
+        Returns:
+            List of (game, score, reason_codes) tuples
+        """
+        self.metrics = EngineMetrics('update')
+        
+        with self.metrics.stage('load_preferences'):
+            prefs = load_preferences([user_profile.id])[user_profile.id]
+        with self.metrics.stage('catalog'):
+            catalog = get_catalog_features()
+        state = cache.get(overflow_cache_key(user_profile.id))
+        
+        if (state is None or state['fingerprint'] != preference_fingerprint(prefs)
+                or state['catalog_version'] != catalog.version):
+            logger.info(f"Full recompute for user profile {user_profile.id}: overflow state is stale")
+            self.metrics.count('full_recomputes')
+            return self._generate(user_profile, prefs, limit)
+        
+        rated_ids = set(prefs['rated_game_ids'])
+        unrated_ids = set(state['rated_game_ids']) - rated_ids
+        
+        with self.metrics.stage('load_current'):
+            current = list(GameRecommendation.objects.current().filter(user_profile=user_profile).select_related('game'))
+        kept = [rec for rec in current if rec.game_id not in rated_ids]
+        
+        if len(kept) == len(current) and not unrated_ids:
+            return [(rec.game, rec.score, rec.reason_codes) for rec in sorted(current, key=lambda rec: -rec.score)]
+        
+        # Pool of (game_id, score) entries the list can be refilled from
+        present_ids = {rec.game_id for rec in kept}
+        pool = [
+            (game_id, score) for game_id, score in state['overflow']
+            if game_id not in rated_ids and game_id not in present_ids
+        ]
+        
+        # Games the user un-rated are candidates again if they pass the filters
+        with self.metrics.stage('scoring'):
+            unrated_rows = catalog.rows_for(unrated_ids)
+            unrated_rows = unrated_rows[candidate_mask(catalog, prefs, unrated_rows)]
+            unrated_scores = self.score_candidates(catalog, unrated_rows, prefs['genre_prefs'], prefs['platform_prefs'])
+            unrated_rows, unrated_scores = self.blend_signals(
+                self.factor_model(), self.cooccurrence_signals([user_profile.id])[user_profile.id],
+                catalog, user_profile.id, unrated_rows, unrated_scores
+            )
+            pool.extend(zip(catalog.game_ids[unrated_rows].tolist(), unrated_scores.tolist()))
+        self.metrics.count('candidates', len(pool))
+        
+        if len(kept) + len(pool) < limit and not state['exhausted']:
+            logger.info(f"Full recompute for user profile {user_profile.id}: overflow list ran out")
+            self.metrics.count('full_recomputes')
+            return self._generate(user_profile, prefs, limit)
+        
+        # Merge by score, breaking ties by catalog position like a full run
+        entries = [(rec.game_id, rec.score) for rec in kept] + pool
+        positions = catalog.row_index([game_id for game_id, _ in entries])
+        merged = sorted(zip(entries, positions.tolist()), key=lambda item: (-item[0][1], item[1]))
+        merged = [entry for entry, _ in merged]
+        
+        kept_by_game = {rec.game_id: rec for rec in kept}
+        new_entries = [(game_id, score) for game_id, score in merged[:limit] if game_id not in kept_by_game]
+        new_rows = catalog.row_index([game_id for game_id, _ in new_entries])
+        new_scores = np.array([score for _, score in new_entries])
+        found = new_rows >= 0
+        with self.metrics.stage('build_results'):
+            # Keep the pooled scores, which already include any collaborative blend
+            new_results = {
+                game.id: (game, score, codes)
+                for game, score, codes in self.build_results(catalog, new_rows[found], new_scores[found], prefs)
+            }
+        
+        recommendation_results = []
+        for game_id, score in merged[:limit]:
+            if game_id in kept_by_game:
+                rec = kept_by_game[game_id]
+                recommendation_results.append((rec.game, rec.score, rec.reason_codes))
+            elif game_id in new_results:
+                recommendation_results.append(new_results[game_id])
+        
+        overflow = merged[limit:]
+        with self.metrics.stage('overflow'):
+            store_overflow(
+                user_profile.id, prefs, catalog,
+                [game_id for game_id, _ in overflow], [score for _, score in overflow],
+                exhausted=state['exhausted']
+            )
+        
+        with self.metrics.stage('save'):
+            return self.save_recommendations(user_profile, recommendation_results)
+    
+    def build_results(self, catalog, rows, scores, prefs):
+        """
+        Turn ranked catalog rows into (game, score, reason_codes) tuples.
+        
+        Args:
+            catalog: CatalogFeatures snapshot
+            rows: Ranked catalog row indices
+            scores: Scores matching rows
+            prefs: Preference dict as returned by load_preferences
             
-            # Score based on platform preferences
-            platform_score = 0
-            for i, platform_pref in enumerate(platform_prefs):
-                if platform_pref.platform_id in row['platforms']:
-                    # Weighted by rank
-                    weight = 1.0 / (i + 1)
-                    platform_score += weight
-                    reason_parts.append(f"Available on your preferred platform ({platform_pref.platform.name})")
+        Returns:
+            List of (game, score, reason_codes) tuples
+        """
+        # Load the kept games in one query
+        games = Game.objects.in_bulk(catalog.game_ids[rows].tolist())
+        
+        recommendation_results = []
+        for row, score in zip(np.asarray(rows).tolist(), np.asarray(scores).tolist()):
+            game_id = int(catalog.game_ids[row])
+            if game_id not in games:
+                continue  # Deleted since the catalog snapshot was built
             
-            # Normalize platform score (0-1)
-            if platform_prefs:
-                max_platform_score = sum(1.0 / (i + 1) for i in range(len(platform_prefs)))
-                platform_score = platform_score / max_platform_score if max_platform_score > 0 else 0
+            # Only the kept rows need an explanation
+            codes = reason_codes(catalog, row, prefs['genre_prefs'], prefs['platform_prefs'])
+            recommendation_results.append((games[game_id], score, codes))
+        
+        return recommendation_results
+    
+    def generate_recommendations_batch(self, user_profile_ids, limit=20, block_size=64):
+        """
+        Generate recommendations for many user profiles at once.
+        
+        Preferences for the whole chunk are loaded with a fixed number of
+        queries and turned into user x genre and user x platform weight
+        matrices, so each block of users is scored against the catalog with
+        one sparse matrix multiply per feature. Results are written with a
+        single bulk upsert for the chunk.
+        
+        Each user's refresh lock is held while their list is written; users
+        whose own refresh is running are skipped and left out of the result.
+        
+        Args:
+            user_profile_ids: IDs of the UserProfiles to generate recommendations for
+            limit: Maximum number of recommendations per user
+            block_size: Number of users scored per matrix multiply (bounds memory)
             
-            # Score based on game quality
-            quality_score = 0
-            if row['metacritic_score'] > 0:
-                # Normalize Metacritic score (0-100) to 0-1
-                quality_score += row['metacritic_score'] / 100
-                if row['metacritic_score'] >= 90:
-                    reason_parts.append(f"Critically acclaimed (Metacritic score: {row['metacritic_score']})")
+        Returns:
+            Dict mapping user profile id to a list of (game, score, reason_codes) tuples
+        """
+        self.metrics = EngineMetrics('batch')
+        
+        user_profile_ids = list(user_profile_ids)
+        with user_refresh_locks(user_profile_ids) as locked_ids:
+            self.metrics.count('users', len(locked_ids))
+            self.metrics.count('locked_out', len(user_profile_ids) - len(locked_ids))
+            return self._generate_batch(locked_ids, limit, block_size)
+    
+    def _generate_batch(self, user_profile_ids, limit, block_size):
+        with self.metrics.stage('load_preferences'):
+            preferences = load_preferences(user_profile_ids)
+        with self.metrics.stage('catalog'):
+            catalog = get_catalog_features()
+        
+        # Users without any preferences just get their stale recommendations cleared
+        active_ids = [profile_id for profile_id in user_profile_ids if has_preferences(preferences[profile_id])]
+        
+        overflow_size = settings.RECOMMENDATION_OVERFLOW_SIZE
+        rated_rows = {
+            profile_id: catalog.rows_for(preferences[profile_id]['rated_game_ids']) for profile_id in active_ids
+        }
+        
+        # Users with identical preferences share one ranking, so only score
+        # each distinct fingerprint that is not cached yet
+        rankings = {}
+        unscored = {}
+        for profile_id in active_ids:
+            key = (preference_fingerprint(preferences[profile_id]), catalog.version)
+            depth = limit + overflow_size + len(rated_rows[profile_id])
+            if key in rankings and rankings[key].covers(depth):
+                continue
+            ranking = ranking_cache.get(key, depth)
+            if ranking is not None:
+                self.metrics.count('ranking_cache_hits')
+                rankings[key] = ranking
+            elif key not in unscored or unscored[key][1] < depth:
+                unscored[key] = (preferences[profile_id], depth)
+        
+        unscored_keys = list(unscored)
+        for start in range(0, len(unscored_keys), block_size):
+            block_keys = unscored_keys[start:start + block_size]
+            block_prefs = [unscored[key][0] for key in block_keys]
             
-            if row['user_score'] > 0:
-                # Normalize user score (0-10) to 0-1
-                quality_score += row['user_score'] / 10
-                if row['user_score'] >= 8:
-                    reason_parts.append(f"Highly rated by players (User score: {row['user_score']})")
+            with self.metrics.stage('scoring'):
+                scores, mask = self.score_catalog_batch(catalog, block_prefs)
+            self.metrics.count('candidates', mask.sum())
             
-            # Normalize quality score (average of available scores)
-            num_scores = (row['metacritic_score'] > 0) + (row['user_score'] > 0)
-            quality_score = quality_score / num_scores if num_scores > 0 else 0
+            with self.metrics.stage('ranking'):
+                for i, key in enumerate(block_keys):
+                    candidate_rows = np.flatnonzero(mask[i])
+                    rankings[key] = self.store_ranking(key, candidate_rows, scores[i, candidate_rows], unscored[key][1])
+        
+        with self.metrics.stage('blend'):
+            factor_model = self.factor_model()
+            also_liked = self.cooccurrence_signals(active_ids)
+        
+        with self.metrics.stage('ranking'):
+            ranked_rows = {}
+            for profile_id in active_ids:
+                ranking = rankings[(preference_fingerprint(preferences[profile_id]), catalog.version)]
+                keep = ~np.isin(ranking.rows, rated_rows[profile_id])
+                rows, scores = self.blend_signals(
+                    factor_model, also_liked[profile_id], catalog, profile_id, ranking.rows[keep], ranking.scores[keep]
+                )
+                ranked_rows[profile_id] = (
+                    rows[:limit + overflow_size], scores[:limit + overflow_size],
+                    ranking.complete and len(rows) <= limit + overflow_size
+                )
+        
+        with self.metrics.stage('build_results'):
+            # Load every kept game for the chunk in one query
+            games = Game.objects.in_bulk({
+                int(game_id) for rows, _, _ in ranked_rows.values() for game_id in catalog.game_ids[rows[:limit]]
+            })
             
-            # Calculate final score (weighted average)
-            score = 0.5 * genre_score + 0.3 * platform_score + 0.2 * quality_score
+            results = {}
+            overflow_states = {}
+            for profile_id in user_profile_ids:
+                prefs = preferences[profile_id]
+                if profile_id not in ranked_rows:
+                    results[profile_id] = []
+                    continue
+                
+                rows, scores, exhausted = ranked_rows[profile_id]
+                results[profile_id] = [
+                    (
+                        games[int(catalog.game_ids[row])],
+                        score,
+                        reason_codes(catalog, row, prefs['genre_prefs'], prefs['platform_prefs'])
+                    )
+                    for row, score in zip(rows[:limit].tolist(), scores[:limit].tolist())
+                    if int(catalog.game_ids[row]) in games
+                ]
+                overflow_states[overflow_cache_key(profile_id)] = overflow_state(
+                    prefs, catalog, catalog.game_ids[rows[limit:]], scores[limit:], exhausted
+                )
+        
+        with self.metrics.stage('overflow'):
+            cache.set_many(overflow_states, timeout=settings.RECOMMENDATION_OVERFLOW_TIMEOUT)
+        with self.metrics.stage('save'):
+            self.save_recommendations_batch(results)
+        return results
+    
+    def score_catalog_batch(self, catalog, block_prefs):
+        """
+        Score the whole catalog for a block of users.
+        
+        Args:
+            catalog: CatalogFeatures snapshot
+            block_prefs: List of preference dicts as returned by load_preferences
             
-            scores.append(score)
-            reasons.append(" • ".join(reason_parts[:3]))  # Limit to top 3 reasons
+        Returns:
+            Tuple of (users x games score matrix, users x games candidate mask
+            that does not exclude rated games)
+        """
+        genre_weights = np.vstack([
+            rank_weights([p.genre_id for p in prefs['genre_prefs']], catalog.genre_ids)
+            for prefs in block_prefs
+        ])
+        platform_weights = np.vstack([
+            rank_weights([p.platform_id for p in prefs['platform_prefs']], catalog.platform_ids)
+            for prefs in block_prefs
+        ])
         
-        # Add scores and reasons to DataFrame
-        df['score'] = scores
-        df['reason'] = reasons
+        # One (games x ids) @ (ids x users) multiply per feature
+        genre_scores = np.asarray(catalog.genre_matrix @ genre_weights.T).T
+        platform_scores = np.asarray(catalog.platform_matrix @ platform_weights.T).T
         
-        # Sort by score in descending order
-        df = df.sort_values('score', ascending=False)
+        scores = 0.5 * genre_scores + 0.3 * platform_scores + 0.2 * catalog.quality_scores
         
-        # Get top N recommendations
-        top_recommendations = df.head(limit)
+        mask = np.vstack([candidate_mask(catalog, prefs, exclude_rated=False) for prefs in block_prefs])
         
-        # Create recommendation objects
-        recommendation_results = []
+        return scores, mask
+    
+    def save_recommendations(self, user_profile, recommendation_results):
+        """
+        Persist a user's recommendations with a fixed number of queries.
         
-        for _, row in top_recommendations.iterrows():
-            game = Game.objects.get(id=row['id'])
+        Args:
+            user_profile: UserProfile object
+            recommendation_results: List of (game, score, reason_codes) tuples
             
-            # Create recommendation in database
-            recommendation = GameRecommendation.objects.create(
-                user_profile=user_profile,
-                game=game,
-                score=row['score'],
-                reason=row['reason']
+        Returns:
+            The recommendation_results list
+        """
+        self.save_recommendations_batch({user_profile.id: recommendation_results})
+        return recommendation_results
+    
+    def save_recommendations_batch(self, results_by_profile):
+        """
+        Persist recommendations for several users with a fixed number of queries.
+        
+        Each user's list is written under a newly claimed generation number
+        and made visible by flipping their RecommendationState pointer, so
+        readers see either the old list or the new one and no long
+        transaction is held:
+        
+        1. A generation number is claimed per user by atomically bumping
+           RecommendationState.next_generation, so no two writers share one.
+        2. Rows for newly recommended games are inserted under the new
+           generation, invisible to readers (reusing any superseded row
+           for the same game, but never a row another refresh is staging).
+        3. In one short transaction, each pointer is flipped only if all of
+           the user's new rows were written and it still holds the
+           generation this refresh started from, and for the users flipped,
+           rows of the current list that stay recommended move to the new
+           generation in place, keeping their interaction state and feedback.
+        
+        Rows of games that dropped out stay behind under the old generation,
+        and rows of a refresh that lost the flip or died before it stay above
+        the current one, until collect_stale_recommendations deletes them.
+        
+        Args:
+            results_by_profile: Dict mapping user profile id to a list of
+                (game, score, reason_codes) tuples
+        
+        Returns:
+            Set of the user profile ids whose new list was published
+        """
+        profile_ids = list(results_by_profile)
+        if not profile_ids:
+            return set()
+        generations = claim_generations(profile_ids)
+        
+        current_rows = {
+            (profile_id, game_id): rec_id
+            for rec_id, profile_id, game_id, generation in GameRecommendation.objects.filter(
+                user_profile_id__in=profile_ids
+            ).values_list('id', 'user_profile_id', 'game_id', 'generation')
+            if generation == generations[profile_id][0]
+        }
+        
+        new_rows = []
+        kept_rows = []
+        for profile_id, recommendation_results in results_by_profile.items():
+            for game, score, codes in recommendation_results:
+                recommendation = GameRecommendation(
+                    id=current_rows.get((profile_id, game.id)),
+                    user_profile_id=profile_id, game=game, score=score, reason='', reason_codes=codes,
+                    generation=generations[profile_id][1]
+                )
+                if recommendation.id is None:
+                    new_rows.append(recommendation)
+                else:
+                    kept_rows.append(recommendation)
+        self.metrics.count('recommendations', len(new_rows) + len(kept_rows))
+        
+        if new_rows:
+            GameRecommendation.objects.stage(new_rows)
+        
+        with transaction.atomic():
+            # Only publish lists whose new rows were all written; a row held
+            # by another refresh means that one owns the user right now
+            staged = Counter(
+                profile_id
+                for profile_id, generation in GameRecommendation.objects.filter(
+                    user_profile_id__in=profile_ids
+                ).values_list('user_profile_id', 'generation')
+                if generation == generations[profile_id][1]
+            )
+            expected = Counter(recommendation.user_profile_id for recommendation in new_rows)
+            published = flip_generations({
+                profile_id: claim for profile_id, claim in generations.items()
+                if staged[profile_id] == expected[profile_id]
+            })
+            kept_rows = [recommendation for recommendation in kept_rows if recommendation.user_profile_id in published]
+            if kept_rows:
+                GameRecommendation.objects.bulk_update(
+                    kept_rows, ['score', 'reason', 'reason_codes', 'generation'], batch_size=1000
+                )
+        
+        if len(published) < len(profile_ids):
+            logger.warning(
+                f"Another refresh wrote recommendations concurrently for "
+                f"{len(profile_ids) - len(published)} users; their new lists were not published"
             )
+        return published
+    
+    def score_candidates(self, catalog, rows, genre_prefs, platform_prefs):
+        """
+        Score candidate games with vectorized NumPy operations.
+        
+        Genre and platform memberships come from the catalog's sparse incidence
+        matrices (games x ids) and the ranked preferences become weight vectors,
+        so each partial score is a single matrix-vector product.
+        
+        Args:
+            catalog: CatalogFeatures snapshot
+            rows: Catalog row indices of the candidate games
+            genre_prefs: GenrePreference objects ordered by rank
+            platform_prefs: PlatformPreference objects ordered by rank
             
-            recommendation_results.append((game, row['score'], row['reason']))
+        Returns:
+            numpy array with one score per candidate row
+        """
+        genre_weights = rank_weights([p.genre_id for p in genre_prefs], catalog.genre_ids)
+        platform_weights = rank_weights([p.platform_id for p in platform_prefs], catalog.platform_ids)
+        
+        # Normalized (0-1) genre and platform scores
+        genre_scores = catalog.genre_matrix[rows] @ genre_weights
+        platform_scores = catalog.platform_matrix[rows] @ platform_weights
+        
+        # Calculate final score (weighted average)
+        return 0.5 * genre_scores + 0.3 * platform_scores + 0.2 * catalog.quality_scores[rows]
+
+
+def rank_weights(ranked_ids, vocabulary):
+    """
+    Turn ranked preference ids into a normalized weight vector over a vocabulary.
+    
+    The preference at rank i weighs 1 / (i + 1) and the vector is divided by
+    the best achievable total, so a game matching every preference scores 1.
+    Preferences missing from the vocabulary still count towards that total.
+    """
+    weights = np.zeros(len(vocabulary))
+    if not ranked_ids:
+        return weights
+    
+    column = {related_id: i for i, related_id in enumerate(vocabulary.tolist())}
+    for i, related_id in enumerate(ranked_ids):
+        if related_id in column:
+            weights[column[related_id]] = 1.0 / (i + 1)
+    
+    max_score = sum(1.0 / (i + 1) for i in range(len(ranked_ids)))
+    return weights / max_score
+
+
+def top_k(scores, k):
+    """
+    Select the indices of the k highest scores without a full sort.
+    
+    Uses argpartition to find the k-th best score in linear time and only
+    sorts the (at most k plus ties) entries at or above it. Ties are broken
+    by position, so equal scores keep their catalog order and the result is
+    deterministic.
+    
+    Args:
+        scores: 1-d numpy array of scores
+        k: Number of indices to return
+        
+    Returns:
+        numpy array of up to k indices ordered by descending score
+    """
+    n = len(scores)
+    if k <= 0 or n == 0:
+        return np.array([], dtype=np.int64)
+    
+    if k < n:
+        threshold = scores[np.argpartition(scores, n - k)[n - k:]].min()
+        selected = np.flatnonzero(scores >= threshold)
+    else:
+        selected = np.arange(n)
+    
+    order = np.lexsort((selected, -scores[selected]))
+    return selected[order[:k]]
+
+
+def candidate_mask(catalog, prefs, rows=None, exclude_rated=True):
+    """
+    Apply a user's candidate filters to catalog rows.
+    
+    The filters are: at least one preferred platform, the multiplayer /
+    free-to-play / in-app purchase preferences, and no games the user has
+    already rated. They are combined on the catalog's packed bitsets (eight
+    games per byte) and only unpacked at the end, so no query is needed.
+    
+    Args:
+        catalog: CatalogFeatures snapshot
+        prefs: Preference dict as returned by load_preferences
+        rows: Catalog row indices to check (defaults to the whole catalog)
+        exclude_rated: Whether to drop the games the user has rated
         
-        return recommendation_results 
\ No newline at end of file
+    Returns:
+        Boolean numpy array aligned with rows
+    """
+    bits = np.full(catalog.platform_bits.shape[1], 0xFF, dtype=np.uint8)
+    
+    if prefs['platform_prefs']:
+        # A game passes if it is on any preferred platform
+        preferred = np.isin(catalog.platform_ids, [p.platform_id for p in prefs['platform_prefs']])
+        bits &= np.bitwise_or.reduce(catalog.platform_bits[preferred], axis=0)
+    
+    game_prefs = prefs['game_prefs']
+    if game_prefs and game_prefs.prefers_multiplayer is not None:
+        flag = catalog.flag_bits['is_multiplayer']
+        bits &= flag if game_prefs.prefers_multiplayer else ~flag
+    
+    if game_prefs and game_prefs.willing_to_pay == 'free_only':
+        bits &= catalog.flag_bits['is_free_to_play']
+    
+    if game_prefs and game_prefs.accepts_in_app_purchases is not None:
+        flag = catalog.flag_bits['has_in_app_purchases']
+        bits &= flag if game_prefs.accepts_in_app_purchases else ~flag
+    
+    mask = catalog.unpack(bits)
+    if rows is None:
+        rows = np.arange(len(catalog))
+    else:
+        mask = mask[rows]
+    
+    if exclude_rated:
+        mask &= ~np.isin(rows, catalog.rows_for(prefs['rated_game_ids']))
+    return mask
+
+
+def has_preferences(prefs):
+    """Whether a user has answered enough of the survey to be scored."""
+    return bool(prefs['genre_prefs'] or prefs['platform_prefs'] or prefs['game_prefs'])
+
+
+def preference_fingerprint(prefs):
+    """
+    Canonical hash of every preference input that affects scoring.
+    
+    Two users with the same fingerprint get identical scores for every game
+    before their rated games are excluded.
+    """
+    game_prefs = prefs['game_prefs']
+    key = {
+        'genres': [p.genre_id for p in prefs['genre_prefs']],
+        'platforms': [p.platform_id for p in prefs['platform_prefs']],
+        'has_game_prefs': game_prefs is not None,
+        'multiplayer': game_prefs.prefers_multiplayer if game_prefs else None,
+        'free_only': bool(game_prefs and game_prefs.willing_to_pay == 'free_only'),
+        'in_app_purchases': game_prefs.accepts_in_app_purchases if game_prefs else None,
+    }
+    return hashlib.sha1(json.dumps(key, sort_keys=True).encode()).hexdigest()
+
+
+def overflow_cache_key(user_profile_id):
+    return f'recommendations:overflow:{user_profile_id}'
+
+
+def overflow_state(prefs, catalog, game_ids, scores, exhausted):
+    """
+    Build the cached state an incremental update starts from.
+    
+    Args:
+        prefs: Preference dict the list was computed from
+        catalog: CatalogFeatures snapshot the list was scored against
+        game_ids: Ranked ids of the candidates just below the kept list
+        scores: Scores matching game_ids
+        exhausted: True when the overflow holds every remaining candidate
+    """
+    return {
+        'fingerprint': preference_fingerprint(prefs),
+        'catalog_version': catalog.version,
+        'rated_game_ids': list(prefs['rated_game_ids']),
+        'overflow': [(int(game_id), float(score)) for game_id, score in zip(game_ids, scores)],
+        'exhausted': exhausted,
+    }
+
+
+def store_overflow(user_profile_id, prefs, catalog, game_ids, scores, exhausted):
+    """Cache the overflow candidates of a user's latest ranking."""
+    cache.set(
+        overflow_cache_key(user_profile_id),
+        overflow_state(prefs, catalog, game_ids, scores, exhausted),
+        timeout=settings.RECOMMENDATION_OVERFLOW_TIMEOUT
+    )
+
+
+def claim_generations(profile_ids):
+    """
+    Atomically claim the next recommendation generation for each user.
+    
+    The counters are bumped with a single UPDATE, so concurrent writers for
+    the same user always get distinct numbers.
+    
+    Args:
+        profile_ids: IDs of the UserProfiles about to be written
+        
+    Returns:
+        Dict mapping user profile id to a (current generation, claimed
+        generation) tuple
+    """
+    with transaction.atomic():
+        RecommendationState.objects.bulk_create(
+            [RecommendationState(user_profile_id=profile_id) for profile_id in profile_ids],
+            ignore_conflicts=True,
+        )
+        states = RecommendationState.objects.filter(user_profile_id__in=profile_ids)
+        states.update(next_generation=F('next_generation') + 1)
+        return {
+            profile_id: (current, claimed)
+            for profile_id, current, claimed in states.values_list(
+                'user_profile_id', 'current_generation', 'next_generation'
+            )
+        }
+
+
+def flip_generations(generations):
+    """
+    Point readers at the claimed generations, unless someone got there first.
+    
+    Each pointer only moves if it still holds the generation the refresh
+    started from; call inside a transaction together with the row updates.
+    
+    Args:
+        generations: Dict as returned by claim_generations
+        
+    Returns:
+        Set of the user profile ids whose pointer was flipped
+    """
+    profile_ids = list(generations)
+    for start in range(0, len(profile_ids), FLIP_CHUNK_SIZE):
+        chunk = profile_ids[start:start + FLIP_CHUNK_SIZE]
+        RecommendationState.objects.filter(reduce(or_, [
+            Q(user_profile_id=profile_id, current_generation=generations[profile_id][0]) for profile_id in chunk
+        ])).update(
+            current_generation=Case(*[
+                When(user_profile_id=profile_id, then=Value(generations[profile_id][1])) for profile_id in chunk
+            ]),
+            updated_at=timezone.now(),
+        )
+    
+    return {
+        profile_id
+        for profile_id, current in RecommendationState.objects.filter(user_profile_id__in=profile_ids)
+        .values_list('user_profile_id', 'current_generation')
+        if current == generations[profile_id][1]
+    }
+
+
+def load_preferences(user_profile_ids):
+    """
+    Load everything the engine needs about a chunk of users in four queries.
+    
+    Args:
+        user_profile_ids: IDs of the UserProfiles to load
+        
+    Returns:
+        Dict mapping user profile id to a dict with 'genre_prefs' and
+        'platform_prefs' (ordered by rank), 'game_prefs' (or None) and
+        'rated_game_ids'
+    """
+    preferences = {
+        profile_id: {'genre_prefs': [], 'platform_prefs': [], 'game_prefs': None, 'rated_game_ids': []}
+        for profile_id in user_profile_ids
+    }
+    
+    genre_prefs = GenrePreference.objects.filter(
+        user_profile_id__in=user_profile_ids
+    ).order_by('user_profile_id', 'rank')
+    for pref in genre_prefs:
+        preferences[pref.user_profile_id]['genre_prefs'].append(pref)
+    
+    platform_prefs = PlatformPreference.objects.filter(
+        user_profile_id__in=user_profile_ids
+    ).order_by('user_profile_id', 'rank')
+    for pref in platform_prefs:
+        preferences[pref.user_profile_id]['platform_prefs'].append(pref)
+    
+    for game_prefs in UserGamePreferences.objects.filter(user_profile_id__in=user_profile_ids):
+        preferences[game_prefs.user_profile_id]['game_prefs'] = game_prefs
+    
+    ratings = GameRating.objects.filter(user_profile_id__in=user_profile_ids).values_list('user_profile_id', 'game_id')
+    for profile_id, game_id in ratings:
+        preferences[profile_id]['rated_game_ids'].append(game_id)
+    
+    return preferences
@@ -0,0 +1,298 @@
+import logging
+import threading
+import numpy as np
+from scipy import sparse
+from django.conf import settings
+
+from games.models import Game, Genre, Platform
+from games.utils.catalog_version import get_catalog_version
+
+
+logger = logging.getLogger(__name__)
+
+
+class CatalogFeatures:
+    """
+    Column-oriented snapshot of the game catalog used for scoring.
+
+    Rows follow the default Game ordering. Genre and platform memberships are
+    stored as sparse CSR incidence matrices (games x ids) and the per-game
+    attributes as NumPy columns, so scoring never touches the ORM.
+
+    For candidate filtering, the boolean characteristics and each platform's
+    membership are also kept as packed bitsets (one bit per game), so a
+    user's candidate mask is a handful of byte-wise AND/OR operations.
+    """
+
+    def __init__(self, version, game_ids, genre_ids, platform_ids, genre_matrix, platform_matrix,
+                 metacritic_scores, user_scores, is_multiplayer, is_free_to_play, has_in_app_purchases):
+        self.version = version
+        self.game_ids = game_ids
+        self.genre_ids = genre_ids
+        self.platform_ids = platform_ids
+        self.genre_matrix = genre_matrix
+        self.platform_matrix = platform_matrix
+        self.metacritic_scores = metacritic_scores
+        self.user_scores = user_scores
+        self.is_multiplayer = is_multiplayer
+        self.is_free_to_play = is_free_to_play
+        self.has_in_app_purchases = has_in_app_purchases
+
+        # Quality does not depend on the user, so compute it once per catalog
+        self.quality_scores = quality_score(metacritic_scores, user_scores)
+
+        # Packed bitsets: platform_bits[i] has the bit of every game on the
+        # i-th platform, flag_bits[name] the bit of every game with that flag
+        platform_links = platform_matrix.tocoo()
+        platform_members = np.zeros((len(platform_ids), len(game_ids)), dtype=bool)
+        platform_members[platform_links.col, platform_links.row] = True
+        self.platform_bits = np.packbits(platform_members, axis=1)
+        self.flag_bits = {
+            'is_multiplayer': np.packbits(is_multiplayer),
+            'is_free_to_play': np.packbits(is_free_to_play),
+            'has_in_app_purchases': np.packbits(has_in_app_purchases),
+        }
+
+        # Sorted view of the ids for vectorized id -> row lookups
+        self._id_order = np.argsort(game_ids, kind='stable')
+        self._sorted_ids = game_ids[self._id_order]
+
+    def __len__(self):
+        return len(self.game_ids)
+
+    def to_arrays(self):
+        """
+        Return every array of the store, including the derived ones.
+
+        Sparse matrices are split into their CSR data/indices/indptr arrays,
+        so the result can be written out as plain .npy files.
+        """
+        arrays = {
+            'game_ids': self.game_ids,
+            'genre_ids': self.genre_ids,
+            'platform_ids': self.platform_ids,
+            'metacritic_scores': self.metacritic_scores,
+            'user_scores': self.user_scores,
+            'is_multiplayer': self.is_multiplayer,
+            'is_free_to_play': self.is_free_to_play,
+            'has_in_app_purchases': self.has_in_app_purchases,
+            'quality_scores': self.quality_scores,
+            'id_order': self._id_order,
+            'sorted_ids': self._sorted_ids,
+            'platform_bits': self.platform_bits,
+        }
+        for name, matrix in [('genre', self.genre_matrix), ('platform', self.platform_matrix)]:
+            arrays[f'{name}_data'] = matrix.data
+            arrays[f'{name}_indices'] = matrix.indices
+            arrays[f'{name}_indptr'] = matrix.indptr
+        for name, bits in self.flag_bits.items():
+            arrays[f'{name}_bits'] = bits
+        return arrays
+
+    @classmethod
+    def from_arrays(cls, version, arrays):
+        """
+        Rebuild a store from the output of to_arrays without recomputing anything.
+
+        The arrays are used as they are, so memory-mapped arrays stay
+        memory-mapped and are shared with every other process mapping them.
+        """
+        catalog = cls.__new__(cls)
+        catalog.version = version
+        for name in ['game_ids', 'genre_ids', 'platform_ids', 'metacritic_scores', 'user_scores',
+                     'is_multiplayer', 'is_free_to_play', 'has_in_app_purchases', 'quality_scores', 'platform_bits']:
+            setattr(catalog, name, arrays[name])
+        catalog._id_order = arrays['id_order']
+        catalog._sorted_ids = arrays['sorted_ids']
+
+        for name, ids in [('genre', catalog.genre_ids), ('platform', catalog.platform_ids)]:
+            setattr(catalog, f'{name}_matrix', sparse.csr_matrix(
+                (arrays[f'{name}_data'], arrays[f'{name}_indices'], arrays[f'{name}_indptr']),
+                shape=(len(catalog.game_ids), len(ids)),
+                copy=False
+            ))
+        catalog.flag_bits = {
+            name: arrays[f'{name}_bits'] for name in ['is_multiplayer', 'is_free_to_play', 'has_in_app_purchases']
+        }
+        return catalog
+
+    @classmethod
+    def build(cls, version=None):
+        """
+        Build the feature store from the database in a fixed number of queries.
+
+        Args:
+            version: Catalog version stamp to record (defaults to the current one)
+
+        Returns:
+            CatalogFeatures instance
+        """
+        if version is None:
+            version = get_catalog_version()
+
+        rows = list(Game.objects.values_list(
+            'id', 'metacritic_score', 'user_score',
+            'is_multiplayer', 'is_free_to_play', 'has_in_app_purchases'
+        ))
+        game_ids = np.array([row[0] for row in rows], dtype=np.int64)
+        row_of = {game_id: i for i, game_id in enumerate(game_ids.tolist())}
+
+        genre_ids = np.array(sorted(Genre.objects.values_list('id', flat=True)), dtype=np.int64)
+        platform_ids = np.array(sorted(Platform.objects.values_list('id', flat=True)), dtype=np.int64)
+
+        genre_matrix = _link_matrix(
+            Game.genres.through.objects.values_list('game_id', 'genre_id'), row_of, genre_ids
+        )
+        platform_matrix = _link_matrix(
+            Game.platforms.through.objects.values_list('game_id', 'platform_id'), row_of, platform_ids
+        )
+
+        catalog = cls(
+            version=version,
+            game_ids=game_ids,
+            genre_ids=genre_ids,
+            platform_ids=platform_ids,
+            genre_matrix=genre_matrix,
+            platform_matrix=platform_matrix,
+            metacritic_scores=np.array([row[1] or 0 for row in rows], dtype=float),
+            user_scores=np.array([row[2] or 0 for row in rows], dtype=float),
+            is_multiplayer=np.array([row[3] for row in rows], dtype=bool),
+            is_free_to_play=np.array([row[4] for row in rows], dtype=bool),
+            has_in_app_purchases=np.array([row[5] for row in rows], dtype=bool),
+        )
+        logger.info(f"Built catalog features for {len(catalog)} games (version {version})")
+        return catalog
+
+    def row_index(self, game_ids):
+        """
+        Map game ids to catalog row indices, keeping their order.
+
+        Returns:
+            numpy array aligned with game_ids, -1 where an id is not part of
+            this snapshot
+        """
+        game_ids = np.asarray(list(game_ids), dtype=np.int64)
+        rows = np.full(len(game_ids), -1, dtype=np.int64)
+        if not len(game_ids) or not len(self):
+            return rows
+
+        positions = np.minimum(np.searchsorted(self._sorted_ids, game_ids), len(self._sorted_ids) - 1)
+        found = self._sorted_ids[positions] == game_ids
+        rows[found] = self._id_order[positions[found]]
+        return rows
+
+    def rows_for(self, game_ids):
+        """
+        Map game ids to catalog row indices.
+
+        Ids that are not part of this snapshot are skipped.
+
+        Returns:
+            Sorted numpy array of row indices
+        """
+        rows = self.row_index(game_ids)
+        return np.sort(rows[rows >= 0])
+
+    def unpack(self, bits):
+        """Turn a packed bitset into a boolean array with one entry per row."""
+        return np.unpackbits(bits, count=len(self)).astype(bool)
+
+    def genres_of(self, row):
+        """Return the genre ids of the game at a catalog row."""
+        return self.genre_ids[self.genre_matrix.indices[self.genre_matrix.indptr[row]:self.genre_matrix.indptr[row + 1]]]
+
+    def platforms_of(self, row):
+        """Return the platform ids of the game at a catalog row."""
+        return self.platform_ids[self.platform_matrix.indices[self.platform_matrix.indptr[row]:self.platform_matrix.indptr[row + 1]]]
+
+
+def _link_matrix(links, row_of, vocabulary):
+    """Build a CSR incidence matrix from (game_id, related_id) pairs."""
+    column_of = {related_id: i for i, related_id in enumerate(vocabulary.tolist())}
+
+    rows = []
+    columns = []
+    for game_id, related_id in links:
+        if game_id in row_of and related_id in column_of:
+            rows.append(row_of[game_id])
+            columns.append(column_of[related_id])
+
+    matrix = sparse.csr_matrix(
+        (np.ones(len(rows)), (rows, columns)),
+        shape=(len(row_of), len(vocabulary))
+    )
+    matrix.sum_duplicates()
+    matrix.sort_indices()
+    return matrix
+
+
+def quality_score(metacritic_scores, user_scores):
+    """
+    Vectorized quality score: the average of the available normalized scores.
+
+    Metacritic (0-100) and user scores (0-10) are both scaled to 0-1; missing
+    or zero scores are left out of the average.
+    """
+    has_metacritic = metacritic_scores > 0
+    has_user_score = user_scores > 0
+
+    total = np.where(has_metacritic, metacritic_scores / 100, 0) + np.where(has_user_score, user_scores / 10, 0)
+    num_scores = has_metacritic.astype(int) + has_user_score.astype(int)
+
+    return np.divide(total, num_scores, out=np.zeros_like(total), where=num_scores > 0)
+
+
+_catalog = None
+_catalog_lock = threading.Lock()
+
+
+def get_catalog_features():
+    """
+    Get the worker's catalog feature store, rebuilding it only when stale.
+
+    The store is built once per process and kept until the shared catalog
+    version stamp moves (any Game, Genre or Platform change bumps it). When
+    RECOMMENDATION_CATALOG_ARTIFACT is on, it is memory-mapped from the
+    versioned artifact instead, so processes on a node share one copy.
+
+    Returns:
+        CatalogFeatures instance
+    """
+    global _catalog
+
+    version = get_catalog_version()
+    catalog = _catalog
+    if catalog is not None and catalog.version == version:
+        return catalog
+
+    with _catalog_lock:
+        if _catalog is None or _catalog.version != version:
+            _catalog = _load_or_build(version)
+        return _catalog
+
+
+def _load_or_build(version):
+    """
+    Get the store for a catalog version, sharing it through the on-disk artifact if enabled.
+
+    The first process to need a version builds it from the database and
+    publishes it; every other process memory-maps the published files.
+    """
+    if not settings.RECOMMENDATION_CATALOG_ARTIFACT:
+        return CatalogFeatures.build(version)
+
+    from .artifact import load_catalog_artifact, write_catalog_artifact
+
+    catalog = load_catalog_artifact(version)
+    if catalog is not None:
+        return catalog
+
+    catalog = CatalogFeatures.build(version)
+    try:
+        write_catalog_artifact(catalog)
+    except OSError as e:
+        logger.warning(f"Could not write catalog artifact for version {version}: {str(e)}")
+        return catalog
+
+    # Switch to the mapped copy so this process shares it too
+    return load_catalog_artifact(version) or catalog
@@ -0,0 +1,91 @@
+import json
+import logging
+import time
+from collections import defaultdict
+from contextlib import contextmanager
+
+from django.conf import settings
+from django.db import connection
+from django.utils.module_loading import import_string
+
+
+logger = logging.getLogger(__name__)
+
+
+class EngineMetrics:
+    """
+    Per-stage wall time and query counts for one engine operation.
+
+    Stages are flat (never nested), so their times add up to the time spent
+    inside instrumented code. Counters hold sizes such as the number of
+    candidates scored.
+    """
+
+    def __init__(self, operation=None):
+        self.operation = operation
+        self.stages = {}
+        self.counts = defaultdict(int)
+        self._started = time.perf_counter()
+
+    @contextmanager
+    def stage(self, name):
+        """Time a block and count the database queries it runs."""
+        queries = [0]
+
+        def count_query(execute, sql, params, many, context):
+            queries[0] += 1
+            return execute(sql, params, many, context)
+
+        start = time.perf_counter()
+        try:
+            with connection.execute_wrapper(count_query):
+                yield
+        finally:
+            stage = self.stages.setdefault(name, {'seconds': 0.0, 'queries': 0, 'calls': 0})
+            stage['seconds'] += time.perf_counter() - start
+            stage['queries'] += queries[0]
+            stage['calls'] += 1
+
+    def count(self, name, value=1):
+        self.counts[name] += int(value)
+
+    def as_dict(self):
+        """Return the metrics as plain JSON-serializable data."""
+        return {
+            'operation': self.operation,
+            'total_seconds': round(time.perf_counter() - self._started, 6),
+            'total_queries': sum(stage['queries'] for stage in self.stages.values()),
+            'stages': {
+                name: {**stage, 'seconds': round(stage['seconds'], 6)}
+                for name, stage in self.stages.items()
+            },
+            'counts': dict(self.counts),
+        }
+
+
+def emit_metrics(metrics, **context):
+    """
+    Report an operation's metrics as a structured log line and to the sink.
+
+    The sink is the callable named by RECOMMENDATION_METRICS_SINK (a dotted
+    path, or None to disable); it receives the metrics dict. A failing sink
+    is logged and never breaks the caller.
+
+    Args:
+        metrics: EngineMetrics instance
+        **context: Extra fields for the log line (e.g. user_profile_id)
+
+    Returns:
+        The metrics dict
+    """
+    data = {**metrics.as_dict(), **context}
+    logger.info(f"recommendation_metrics {json.dumps(data, sort_keys=True)}")
+
+    sink_path = getattr(settings, 'RECOMMENDATION_METRICS_SINK', None)
+    if sink_path:
+        try:
+            import_string(sink_path)(data)
+        except Exception as e:
+            logger.exception(f"Error sending recommendation metrics to {sink_path}: {str(e)}")
+
+    return data
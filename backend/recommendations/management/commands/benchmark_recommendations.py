@@ -0,0 +1,130 @@
+import json
+import platform
+import time
+from datetime import datetime, timezone
+
+import numpy as np
+from django.core.management.base import BaseCommand
+from django.db import connection
+from django.test.utils import override_settings
+
+from recommendations.benchmark import create_synthetic_dataset, run_benchmark
+
+
+# Keep the benchmark's cache entries (catalog version, overflow state, locks)
+# away from the shared cache the running workers use
+BENCHMARK_CACHES = {
+    'default': {
+        'BACKEND': 'django.core.cache.backends.locmem.LocMemCache',
+        'LOCATION': 'recommendations-benchmark',
+    }
+}
+
+
+class Command(BaseCommand):
+    help = 'Benchmark recommendation generation on synthetic catalogs in a throwaway database'
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--games',
+            type=int,
+            nargs='+',
+            default=[1_000, 10_000, 100_000],
+            help='Catalog sizes to benchmark',
+        )
+        parser.add_argument(
+            '--users',
+            type=int,
+            default=200,
+            help='Number of synthetic users per catalog',
+        )
+        parser.add_argument(
+            '--ratings-per-user',
+            type=int,
+            default=10,
+            help='Average number of ratings per user',
+        )
+        parser.add_argument(
+            '--samples',
+            type=int,
+            default=20,
+            help='Number of users timed on the single-user and task paths',
+        )
+        parser.add_argument(
+            '--batch-size',
+            type=int,
+            default=100,
+            help='Number of users per batch on the batch path',
+        )
+        parser.add_argument(
+            '--seed',
+            type=int,
+            default=0,
+            help='Random seed for the synthetic data',
+        )
+        parser.add_argument(
+            '--output',
+            help='Write the JSON report to this file instead of stdout',
+        )
+
+    def handle(self, *args, **options):
+        report = {
+            'generated_at': datetime.now(timezone.utc).isoformat(),
+            'environment': {
+                'python': platform.python_version(),
+                'numpy': np.__version__,
+                'database': connection.vendor,
+            },
+            'config': {
+                key: options[key]
+                for key in ['games', 'users', 'ratings_per_user', 'samples', 'batch_size', 'seed']
+            },
+            'results': [],
+        }
+
+        for num_games in options['games']:
+            self.stderr.write(f"Benchmarking {num_games:,} games and {options['users']:,} users...")
+            report['results'].append(self._benchmark_catalog(num_games, options))
+
+        output = json.dumps(report, indent=2)
+        if options['output']:
+            with open(options['output'], 'w') as f:
+                f.write(output + '\n')
+            self.stderr.write(self.style.SUCCESS(f"Benchmark report written to {options['output']}"))
+        else:
+            self.stdout.write(output)
+
+    def _benchmark_catalog(self, num_games, options):
+        """Run the benchmark for one catalog size in a fresh test database."""
+        old_name = connection.settings_dict['NAME']
+        connection.creation.create_test_db(verbosity=0, autoclobber=True, serialize=False)
+
+        try:
+            with override_settings(CACHES=BENCHMARK_CACHES):
+                start = time.perf_counter()
+                profile_ids = create_synthetic_dataset(
+                    num_games, options['users'], options['ratings_per_user'], seed=options['seed']
+                )
+                setup_seconds = time.perf_counter() - start
+
+                stages = run_benchmark(
+                    profile_ids,
+                    samples=options['samples'],
+                    batch_size=options['batch_size'],
+                    seed=options['seed'],
+                )
+        finally:
+            connection.creation.destroy_test_db(old_name, verbosity=0)
+
+        for name, stage in stages.items():
+            self.stderr.write(
+                f"  {name:<14} p50 {stage['p50_ms']:>10.2f}ms  p95 {stage['p95_ms']:>10.2f}ms  "
+                f"{stage['queries_p50']:>4} queries  {stage['peak_memory_mb']:>8.2f}MB peak"
+            )
+
+        return {
+            'games': num_games,
+            'users': len(profile_ids),
+            'setup_seconds': round(setup_seconds, 3),
+            'stages': stages,
+        }
@@ -0,0 +1,66 @@
+import time
+import numpy as np
+import pandas as pd
+from django.core.management.base import BaseCommand
+
+from recommendations.engine import top_k
+
+
+class Command(BaseCommand):
+    help = 'Benchmark partial top-k selection against a full DataFrame sort'
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--sizes',
+            type=int,
+            nargs='+',
+            default=[10_000, 100_000, 1_000_000],
+            help='Candidate counts to benchmark',
+        )
+        parser.add_argument(
+            '--limit',
+            type=int,
+            default=20,
+            help='Number of recommendations to keep',
+        )
+        parser.add_argument(
+            '--repeat',
+            type=int,
+            default=5,
+            help='Number of timed runs per size (the best run is reported)',
+        )
+
+    def handle(self, *args, **options):
+        limit = options['limit']
+        repeat = options['repeat']
+        rng = np.random.default_rng(0)
+
+        self.stdout.write(f"{'candidates':>12} {'sort_values':>14} {'top_k':>10} {'speedup':>9}")
+
+        for size in options['sizes']:
+            # Scores are built from a handful of rank weights, so ties are common
+            scores = np.round(rng.random(size), 3)
+            df = pd.DataFrame({'id': np.arange(size), 'score': scores})
+
+            sort_time = self._best_time(lambda: df.sort_values('score', ascending=False).head(limit), repeat)
+            top_k_time = self._best_time(lambda: top_k(scores, limit), repeat)
+
+            # Both must keep the same scores
+            expected = df.sort_values('score', ascending=False).head(limit)['score'].to_numpy()
+            if not np.array_equal(np.sort(scores[top_k(scores, limit)])[::-1], expected):
+                self.stdout.write(self.style.ERROR(f'top_k disagrees with sort_values at {size} candidates'))
+
+            self.stdout.write(
+                f"{size:>12,} {sort_time * 1000:>12.2f}ms {top_k_time * 1000:>8.2f}ms "
+                f"{sort_time / top_k_time:>8.1f}x"
+            )
+
+        self.stdout.write(self.style.SUCCESS('Benchmark completed'))
+
+    def _best_time(self, func, repeat):
+        best = float('inf')
+        for _ in range(repeat):
+            start = time.perf_counter()
+            func()
+            best = min(best, time.perf_counter() - start)
+        return best
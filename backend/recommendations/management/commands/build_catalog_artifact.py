@@ -0,0 +1,17 @@
+from django.core.management.base import BaseCommand
+
+from games.utils.catalog_version import get_catalog_version
+from recommendations.artifact import read_current_version, write_catalog_artifact
+from recommendations.features import CatalogFeatures
+
+
+class Command(BaseCommand):
+    help = 'Build the catalog feature arrays and publish them as a memory-mappable artifact'
+
+    def handle(self, *args, **options):
+        catalog = CatalogFeatures.build(get_catalog_version())
+        path = write_catalog_artifact(catalog)
+
+        self.stdout.write(f"Catalog version {catalog.version}: {len(catalog)} games written to {path}")
+        self.stdout.write(f"Current published version: {read_current_version()}")
+        self.stdout.write(self.style.SUCCESS('Catalog artifact built'))
@@ -0,0 +1,11 @@
+from django.core.management.base import BaseCommand
+
+from recommendations.cooccurrence import rebuild_cooccurrence
+
+
+class Command(BaseCommand):
+    help = 'Recount the "players who liked X also liked Y" pairs from all ratings and favorites'
+
+    def handle(self, *args, **options):
+        pairs = rebuild_cooccurrence()
+        self.stdout.write(self.style.SUCCESS(f"Rebuilt co-occurrence index with {pairs} pairs"))
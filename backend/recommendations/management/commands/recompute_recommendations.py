@@ -0,0 +1,47 @@
+import os
+
+from django.core.management.base import BaseCommand
+
+from recommendations.sharding import recompute_all
+
+
+class Command(BaseCommand):
+    help = "Regenerate every surveyed user's recommendations in parallel shards"
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--workers',
+            type=int,
+            default=os.cpu_count() or 1,
+            help='Number of worker processes (defaults to the number of CPUs)',
+        )
+        parser.add_argument(
+            '--shard-size',
+            type=int,
+            help='Profiles per shard (defaults to RECOMMENDATION_BATCH_SIZE)',
+        )
+        parser.add_argument(
+            '--batch-size',
+            type=int,
+            help='Users per scoring batch and bulk write (defaults to RECOMMENDATION_BATCH_SIZE)',
+        )
+
+    def handle(self, *args, **options):
+        def progress(shard):
+            self.stdout.write(
+                f"Shard {shard['first_id']}-{shard['last_id']}: {shard['users']} users, "
+                f"{shard['recommendations']} recommendations in {shard['seconds']:.2f}s"
+            )
+
+        totals = recompute_all(
+            workers=options['workers'],
+            shard_size=options['shard_size'],
+            batch_size=options['batch_size'],
+            progress=progress,
+        )
+
+        self.stdout.write(self.style.SUCCESS(
+            f"Recomputed {totals['recommendations']} recommendations for {totals['users']} users "
+            f"in {totals['shards']} shards: {totals['seconds']:.2f}s, "
+            f"{totals['users_per_second']:.1f} users/sec with {options['workers']} workers"
+        ))
@@ -0,0 +1,18 @@
+# Generated by Django 4.2.7 on 2026-10-18 04:30
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('recommendations', '0001_initial'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='gamerecommendation',
+            name='reason_codes',
+            field=models.JSONField(blank=True, default=list),
+        ),
+    ]
@@ -0,0 +1,27 @@
+# Generated by Django 4.2.7 on 2026-10-18 09:12
+
+from django.db import migrations, models
+import django.db.models.deletion
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('games', '0002_gameimage_game_cached_image'),
+        ('recommendations', '0003_recommendation_generations'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='GameCooccurrence',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('count', models.IntegerField(default=0)),
+                ('game', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='+', to='games.game')),
+                ('other_game', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='+', to='games.game')),
+            ],
+            options={
+                'unique_together': {('game', 'other_game')},
+            },
+        ),
+    ]
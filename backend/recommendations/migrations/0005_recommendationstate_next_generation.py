@@ -0,0 +1,39 @@
+from django.db import migrations, models
+from django.db.models import Max
+from django.db.models.functions import Greatest
+
+
+def start_after_written_generations(apps, schema_editor):
+    """Start each counter above every generation already written, including unpublished ones."""
+    GameRecommendation = apps.get_model('recommendations', 'GameRecommendation')
+    RecommendationState = apps.get_model('recommendations', 'RecommendationState')
+
+    written = dict(
+        GameRecommendation.objects.values('user_profile_id').annotate(last=Max('generation'))
+        .values_list('user_profile_id', 'last')
+    )
+    RecommendationState.objects.bulk_create(
+        [RecommendationState(user_profile_id=profile_id) for profile_id in written],
+        ignore_conflicts=True,
+    )
+    RecommendationState.objects.update(next_generation=models.F('current_generation'))
+    for profile_id, last in written.items():
+        RecommendationState.objects.filter(user_profile_id=profile_id).update(
+            next_generation=Greatest('current_generation', models.Value(last))
+        )
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('recommendations', '0004_gamecooccurrence'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='recommendationstate',
+            name='next_generation',
+            field=models.PositiveIntegerField(default=0),
+        ),
+        migrations.RunPython(start_after_written_generations, migrations.RunPython.noop),
+    ]
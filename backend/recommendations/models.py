@@ -1,14 +1,98 @@
-from django.db import models
+from django.db import connections, models
+from django.db.models import OuterRef, Subquery, Value
+from django.db.models.functions import Coalesce
+from django.db.models.signals import m2m_changed, post_delete, post_save, pre_save
+from django.dispatch import receiver
 from games.models import Game
-from users.models import UserProfile
+from users.models import GameRating, UserProfile
+
+
+class GameRecommendationQuerySet(models.QuerySet):
+    def current(self):
+        """Only the recommendations of each user's current generation."""
+        current_generation = RecommendationState.objects.filter(
+            user_profile=OuterRef('user_profile')
+        ).values('current_generation')
+        return self.filter(generation=Coalesce(Subquery(current_generation), Value(0)))
+    
+    def stale(self):
+        """Recommendations superseded by a newer generation (safe to delete)."""
+        current_generation = RecommendationState.objects.filter(
+            user_profile=OuterRef('user_profile')
+        ).values('current_generation')
+        return self.filter(generation__lt=Coalesce(Subquery(current_generation), Value(0)))
+    
+    def orphaned(self):
+        """
+        Recommendations written above the current generation.
+        
+        These belong either to a refresh that is still running or to one that
+        died before flipping the pointer; only the latter are safe to delete,
+        so callers must hold the user's refresh lock.
+        """
+        current_generation = RecommendationState.objects.filter(
+            user_profile=OuterRef('user_profile')
+        ).values('current_generation')
+        return self.filter(generation__gt=Coalesce(Subquery(current_generation), Value(0)))
+    
+    def stage(self, recommendations, batch_size=1000):
+        """
+        Upsert the rows of a refresh that is not published yet.
+        
+        An existing row for the same user and game is only taken over when
+        it is below the user's current generation, i.e. superseded. Rows of
+        the current list and rows another refresh is staging above it are
+        left alone, so the caller must check which rows it actually wrote.
+        
+        Args:
+            recommendations: Unsaved GameRecommendation instances
+            batch_size: Maximum number of rows per statement
+        """
+        connection = connections[self.db]
+        quote = connection.ops.quote_name
+        fields = [field for field in self.model._meta.concrete_fields if not field.primary_key]
+        table = quote(self.model._meta.db_table)
+        state_table = quote(RecommendationState._meta.db_table)
+        batch_size = min(batch_size, connection.ops.bulk_batch_size(fields, recommendations) or batch_size)
+        
+        sql = (
+            f"INSERT INTO {table} ({', '.join(quote(field.column) for field in fields)}) VALUES {{values}} "
+            f"ON CONFLICT ({quote('user_profile_id')}, {quote('game_id')}) DO UPDATE SET "
+            + ', '.join(
+                f"{quote(column)} = excluded.{quote(column)}"
+                for column in ['score', 'reason', 'reason_codes', 'generation']
+            )
+            + f" WHERE {table}.{quote('generation')} < COALESCE(("
+            f"SELECT {quote('current_generation')} FROM {state_table} "
+            f"WHERE {state_table}.{quote('user_profile_id')} = {table}.{quote('user_profile_id')}), 0)"
+        )
+        row_placeholder = f"({', '.join(['%s'] * len(fields))})"
+        with connection.cursor() as cursor:
+            for start in range(0, len(recommendations), batch_size):
+                batch = recommendations[start:start + batch_size]
+                cursor.execute(
+                    sql.format(values=', '.join([row_placeholder] * len(batch))),
+                    [
+                        field.get_db_prep_save(field.pre_save(recommendation, True), connection)
+                        for recommendation in batch for field in fields
+                    ],
+                )
 
 
 class GameRecommendation(models.Model):
-    """Model for storing personalized game recommendations for users."""
+    """
+    Model for storing personalized game recommendations for users.
+    
+    Each refresh writes a user's list under a new generation number and then
+    flips the user's RecommendationState to it; only rows of the current
+    generation are visible.
+    """
     user_profile = models.ForeignKey(UserProfile, on_delete=models.CASCADE, related_name='recommendations')
     game = models.ForeignKey(Game, on_delete=models.CASCADE, related_name='recommended_to')
     score = models.FloatField()  # Recommendation score/confidence (higher = more confident)
     reason = models.TextField(blank=True)  # Explanation for why this game was recommended
+    reason_codes = models.JSONField(default=list, blank=True)  # Structured reasons as [type, ref_id, value] (see reasons.py)
+    generation = models.PositiveIntegerField(default=0)  # Refresh that wrote this row (see RecommendationState)
     
     # Recommendation timestamps
     created_at = models.DateTimeField(auto_now_add=True)
@@ -19,6 +103,8 @@ class GameRecommendation(models.Model):
     dismissed = models.BooleanField(default=False)
     saved = models.BooleanField(default=False)
     
+    objects = GameRecommendationQuerySet.as_manager()
+    
     class Meta:
         ordering = ['-score']
         unique_together = ('user_profile', 'game')
@@ -27,6 +113,22 @@ class GameRecommendation(models.Model):
         return f"Recommendation of {self.game.title} for {self.user_profile.user.username}"
 
 
+class RecommendationState(models.Model):
+    """
+    Pointer to the generation of a user's recommendations that readers see.
+    
+    next_generation is the last generation number handed out to a refresh;
+    it only ever grows, so no two refreshes write under the same number.
+    """
+    user_profile = models.OneToOneField(UserProfile, on_delete=models.CASCADE, related_name='recommendation_state')
+    current_generation = models.PositiveIntegerField(default=0)
+    next_generation = models.PositiveIntegerField(default=0)
+    updated_at = models.DateTimeField(auto_now=True)
+    
+    def __str__(self):
+        return f"Recommendation generation {self.current_generation} for {self.user_profile.user.username}"
+
+
 class RecommendationFeedback(models.Model):
     """User feedback on game recommendations."""
     recommendation = models.OneToOneField(GameRecommendation, on_delete=models.CASCADE, related_name='feedback')
@@ -51,3 +153,55 @@ class RecommendationFeedback(models.Model):
     
     def __str__(self):
         return f"Feedback on {self.recommendation}"
+
+
+class GameCooccurrence(models.Model):
+    """
+    Number of users who liked both games of a pair.
+    
+    Each pair is stored in both directions, so the rows of a game are its
+    whole neighbor list, and the row pairing a game with itself holds the
+    number of users who liked it. Kept up to date by cooccurrence.py.
+    """
+    game = models.ForeignKey(Game, on_delete=models.CASCADE, related_name='+')
+    other_game = models.ForeignKey(Game, on_delete=models.CASCADE, related_name='+')
+    count = models.IntegerField(default=0)
+    
+    class Meta:
+        unique_together = ('game', 'other_game')
+    
+    def __str__(self):
+        return f"{self.count} users liked {self.game_id} and {self.other_game_id}"
+
+
+@receiver(pre_save, sender=GameRating)
+def rating_about_to_change(sender, instance, **kwargs):
+    """Remember a rating's stored value so the change can be applied to the co-occurrence counts."""
+    instance._stored_rating = (
+        GameRating.objects.filter(pk=instance.pk).values_list('rating', flat=True).first()
+        if instance.pk else None
+    )
+
+
+@receiver(post_save, sender=GameRating)
+def rating_saved(sender, instance, **kwargs):
+    """Update the co-occurrence counts when a rating crosses the like threshold."""
+    from .cooccurrence import rating_changed
+    
+    rating_changed(instance.user_profile_id, instance.game_id, getattr(instance, '_stored_rating', None), instance.rating)
+
+
+@receiver(post_delete, sender=GameRating)
+def rating_deleted(sender, instance, **kwargs):
+    """Update the co-occurrence counts when a liked game's rating is removed."""
+    from .cooccurrence import rating_changed
+    
+    rating_changed(instance.user_profile_id, instance.game_id, instance.rating, None)
+
+
+@receiver(m2m_changed, sender=UserProfile.favorite_games.through)
+def favorites_changed(sender, instance, action, reverse, pk_set, **kwargs):
+    """Update the co-occurrence counts when games are added to or removed from favorites."""
+    from .cooccurrence import favorites_changed as apply_favorites_change
+    
+    apply_favorites_change(instance, action, reverse, pk_set)
@@ -0,0 +1,100 @@
+import threading
+import time
+from collections import OrderedDict
+
+from django.conf import settings
+
+
+class RankedCandidates:
+    """
+    A ranked candidate list shared by every user with the same preferences.
+
+    Holds catalog rows and scores ordered best first, before any user's rated
+    games are removed. complete is True when the list holds every candidate
+    that passed the filters, not just the best ones.
+    """
+
+    def __init__(self, rows, scores, complete):
+        self.rows = rows
+        self.scores = scores
+        self.complete = complete
+
+    def covers(self, depth):
+        """Whether the list is deep enough to serve depth entries."""
+        return self.complete or len(self.rows) >= depth
+
+
+class RankingCache:
+    """
+    Thread-safe in-process LRU cache with a time-to-live and hit/miss counters.
+
+    Keys are (preference fingerprint, catalog version) pairs, so entries for
+    an outdated catalog are never returned; they simply age out.
+    """
+
+    def __init__(self, max_size, ttl):
+        self.max_size = max_size
+        self.ttl = ttl
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self._entries = OrderedDict()
+        self._lock = threading.Lock()
+
+    def get(self, key, depth=0):
+        """
+        Get the ranking for a key if it is fresh and deep enough.
+
+        Args:
+            key: Cache key
+            depth: Minimum number of ranked entries the caller needs
+
+        Returns:
+            RankedCandidates or None on a miss
+        """
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is not None:
+                expires_at, ranking = entry
+                if expires_at < time.monotonic():
+                    del self._entries[key]
+                    self.evictions += 1
+                elif ranking.covers(depth):
+                    self._entries.move_to_end(key)
+                    self.hits += 1
+                    return ranking
+
+            self.misses += 1
+            return None
+
+    def set(self, key, ranking):
+        """Store a ranking, evicting the least recently used entries if full."""
+        with self._lock:
+            self._entries[key] = (time.monotonic() + self.ttl, ranking)
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.max_size:
+                self._entries.popitem(last=False)
+                self.evictions += 1
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+            self.hits = self.misses = self.evictions = 0
+
+    def stats(self):
+        """Return the cache counters."""
+        with self._lock:
+            lookups = self.hits + self.misses
+            return {
+                'size': len(self._entries),
+                'hits': self.hits,
+                'misses': self.misses,
+                'evictions': self.evictions,
+                'hit_rate': self.hits / lookups if lookups else 0.0,
+            }
+
+
+ranking_cache = RankingCache(
+    max_size=settings.RECOMMENDATION_RANKING_CACHE_SIZE,
+    ttl=settings.RECOMMENDATION_RANKING_CACHE_TTL,
+)
@@ -0,0 +1,103 @@
+import threading
+
+from games.models import Genre, Platform
+from games.utils.catalog_version import get_catalog_version
+
+
+# Reason types stored in GameRecommendation.reason_codes as [type, ref_id, value]
+GENRE = 'genre'              # ref_id: matched genre
+PLATFORM = 'platform'        # ref_id: matched platform
+METACRITIC = 'metacritic'    # value: Metacritic score
+USER_SCORE = 'user_score'    # value: user score
+
+MAX_REASONS = 3
+
+SEPARATOR = " • "
+
+
+def reason_codes(catalog, row, genre_prefs, platform_prefs):
+    """
+    Build the structured reasons for a single catalog row.
+
+    Matching preferences come first in rank order, then the quality reasons;
+    at most MAX_REASONS are kept. Only ids and numbers are stored, so no
+    genre or platform names are needed while scoring.
+
+    Returns:
+        List of [type, ref_id, value] codes
+    """
+    codes = []
+    game_genres = set(catalog.genres_of(row).tolist())
+    game_platforms = set(catalog.platforms_of(row).tolist())
+
+    for genre_pref in genre_prefs:
+        if genre_pref.genre_id in game_genres:
+            codes.append([GENRE, genre_pref.genre_id, None])
+
+    for platform_pref in platform_prefs:
+        if platform_pref.platform_id in game_platforms:
+            codes.append([PLATFORM, platform_pref.platform_id, None])
+
+    metacritic_score = int(catalog.metacritic_scores[row])
+    if metacritic_score >= 90:
+        codes.append([METACRITIC, None, metacritic_score])
+
+    user_score = float(catalog.user_scores[row])
+    if user_score >= 8:
+        codes.append([USER_SCORE, None, user_score])
+
+    return codes[:MAX_REASONS]
+
+
+def render_reason(codes, names):
+    """
+    Render reason codes as the human readable explanation.
+
+    Args:
+        codes: List of [type, ref_id, value] codes
+        names: Name maps as returned by get_reason_names
+
+    Returns:
+        Explanation string (reasons referring to deleted genres or platforms
+        are left out)
+    """
+    parts = []
+    for reason_type, ref_id, value in codes:
+        if reason_type == GENRE and ref_id in names[GENRE]:
+            parts.append(f"Matches your {names[GENRE][ref_id]} genre preference")
+        elif reason_type == PLATFORM and ref_id in names[PLATFORM]:
+            parts.append(f"Available on your preferred platform ({names[PLATFORM][ref_id]})")
+        elif reason_type == METACRITIC:
+            parts.append(f"Critically acclaimed (Metacritic score: {value})")
+        elif reason_type == USER_SCORE:
+            parts.append(f"Highly rated by players (User score: {value})")
+
+    return SEPARATOR.join(parts)
+
+
+_names = None
+_names_version = None
+_names_lock = threading.Lock()
+
+
+def get_reason_names():
+    """
+    Get the id -> name maps for genres and platforms, cached per process.
+
+    Genre and platform changes bump the catalog version, so the maps are
+    reloaded (two queries) only when that stamp moves.
+
+    Returns:
+        dict: {GENRE: {id: name}, PLATFORM: {id: name}}
+    """
+    global _names, _names_version
+
+    version = get_catalog_version()
+    with _names_lock:
+        if _names is None or _names_version != version:
+            _names = {
+                GENRE: dict(Genre.objects.values_list('id', 'name')),
+                PLATFORM: dict(Platform.objects.values_list('id', 'name')),
+            }
+            _names_version = version
+        return _names
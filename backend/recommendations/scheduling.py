@@ -0,0 +1,113 @@
+import logging
+from contextlib import contextmanager
+from django.conf import settings
+from django.core.cache import cache
+
+
+logger = logging.getLogger(__name__)
+
+
+def pending_key(user_profile_id):
+    return f'recommendations:pending:{user_profile_id}'
+
+
+def full_refresh_key(user_profile_id):
+    return f'recommendations:full:{user_profile_id}'
+
+
+def coalesced_key(user_profile_id):
+    return f'recommendations:coalesced:{user_profile_id}'
+
+
+def lock_key(user_profile_id):
+    return f'recommendations:lock:{user_profile_id}'
+
+
+def schedule_recommendation_refresh(user_profile_id, full=True):
+    """
+    Debounced enqueue of a recommendation refresh for one user.
+
+    The first call in a window enqueues a refresh_user_recommendations task
+    delayed by RECOMMENDATION_REFRESH_DEBOUNCE_SECONDS. Calls made while that
+    task is still pending are collapsed into it; a full refresh request
+    upgrades a pending incremental update.
+
+    Args:
+        user_profile_id: ID of the UserProfile to refresh
+        full: Whether preferences changed and a full recompute is needed
+            (otherwise an incremental update is enough)
+
+    Returns:
+        dict: 'enqueued' (bool), 'task_id' (or None when coalesced) and
+        'coalesced' (calls collapsed into the pending refresh so far)
+    """
+    from .tasks import refresh_user_recommendations
+
+    window = settings.RECOMMENDATION_REFRESH_DEBOUNCE_SECONDS
+    # Outlive the window so a lost task only blocks refreshes for a while
+    timeout = window + settings.RECOMMENDATION_REFRESH_LOCK_TIMEOUT
+
+    if full:
+        cache.set(full_refresh_key(user_profile_id), True, timeout=timeout)
+
+    if cache.add(pending_key(user_profile_id), True, timeout=timeout):
+        cache.set(coalesced_key(user_profile_id), 0, timeout=timeout)
+        task = refresh_user_recommendations.apply_async((user_profile_id,), countdown=window)
+        return {'enqueued': True, 'task_id': task.id, 'coalesced': 0}
+
+    cache.add(coalesced_key(user_profile_id), 0, timeout=timeout)
+    coalesced = cache.incr(coalesced_key(user_profile_id))
+    logger.debug(f"Coalesced recommendation refresh for user profile {user_profile_id} ({coalesced} so far)")
+    return {'enqueued': False, 'task_id': None, 'coalesced': coalesced}
+
+
+def claim_pending_refresh(user_profile_id):
+    """
+    Take over the pending refresh for a user.
+
+    Clears the pending marker first, so calls made while the refresh runs
+    schedule a new one instead of being lost.
+
+    Returns:
+        tuple: (full refresh requested, number of coalesced calls)
+    """
+    cache.delete(pending_key(user_profile_id))
+    full = bool(cache.get(full_refresh_key(user_profile_id)))
+    coalesced = cache.get(coalesced_key(user_profile_id)) or 0
+    cache.delete_many([full_refresh_key(user_profile_id), coalesced_key(user_profile_id)])
+    return full, coalesced
+
+
+@contextmanager
+def user_refresh_lock(user_profile_id):
+    """
+    Per-user lock so only one refresh writes a user's recommendations at a time.
+
+    Yields:
+        bool: Whether the lock was acquired
+    """
+    acquired = cache.add(lock_key(user_profile_id), True, timeout=settings.RECOMMENDATION_REFRESH_LOCK_TIMEOUT)
+    try:
+        yield acquired
+    finally:
+        if acquired:
+            cache.delete(lock_key(user_profile_id))
+
+
+@contextmanager
+def user_refresh_locks(user_profile_ids):
+    """
+    Take the refresh lock of every user in a batch that is not busy.
+
+    Yields:
+        list: IDs of the users whose lock was acquired, in the given order
+    """
+    timeout = settings.RECOMMENDATION_REFRESH_LOCK_TIMEOUT
+    acquired = [
+        user_profile_id for user_profile_id in user_profile_ids
+        if cache.add(lock_key(user_profile_id), True, timeout=timeout)
+    ]
+    try:
+        yield acquired
+    finally:
+        cache.delete_many([lock_key(user_profile_id) for user_profile_id in acquired])
@@ -0,0 +1,170 @@
+import logging
+import numpy as np
+from django.conf import settings
+from django.core.cache import cache
+
+from games.models import Game
+from games.utils.catalog_version import get_catalog_version
+from users.models import GenrePreference, PlatformPreference, UserGamePreferences
+from .engine import RecommendationEngine, load_preferences, top_k
+from .features import get_catalog_features
+from .reasons import reason_codes
+
+
+logger = logging.getLogger(__name__)
+
+# Lists are cached in one entry per top genre, so serving a user only
+# loads that genre's lists rather than the whole table
+SEGMENTS_VERSION_KEY = 'recommendations:segments:version'
+REBUILD_KEY = 'recommendations:segments:rebuilding'
+
+MULTIPLAYER_OPTIONS = [None, True, False]
+
+
+def segment_key(genre_id, platform_id, prefers_multiplayer):
+    """Cache key part for a (top genre, top platform, multiplayer) segment."""
+    return f"{genre_id or '-'}:{platform_id or '-'}:{'-' if prefers_multiplayer is None else int(prefers_multiplayer)}"
+
+
+def segment_cache_key(genre_id):
+    return f"recommendations:segments:genre:{genre_id or '-'}"
+
+
+def segment_of(prefs):
+    """Return the segment (top genre, top platform, multiplayer) of loaded preferences."""
+    genre_id = prefs['genre_prefs'][0].genre_id if prefs['genre_prefs'] else None
+    platform_id = prefs['platform_prefs'][0].platform_id if prefs['platform_prefs'] else None
+    game_prefs = prefs['game_prefs']
+    return genre_id, platform_id, game_prefs.prefers_multiplayer if game_prefs else None
+
+
+def segment_preferences(genre_id, platform_id, prefers_multiplayer):
+    """Build the preference dict of a synthetic user standing for a segment."""
+    return {
+        'genre_prefs': [GenrePreference(genre_id=genre_id, rank=0)] if genre_id else [],
+        'platform_prefs': [PlatformPreference(platform_id=platform_id, rank=0)] if platform_id else [],
+        'game_prefs': UserGamePreferences(prefers_multiplayer=prefers_multiplayer),
+        'rated_game_ids': [],
+    }
+
+
+def rank_segments(catalog, segments, size, block_size=64):
+    """
+    Rank the catalog for a list of (top genre, top platform, multiplayer) segments.
+
+    Each segment is scored like a user whose only preferences are that
+    genre, platform and multiplayer choice, a block of segments per matrix
+    multiply. Reason codes are computed up front so serving needs no catalog.
+
+    Returns:
+        dict mapping segment_key to a list of (game_id, score, reason_codes)
+        tuples, best first
+    """
+    engine = RecommendationEngine()
+    lists = {}
+    for start in range(0, len(segments), block_size):
+        block = segments[start:start + block_size]
+        block_prefs = [segment_preferences(*segment) for segment in block]
+        scores, mask = engine.score_catalog_batch(catalog, block_prefs)
+
+        for i, (segment, prefs) in enumerate(zip(block, block_prefs)):
+            rows = np.flatnonzero(mask[i])
+            ranked = rows[top_k(scores[i, rows], size)]
+            lists[segment_key(*segment)] = [
+                (int(catalog.game_ids[row]), score, reason_codes(catalog, row, prefs['genre_prefs'], prefs['platform_prefs']))
+                for row, score in zip(ranked.tolist(), scores[i, ranked].tolist())
+            ]
+
+    return lists
+
+
+def build_segment_lists(catalog=None, size=None):
+    """Rank the catalog for every segment of the current genres and platforms."""
+    catalog = catalog or get_catalog_features()
+    segments = [
+        (genre_id, platform_id, prefers_multiplayer)
+        for genre_id in [None] + catalog.genre_ids.tolist()
+        for platform_id in [None] + catalog.platform_ids.tolist()
+        for prefers_multiplayer in MULTIPLAYER_OPTIONS
+    ]
+    return rank_segments(catalog, segments, size or settings.RECOMMENDATION_SEGMENT_SIZE)
+
+
+def rebuild_segment_lists():
+    """Rebuild every segment list for the current catalog and publish it in the cache."""
+    catalog = get_catalog_features()
+    lists = build_segment_lists(catalog)
+
+    by_genre = {}
+    for key, ranked in lists.items():
+        genre_id = key.split(':', 1)[0]
+        by_genre.setdefault(segment_cache_key(None if genre_id == '-' else genre_id), {})[key] = ranked
+    cache.set_many(by_genre, timeout=None)
+    cache.set(SEGMENTS_VERSION_KEY, catalog.version, timeout=None)
+    cache.delete(REBUILD_KEY)
+
+    logger.info(f"Rebuilt {len(lists)} segment recommendation lists (catalog version {catalog.version})")
+    return lists
+
+
+def schedule_segment_rebuild():
+    """Enqueue one rebuild of the segment lists, unless one is already pending."""
+    from .tasks import rebuild_segment_recommendations
+
+    if cache.add(REBUILD_KEY, True, timeout=settings.RECOMMENDATION_REFRESH_LOCK_TIMEOUT):
+        rebuild_segment_recommendations.delay()
+
+
+def segment_recommendations(user_profile, limit=20):
+    """
+    Get the precomputed list for a user's segment while their own list is computed.
+
+    Served from the cache; when the catalog has changed since the lists were
+    built, the stale lists are still served and a rebuild is enqueued. When
+    the user's segment has no list yet, nothing is served until the rebuild
+    lands, so a request never scores the catalog.
+
+    Segments only cover the top genre, top platform and multiplayer choice,
+    so the user's free-to-play and in-app purchase filters are applied here.
+
+    Args:
+        user_profile: UserProfile object
+        limit: Maximum number of games
+
+    Returns:
+        List of dicts with 'game', 'score' and 'reason_codes'
+    """
+    prefs = load_preferences([user_profile.id])[user_profile.id]
+    segment = segment_of(prefs)
+
+    genre_key = segment_cache_key(segment[0])
+    cached = cache.get_many([SEGMENTS_VERSION_KEY, genre_key])
+    if cached.get(SEGMENTS_VERSION_KEY) != get_catalog_version():
+        schedule_segment_rebuild()
+
+    ranked = cached.get(genre_key, {}).get(segment_key(*segment))
+    if ranked is None:
+        # No lists yet, or a genre/platform newer than them
+        schedule_segment_rebuild()
+        return []
+
+    rated_ids = set(prefs['rated_game_ids'])
+    ranked = [entry for entry in ranked if entry[0] not in rated_ids]
+
+    games = Game.objects.for_list().filter(**purchase_filters(prefs['game_prefs'])).in_bulk(
+        [game_id for game_id, _, _ in ranked]
+    )
+    return [
+        {'game': games[game_id], 'score': score, 'reason_codes': codes}
+        for game_id, score, codes in ranked if game_id in games
+    ][:limit]
+
+
+def purchase_filters(game_prefs):
+    """Game field lookups for the free-to-play and in-app purchase preferences, as in candidate_mask."""
+    filters = {}
+    if game_prefs and game_prefs.willing_to_pay == 'free_only':
+        filters['is_free_to_play'] = True
+    if game_prefs and game_prefs.accepts_in_app_purchases is not None:
+        filters['has_in_app_purchases'] = game_prefs.accepts_in_app_purchases
+    return filters
@@ -1,32 +1,62 @@
 from rest_framework import serializers
 from .models import GameRecommendation, RecommendationFeedback
+from .reasons import get_reason_names, render_reason
 from games.serializers import GameListSerializer, GameDetailSerializer
 
 
 class GameRecommendationListSerializer(serializers.ModelSerializer):
     """Serializer for recommendation list views."""
     game = GameListSerializer(read_only=True)
+    reason = serializers.SerializerMethodField()
     
     class Meta:
         model = GameRecommendation
         fields = [
-            'id', 'game', 'score', 'reason', 'created_at',
+            'id', 'game', 'score', 'reason', 'reason_codes', 'created_at',
             'viewed', 'clicked', 'dismissed', 'saved'
         ]
-        read_only_fields = ['id', 'game', 'score', 'reason', 'created_at']
+        read_only_fields = ['id', 'game', 'score', 'reason', 'reason_codes', 'created_at']
+    
+    def get_reason(self, obj):
+        """Render the structured reason codes, falling back to a stored reason string."""
+        if not obj.reason_codes:
+            return obj.reason
+        
+        # The child serializer is shared by every row of a list, so the name
+        # maps are looked up once per response
+        if not hasattr(self, '_reason_names'):
+            self._reason_names = get_reason_names()
+        return render_reason(obj.reason_codes, self._reason_names)
 
 
-class GameRecommendationDetailSerializer(serializers.ModelSerializer):
+class GameRecommendationDetailSerializer(GameRecommendationListSerializer):
     """Serializer for recommendation detail views."""
     game = GameDetailSerializer(read_only=True)
+
+
+class SegmentRecommendationSerializer(serializers.Serializer):
+    """
+    Serializer for precomputed segment recommendations, shown until the
+    user's personalized list is ready.
     
-    class Meta:
-        model = GameRecommendation
-        fields = [
-            'id', 'game', 'score', 'reason', 'created_at',
-            'viewed', 'clicked', 'dismissed', 'saved'
-        ]
-        read_only_fields = ['id', 'game', 'score', 'reason', 'created_at']
+    Items have the fields of GameRecommendationListSerializer; id is null, as
+    there is no stored recommendation to interact with, and the flags are false.
+    """
+    id = serializers.IntegerField(read_only=True, default=None)
+    game = GameListSerializer(read_only=True)
+    score = serializers.FloatField(read_only=True)
+    reason = serializers.SerializerMethodField()
+    reason_codes = serializers.JSONField(read_only=True)
+    created_at = serializers.DateTimeField(read_only=True, default=None)
+    viewed = serializers.BooleanField(read_only=True, default=False)
+    clicked = serializers.BooleanField(read_only=True, default=False)
+    dismissed = serializers.BooleanField(read_only=True, default=False)
+    saved = serializers.BooleanField(read_only=True, default=False)
+    
+    def get_reason(self, obj):
+        if not hasattr(self, '_reason_names'):
+            self._reason_names = get_reason_names()
+        return render_reason(obj['reason_codes'], self._reason_names)
 
 
 class RecommendationFeedbackSerializer(serializers.ModelSerializer):
@@ -0,0 +1,130 @@
+import logging
+import time
+from concurrent.futures import ProcessPoolExecutor, as_completed
+
+from django.conf import settings
+from django.db import connection, connections
+
+from users.models import UserProfile
+from .engine import RecommendationEngine
+from .features import get_catalog_features
+
+
+logger = logging.getLogger(__name__)
+
+
+def shard_ranges(shard_size):
+    """
+    Split the profiles with a completed survey into contiguous id ranges.
+
+    Args:
+        shard_size: Number of profiles per shard
+
+    Returns:
+        List of (first_id, last_id) tuples, both inclusive
+    """
+    profile_ids = list(
+        UserProfile.objects.filter(survey_completed=True).order_by('id').values_list('id', flat=True)
+    )
+    return [
+        (profile_ids[start], profile_ids[min(start + shard_size, len(profile_ids)) - 1])
+        for start in range(0, len(profile_ids), shard_size)
+    ]
+
+
+def recompute_shard(first_id, last_id, batch_size=None):
+    """
+    Regenerate recommendations for every surveyed profile in an id range.
+
+    Profiles are scored and written one batch at a time, so a shard never
+    holds more than batch_size users' results in memory.
+    Profiles whose own refresh holds their lock are skipped.
+
+    Args:
+        first_id: First profile id of the shard (inclusive)
+        last_id: Last profile id of the shard (inclusive)
+        batch_size: Users per scoring batch and bulk write
+
+    Returns:
+        dict with 'users', 'skipped', 'recommendations' and 'seconds'
+    """
+    batch_size = batch_size or settings.RECOMMENDATION_BATCH_SIZE
+    start = time.perf_counter()
+
+    profile_ids = list(
+        UserProfile.objects.filter(survey_completed=True, id__range=(first_id, last_id))
+        .order_by('id').values_list('id', flat=True)
+    )
+
+    engine = RecommendationEngine()
+    users = 0
+    recommendations = 0
+    for offset in range(0, len(profile_ids), batch_size):
+        results = engine.generate_recommendations_batch(profile_ids[offset:offset + batch_size])
+        users += len(results)
+        recommendations += sum(len(recs) for recs in results.values())
+
+    return {
+        'users': users,
+        'skipped': len(profile_ids) - users,
+        'recommendations': recommendations,
+        'seconds': time.perf_counter() - start,
+    }
+
+
+def recompute_all(workers=1, shard_size=None, batch_size=None, progress=None):
+    """
+    Regenerate recommendations for all surveyed profiles across processes.
+
+    The catalog feature store is loaded before the pool starts, so forked
+    workers share its pages (or map the same on-disk artifact when
+    RECOMMENDATION_CATALOG_ARTIFACT is on). With a single worker the shards
+    run in this process, as they do on SQLite, which allows a single writer.
+
+    Args:
+        workers: Number of worker processes
+        shard_size: Profiles per shard (defaults to RECOMMENDATION_BATCH_SIZE)
+        batch_size: Users per scoring batch and bulk write
+        progress: Optional callable receiving each finished shard's stats
+
+    Returns:
+        dict with 'shards', 'users', 'recommendations', 'seconds' and
+        'users_per_second'
+    """
+    shard_size = shard_size or settings.RECOMMENDATION_BATCH_SIZE
+    start = time.perf_counter()
+
+    if workers > 1 and connection.vendor == 'sqlite':
+        # SQLite allows a single writer, so parallel shards would only fail on locks
+        logger.warning("SQLite does not support concurrent writers, recomputing with a single worker")
+        workers = 1
+
+    shards = shard_ranges(shard_size)
+    get_catalog_features()
+
+    totals = {'shards': len(shards), 'users': 0, 'recommendations': 0}
+
+    def record(shard, stats):
+        totals['users'] += stats['users']
+        totals['recommendations'] += stats['recommendations']
+        if progress:
+            progress({'first_id': shard[0], 'last_id': shard[1], **stats})
+
+    if workers <= 1:
+        for shard in shards:
+            record(shard, recompute_shard(*shard, batch_size=batch_size))
+    else:
+        # Children must open their own connections instead of sharing ours
+        connections.close_all()
+        with ProcessPoolExecutor(max_workers=workers) as executor:
+            futures = {executor.submit(recompute_shard, *shard, batch_size=batch_size): shard for shard in shards}
+            for future in as_completed(futures):
+                record(futures[future], future.result())
+
+    totals['seconds'] = time.perf_counter() - start
+    totals['users_per_second'] = totals['users'] / totals['seconds'] if totals['seconds'] else 0.0
+    logger.info(
+        f"Recomputed recommendations for {totals['users']} users in {totals['shards']} shards "
+        f"({totals['users_per_second']:.1f} users/sec, {workers} workers)"
+    )
+    return totals
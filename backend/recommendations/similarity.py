@@ -0,0 +1,156 @@
+import logging
+import os
+import numpy as np
+from scipy import sparse
+from sklearn.metrics.pairwise import cosine_similarity
+from django.conf import settings
+
+from .features import get_catalog_features
+from .storage import BLOCK_ELEMENTS, MtimeCachedLoader, save_npz_atomic
+
+
+logger = logging.getLogger(__name__)
+
+# Relative weight of each feature group, matching the engine's score weights
+GENRE_WEIGHT = 0.5
+PLATFORM_WEIGHT = 0.3
+QUALITY_WEIGHT = 0.2
+
+
+class SimilarityIndex:
+    """
+    Precomputed top-N item-item neighbors for every game in the catalog.
+
+    neighbors[i] holds catalog rows (int32, -1 for padding) of the games most
+    similar to game_ids[i], best first, with the matching cosine similarities
+    (float32) in similarities[i].
+    """
+
+    def __init__(self, version, game_ids, neighbors, similarities):
+        self.version = version
+        self.game_ids = game_ids
+        self.neighbors = neighbors
+        self.similarities = similarities
+
+        self._id_order = np.argsort(game_ids, kind='stable')
+        self._sorted_ids = game_ids[self._id_order]
+
+    def similar_games(self, game_id, limit=None):
+        """
+        Look up the neighbors of a game without scoring the catalog.
+
+        Args:
+            game_id: ID of the game
+            limit: Maximum number of neighbors to return
+
+        Returns:
+            List of (game_id, similarity) tuples, most similar first
+        """
+        position = np.searchsorted(self._sorted_ids, game_id)
+        if position >= len(self._sorted_ids) or self._sorted_ids[position] != game_id:
+            return []
+
+        row = self._id_order[position]
+        neighbors = self.neighbors[row][:limit]
+        similarities = self.similarities[row][:limit]
+        valid = neighbors >= 0
+        return list(zip(self.game_ids[neighbors[valid]].tolist(), similarities[valid].tolist()))
+
+    def save(self, path):
+        """Write the index to disk atomically."""
+        save_npz_atomic(
+            path,
+            version=np.array(self.version, dtype=np.int64),
+            game_ids=self.game_ids,
+            neighbors=self.neighbors,
+            similarities=self.similarities,
+        )
+
+    @classmethod
+    def load(cls, path):
+        with np.load(path) as data:
+            return cls(
+                version=int(data['version']),
+                game_ids=data['game_ids'],
+                neighbors=data['neighbors'],
+                similarities=data['similarities'],
+            )
+
+
+def item_feature_matrix(catalog):
+    """
+    Build the sparse item feature matrix used for similarity.
+
+    Each game is its weighted genre and platform memberships plus its quality
+    score, so cosine similarity favors games sharing genres and platforms.
+    """
+    quality = sparse.csr_matrix(catalog.quality_scores.reshape(-1, 1))
+    return sparse.hstack([
+        catalog.genre_matrix * GENRE_WEIGHT,
+        catalog.platform_matrix * PLATFORM_WEIGHT,
+        quality * QUALITY_WEIGHT,
+    ], format='csr', dtype=np.float32)
+
+
+def build_similarity_index(catalog=None, top_n=None, block_size=None):
+    """
+    Compute the top-N neighbors of every game, one block of rows at a time.
+
+    Only a block_size x games slice of the similarity matrix exists at any
+    time, so memory stays bounded instead of growing with games squared.
+
+    Args:
+        catalog: CatalogFeatures snapshot (defaults to the current one)
+        top_n: Neighbors kept per game
+        block_size: Rows per block (defaults to fit BLOCK_ELEMENTS)
+
+    Returns:
+        SimilarityIndex
+    """
+    catalog = catalog or get_catalog_features()
+    top_n = top_n or settings.RECOMMENDATION_SIMILAR_GAMES
+    n = len(catalog)
+    block_size = block_size or max(1, BLOCK_ELEMENTS // max(n, 1))
+    k = min(top_n, max(n - 1, 0))
+
+    features = item_feature_matrix(catalog)
+    neighbors = np.full((n, top_n), -1, dtype=np.int32)
+    similarities = np.zeros((n, top_n), dtype=np.float32)
+
+    for start in range(0, n, block_size):
+        end = min(start + block_size, n)
+        block = cosine_similarity(features[start:end], features, dense_output=True)
+
+        # A game is not its own neighbor
+        block[np.arange(end - start), np.arange(start, end)] = -np.inf
+
+        if k == 0:
+            continue
+
+        candidates = np.argpartition(-block, k - 1, axis=1)[:, :k]
+        candidate_scores = np.take_along_axis(block, candidates, axis=1)
+
+        # Best first, ties broken by catalog position
+        order = np.lexsort((candidates, -candidate_scores), axis=1)
+        neighbors[start:end, :k] = np.take_along_axis(candidates, order, axis=1)
+        similarities[start:end, :k] = np.take_along_axis(candidate_scores, order, axis=1)
+
+    logger.info(f"Built similarity index for {n} games (top {top_n}, blocks of {block_size})")
+    return SimilarityIndex(catalog.version, catalog.game_ids.copy(), neighbors, similarities)
+
+
+def similarity_index_path():
+    return os.path.join(settings.RECOMMENDATION_DATA_DIR, 'similarity.npz')
+
+
+_index_loader = MtimeCachedLoader(similarity_index_path, SimilarityIndex.load)
+
+
+def get_similarity_index():
+    """
+    Get the worker's copy of the similarity index, reloading it when rebuilt.
+
+    Returns:
+        SimilarityIndex or None if it has not been built yet
+    """
+    return _index_loader.get()
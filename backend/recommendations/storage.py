@@ -0,0 +1,67 @@
+import os
+import tempfile
+import threading
+import numpy as np
+
+
+# Upper bound on the number of elements in one in-memory block of work
+# (a dense block of similarities, or a batch of normal equations)
+BLOCK_ELEMENTS = 2 ** 24
+
+
+def save_npz_atomic(path, **arrays):
+    """
+    Write arrays to an .npz file atomically.
+
+    The file is written next to its destination and renamed into place, so
+    readers in other processes see either the old file or the new one.
+    """
+    directory = os.path.dirname(path)
+    os.makedirs(directory, exist_ok=True)
+
+    fd, tmp_path = tempfile.mkstemp(dir=directory, suffix='.npz')
+    try:
+        with os.fdopen(fd, 'wb') as f:
+            np.savez(f, **arrays)
+        os.replace(tmp_path, path)
+    except Exception:
+        os.unlink(tmp_path)
+        raise
+
+
+class MtimeCachedLoader:
+    """
+    A process's copy of an object stored in a file, reloaded when the file is replaced.
+
+    Checking freshness costs one stat call; the object is only loaded again
+    when the file's path or modification time changed.
+
+    Args:
+        path_fn: Callable returning the file path (read on every call, so
+            settings overrides apply)
+        load_fn: Callable loading the object from a path
+    """
+
+    def __init__(self, path_fn, load_fn):
+        self.path_fn = path_fn
+        self.load_fn = load_fn
+        self._value = None
+        self._key = None
+        self._lock = threading.Lock()
+
+    def get(self):
+        """
+        Returns:
+            The loaded object, or None if the file does not exist yet
+        """
+        path = self.path_fn()
+        try:
+            key = (path, os.stat(path).st_mtime_ns)
+        except FileNotFoundError:
+            return None
+
+        with self._lock:
+            if self._value is None or self._key != key:
+                self._value = self.load_fn(path)
+                self._key = key
+            return self._value
@@ -1,13 +1,24 @@
 import logging
 from celery import shared_task
-from django.db import transaction
+from django.conf import settings
+from django.core.cache import cache
 
 from users.models import UserProfile
+from . import descriptions
+from .collaborative import factor_model_path, get_factor_model, train_factor_model
 from .engine import RecommendationEngine
+from .instrumentation import emit_metrics
+from .models import GameRecommendation
+from .scheduling import claim_pending_refresh, user_refresh_lock
+from .segments import rebuild_segment_lists
+from .sharding import recompute_shard, shard_ranges
+from .similarity import build_similarity_index, similarity_index_path
 
 
 logger = logging.getLogger(__name__)
 
+DESCRIPTION_INDEX_LOCK_KEY = 'recommendations:descriptions:lock'
+
 
 @shared_task
 def generate_recommendations_for_all_users():
@@ -17,24 +28,62 @@ def generate_recommendations_for_all_users():
     """
     logger.info("Starting recommendation generation for all users")
     
-    # Get all user profiles with completed surveys
-    user_profiles = UserProfile.objects.filter(survey_completed=True)
-    
-    for profile in user_profiles:
-        # Launch a task for each user
-        generate_recommendations_for_user.delay(profile.id)
+    # Launch one task per id range of surveyed users; workers run the shards
+    # in parallel and share the catalog artifact
+    shards = shard_ranges(settings.RECOMMENDATION_BATCH_SIZE)
+    for first_id, last_id in shards:
+        recompute_recommendation_shard.delay(first_id, last_id)
     
-    return f"Initiated recommendation generation for {user_profiles.count()} users"
+    return f"Initiated recommendation generation in {len(shards)} shards"
 
 
 @shared_task
-def generate_recommendations_for_user(user_profile_id):
+def recompute_recommendation_shard(first_id, last_id):
+    """
+    Task to regenerate recommendations for the surveyed users in an id range.
+    
+    Args:
+        first_id: First user profile id of the shard (inclusive)
+        last_id: Last user profile id of the shard (inclusive)
+    """
+    try:
+        stats = recompute_shard(first_id, last_id)
+        users_per_second = stats['users'] / stats['seconds'] if stats['seconds'] else 0.0
+        
+        logger.info(
+            f"Recomputed shard {first_id}-{last_id}: {stats['users']} users "
+            f"in {stats['seconds']:.2f}s ({users_per_second:.1f} users/sec), "
+            f"{stats['skipped']} skipped while refreshing"
+        )
+        return {
+            'status': 'success',
+            'message': f"Successfully recomputed recommendations for {stats['users']} users",
+            'users_per_second': users_per_second,
+            **stats,
+        }
+    
+    except Exception as e:
+        logger.exception(f"Error recomputing shard {first_id}-{last_id}: {str(e)}")
+        return {'status': 'error', 'message': f"Error recomputing recommendations: {str(e)}"}
+
+
+@shared_task(bind=True)
+def generate_recommendations_for_user(self, user_profile_id):
     """
     Task to generate recommendations for a specific user.
     
     Args:
         user_profile_id: ID of the UserProfile to generate recommendations for
     """
+    with user_refresh_lock(user_profile_id) as acquired:
+        if not acquired:
+            # Another refresh for this user is running, try again once it is done
+            raise self.retry(countdown=settings.RECOMMENDATION_REFRESH_DEBOUNCE_SECONDS, max_retries=None)
+        
+        return _generate_recommendations_for_user(user_profile_id)
+
+
+def _generate_recommendations_for_user(user_profile_id):
     try:
         user_profile = UserProfile.objects.get(id=user_profile_id)
         
@@ -43,17 +92,232 @@ def generate_recommendations_for_user(user_profile_id):
         # Initialize recommendation engine
         engine = RecommendationEngine()
         
-        # Generate recommendations within a transaction
-        with transaction.atomic():
-            recommendations = engine.generate_recommendations(user_profile)
+        # The new list becomes visible in one short transaction at the end
+        recommendations = engine.generate_recommendations(user_profile)
         
         logger.info(f"Generated {len(recommendations)} recommendations for user {user_profile.user.username}")
-        return f"Successfully generated {len(recommendations)} recommendations"
+        return {
+            'status': 'success',
+            'message': f"Successfully generated {len(recommendations)} recommendations",
+            'metrics': emit_metrics(engine.metrics, user_profile_id=user_profile_id),
+        }
     
     except UserProfile.DoesNotExist:
         logger.error(f"User profile with ID {user_profile_id} does not exist")
-        return f"Error: User profile with ID {user_profile_id} does not exist"
+        return {'status': 'error', 'message': f"Error: User profile with ID {user_profile_id} does not exist"}
     
     except Exception as e:
         logger.exception(f"Error generating recommendations for user {user_profile_id}: {str(e)}")
-        return f"Error generating recommendations: {str(e)}" 
\ No newline at end of file
+        return {'status': 'error', 'message': f"Error generating recommendations: {str(e)}"}
+
+
+@shared_task(bind=True)
+def update_recommendations_for_user(self, user_profile_id):
+    """
+    Task to incrementally update a user's recommendations after a rating change.
+    
+    Args:
+        user_profile_id: ID of the UserProfile whose ratings changed
+    """
+    with user_refresh_lock(user_profile_id) as acquired:
+        if not acquired:
+            # Another refresh for this user is running, try again once it is done
+            raise self.retry(countdown=settings.RECOMMENDATION_REFRESH_DEBOUNCE_SECONDS, max_retries=None)
+        
+        return _update_recommendations_for_user(user_profile_id)
+
+
+def _update_recommendations_for_user(user_profile_id):
+    try:
+        user_profile = UserProfile.objects.get(id=user_profile_id)
+        
+        engine = RecommendationEngine()
+        recommendations = engine.update_recommendations(user_profile)
+        
+        logger.info(f"Updated recommendations for user {user_profile.user.username} ({len(recommendations)} kept)")
+        return {
+            'status': 'success',
+            'message': f"Successfully updated {len(recommendations)} recommendations",
+            'metrics': emit_metrics(engine.metrics, user_profile_id=user_profile_id),
+        }
+    
+    except UserProfile.DoesNotExist:
+        logger.error(f"User profile with ID {user_profile_id} does not exist")
+        return {'status': 'error', 'message': f"Error: User profile with ID {user_profile_id} does not exist"}
+    
+    except Exception as e:
+        logger.exception(f"Error updating recommendations for user {user_profile_id}: {str(e)}")
+        return {'status': 'error', 'message': f"Error updating recommendations: {str(e)}"}
+
+
+@shared_task(bind=True)
+def refresh_user_recommendations(self, user_profile_id):
+    """
+    Debounced per-user refresh enqueued by schedule_recommendation_refresh.
+    
+    Runs one full recompute or incremental update on behalf of every call
+    that was coalesced into it while it was pending.
+    
+    Args:
+        user_profile_id: ID of the UserProfile to refresh
+    """
+    with user_refresh_lock(user_profile_id) as acquired:
+        if not acquired:
+            # Another refresh for this user is running, try again once it is done
+            raise self.retry(countdown=settings.RECOMMENDATION_REFRESH_DEBOUNCE_SECONDS, max_retries=None)
+        
+        full, coalesced = claim_pending_refresh(user_profile_id)
+        logger.info(
+            f"Refreshing recommendations for user profile {user_profile_id} "
+            f"({'full' if full else 'incremental'}, {coalesced} coalesced calls)"
+        )
+        
+        if full:
+            result = _generate_recommendations_for_user(user_profile_id)
+        else:
+            result = _update_recommendations_for_user(user_profile_id)
+        
+        return {**result, 'message': f"{result['message']} ({coalesced} coalesced calls)", 'coalesced': coalesced}
+
+
+@shared_task
+def rebuild_similarity_index():
+    """
+    Task to rebuild the item-item similarity index from the current catalog.
+    """
+    try:
+        index = build_similarity_index()
+        index.save(similarity_index_path())
+        
+        logger.info(f"Rebuilt similarity index for {len(index.game_ids)} games")
+        return f"Successfully rebuilt similarity index for {len(index.game_ids)} games"
+    
+    except Exception as e:
+        logger.exception(f"Error rebuilding similarity index: {str(e)}")
+        return f"Error rebuilding similarity index: {str(e)}"
+
+
+@shared_task(bind=True)
+def update_description_index(self, game_ids):
+    """
+    Task to re-vectorize changed game descriptions and patch their neighbors.
+    
+    Enqueued by the scraper pipeline with the games whose description
+    changed; the rest of the catalog is not re-vectorized.
+    
+    Args:
+        game_ids: IDs of the games whose description changed
+    """
+    # Updates rewrite the whole index file, so only one may run at a time
+    if not cache.add(DESCRIPTION_INDEX_LOCK_KEY, True, timeout=settings.RECOMMENDATION_REFRESH_LOCK_TIMEOUT):
+        raise self.retry(countdown=settings.RECOMMENDATION_REFRESH_DEBOUNCE_SECONDS, max_retries=None)
+    
+    try:
+        index = descriptions.update_description_index(game_ids)
+        
+        logger.info(f"Updated description index for {len(game_ids)} games ({len(index)} indexed)")
+        return f"Successfully updated description index for {len(game_ids)} games"
+    
+    except Exception as e:
+        logger.exception(f"Error updating description index: {str(e)}")
+        return f"Error updating description index: {str(e)}"
+    
+    finally:
+        cache.delete(DESCRIPTION_INDEX_LOCK_KEY)
+
+
+@shared_task
+def refresh_description_neighbors():
+    """
+    Task to re-rank every description neighbor list from the stored vectors.
+    
+    Incremental updates shift the IDF weights a little for every game; this
+    nightly pass folds that drift back in without re-vectorizing anything.
+    """
+    if not cache.add(DESCRIPTION_INDEX_LOCK_KEY, True, timeout=settings.RECOMMENDATION_REFRESH_LOCK_TIMEOUT):
+        return "Skipped refreshing description neighbors: an update is running"
+    
+    try:
+        index = descriptions.refresh_description_neighbors()
+        
+        logger.info(f"Refreshed description neighbors for {len(index)} games")
+        return f"Successfully refreshed description neighbors for {len(index)} games"
+    
+    except Exception as e:
+        logger.exception(f"Error refreshing description neighbors: {str(e)}")
+        return f"Error refreshing description neighbors: {str(e)}"
+    
+    finally:
+        cache.delete(DESCRIPTION_INDEX_LOCK_KEY)
+
+
+@shared_task
+def train_collaborative_model():
+    """
+    Task to retrain the collaborative filtering model on every rating.
+    
+    Starts from the current model's factors, so the nightly run only needs
+    a few iterations.
+    """
+    try:
+        model = train_factor_model(previous=get_factor_model())
+        model.save(factor_model_path())
+    
+        logger.info(f"Trained collaborative model for {len(model.user_ids)} users and {len(model.game_ids)} games")
+        return f"Successfully trained collaborative model for {len(model.user_ids)} users and {len(model.game_ids)} games"
+    
+    except Exception as e:
+        logger.exception(f"Error training collaborative model: {str(e)}")
+        return f"Error training collaborative model: {str(e)}"
+
+
+@shared_task
+def collect_stale_recommendations(chunk_size=1000):
+    """
+    Task to delete recommendations superseded by a newer generation.
+    
+    Also deletes rows above the current generation that a refresh wrote but
+    never published, for users whose refresh lock is free (so none is still
+    running). Deletes in small chunks so no long lock is held on the table.
+    
+    Args:
+        chunk_size: Number of rows deleted per statement
+    """
+    try:
+        deleted = 0
+        while True:
+            stale_ids = list(GameRecommendation.objects.stale().values_list('id', flat=True)[:chunk_size])
+            if not stale_ids:
+                break
+            # Re-check staleness: a refresh may have reused a row in the meantime
+            GameRecommendation.objects.stale().filter(id__in=stale_ids).delete()
+            deleted += len(stale_ids)
+        
+        orphaned_profile_ids = set(
+            GameRecommendation.objects.orphaned().order_by().values_list('user_profile_id', flat=True).distinct()
+        )
+        for user_profile_id in orphaned_profile_ids:
+            with user_refresh_lock(user_profile_id) as acquired:
+                if acquired:
+                    deleted += GameRecommendation.objects.orphaned().filter(user_profile_id=user_profile_id).delete()[0]
+        
+        logger.info(f"Deleted {deleted} stale recommendations")
+        return f"Successfully deleted {deleted} stale recommendations"
+    
+    except Exception as e:
+        logger.exception(f"Error deleting stale recommendations: {str(e)}")
+        return f"Error deleting stale recommendations: {str(e)}"
+
+
+@shared_task
+def rebuild_segment_recommendations():
+    """
+    Task to rebuild the precomputed segment lists after the catalog changed.
+    """
+    try:
+        lists = rebuild_segment_lists()
+        return f"Successfully rebuilt {len(lists)} segment recommendation lists"
+    
+    except Exception as e:
+        logger.exception(f"Error rebuilding segment recommendations: {str(e)}")
+        return f"Error rebuilding segment recommendations: {str(e)}"
@@ -1,3 +1,1108 @@
-from django.test import TestCase
+import os
+import random
+import tempfile
+import time
+from unittest import mock
 
-# Create your tests here.
+import numpy as np
+
+from django.conf import settings
+from django.contrib.auth.models import User
+from django.core.cache import cache
+from django.db import connection
+from django.test import SimpleTestCase, TestCase, override_settings
+from django.test.utils import CaptureQueriesContext
+from rest_framework.test import APIClient
+
+from games.models import Game, Genre, Platform
+from users.models import UserProfile, GenrePreference, PlatformPreference, GameRating, UserGamePreferences
+from .benchmark import create_synthetic_dataset, run_benchmark
+from .collaborative import factor_model_path, load_ratings, rating_matrix, solve_factors, train_factor_model
+from .cooccurrence import also_liked, rebuild_cooccurrence
+from . import descriptions
+from .engine import (
+    RecommendationEngine, candidate_mask, claim_generations, flip_generations, load_preferences, top_k,
+)
+from .artifact import artifact_root, load_catalog_artifact, read_current_version
+from .features import CatalogFeatures, get_catalog_features
+from .models import GameCooccurrence, GameRecommendation, RecommendationFeedback, RecommendationState
+from .serializers import GameRecommendationListSerializer
+from .ranking_cache import RankedCandidates, RankingCache, ranking_cache
+from . import reasons
+from .scheduling import claim_pending_refresh, schedule_recommendation_refresh, user_refresh_lock
+from .segments import build_segment_lists, rebuild_segment_lists, segment_key
+from .sharding import recompute_all, shard_ranges
+from .similarity import SimilarityIndex, build_similarity_index, get_similarity_index, similarity_index_path
+from .tasks import collect_stale_recommendations, generate_recommendations_for_all_users, refresh_user_recommendations
+
+
+def reference_score(game, genre_ids, platform_ids):
+    """Score a game the way the original per-row loop did."""
+    game_genres = set(game.genres.values_list('id', flat=True))
+    game_platforms = set(game.platforms.values_list('id', flat=True))
+
+    genre_score = sum(1.0 / (i + 1) for i, genre_id in enumerate(genre_ids) if genre_id in game_genres)
+    if genre_ids:
+        genre_score /= sum(1.0 / (i + 1) for i in range(len(genre_ids)))
+
+    platform_score = sum(1.0 / (i + 1) for i, platform_id in enumerate(platform_ids) if platform_id in game_platforms)
+    if platform_ids:
+        platform_score /= sum(1.0 / (i + 1) for i in range(len(platform_ids)))
+
+    metacritic = game.metacritic_score or 0
+    user_score = game.user_score or 0
+    quality = 0
+    if metacritic > 0:
+        quality += metacritic / 100
+    if user_score > 0:
+        quality += user_score / 10
+    num_scores = (metacritic > 0) + (user_score > 0)
+    quality = quality / num_scores if num_scores else 0
+
+    return 0.5 * genre_score + 0.3 * platform_score + 0.2 * quality
+
+
+collected_metrics = []
+
+
+def collect_metrics(metrics):
+    """Metrics sink used by the tests."""
+    collected_metrics.append(metrics)
+
+
+class RecommendationEngineTestCase(TestCase):
+    """Tests for the vectorized recommendation scoring."""
+
+    @classmethod
+    def setUpTestData(cls):
+        rng = random.Random(42)
+        cls.genres = [Genre.objects.create(name=f"Genre {i}") for i in range(6)]
+        cls.platforms = [Platform.objects.create(name=f"Platform {i}") for i in range(4)]
+
+        cls.games = []
+        for i in range(60):
+            game = Game.objects.create(
+                title=f"Game {i}",
+                metacritic_score=rng.choice([None, rng.randint(40, 99)]),
+                user_score=rng.choice([None, round(rng.uniform(3, 10), 1)]),
+                is_multiplayer=rng.random() < 0.5,
+            )
+            game.genres.set(rng.sample(cls.genres, rng.randint(1, 3)))
+            game.platforms.set(rng.sample(cls.platforms, rng.randint(1, 2)))
+            cls.games.append(game)
+
+        user = User.objects.create_user(username='player', password='secret')
+        cls.profile = user.profile
+        for rank, genre in enumerate([cls.genres[2], cls.genres[0], cls.genres[5]]):
+            GenrePreference.objects.create(user_profile=cls.profile, genre=genre, rank=rank)
+        for rank, platform in enumerate([cls.platforms[1], cls.platforms[3]]):
+            PlatformPreference.objects.create(user_profile=cls.profile, platform=platform, rank=rank)
+        GameRating.objects.create(user_profile=cls.profile, game=cls.games[0], rating=7)
+
+    def setUp(self):
+        # Start every test from a fresh catalog version and an empty ranking cache
+        cache.clear()
+        ranking_cache.clear()
+
+    def expected_ranking(self, genre_ids, platform_ids, candidates):
+        scored = [(reference_score(game, genre_ids, platform_ids), game.id) for game in candidates]
+        return sorted(scored, key=lambda item: -item[0])
+
+    def test_scores_match_reference_loop(self):
+        genre_ids = [self.genres[2].id, self.genres[0].id, self.genres[5].id]
+        platform_ids = [self.platforms[1].id, self.platforms[3].id]
+        candidates = [
+            game for game in self.games[1:]
+            if set(game.platforms.values_list('id', flat=True)) & set(platform_ids)
+        ]
+        expected = self.expected_ranking(genre_ids, platform_ids, candidates)
+
+        results = RecommendationEngine().generate_recommendations(self.profile, limit=len(candidates))
+
+        self.assertEqual(len(results), len(expected))
+        expected_scores = dict((game_id, score) for score, game_id in expected)
+        for game, score, reason in results:
+            self.assertAlmostEqual(score, expected_scores[game.id], places=12)
+
+        result_scores = [score for _, score, _ in results]
+        self.assertEqual(result_scores, sorted(result_scores, reverse=True))
+        self.assertEqual(
+            [round(score, 12) for _, score, _ in results],
+            [round(score, 12) for score, _ in expected]
+        )
+
+    def test_rated_games_are_excluded_and_saved(self):
+        results = RecommendationEngine().generate_recommendations(self.profile, limit=5)
+
+        self.assertEqual(len(results), 5)
+        self.assertNotIn(self.games[0].id, [game.id for game, _, _ in results])
+        self.assertEqual(GameRecommendation.objects.current().filter(user_profile=self.profile).count(), 5)
+
+    def test_refresh_keeps_interaction_state(self):
+        engine = RecommendationEngine()
+        engine.generate_recommendations(self.profile, limit=5)
+        recommendation = GameRecommendation.objects.filter(user_profile=self.profile).first()
+        recommendation.saved = True
+        recommendation.save()
+
+        engine.generate_recommendations(self.profile, limit=5)
+
+        recommendation.refresh_from_db()
+        self.assertTrue(recommendation.saved)
+        self.assertEqual(GameRecommendation.objects.current().filter(user_profile=self.profile).count(), 5)
+
+    def test_refresh_swaps_generations(self):
+        engine = RecommendationEngine()
+        initial = engine.generate_recommendations(self.profile, limit=5)
+        kept = GameRecommendation.objects.current().get(user_profile=self.profile, game=initial[0][0])
+        kept.saved = True
+        kept.save()
+        RecommendationFeedback.objects.create(recommendation=kept, rating='good')
+
+        # Rating a recommended game drops it from the list
+        GameRating.objects.create(user_profile=self.profile, game=initial[1][0], rating=3)
+        refreshed = engine.generate_recommendations(UserProfile.objects.get(pk=self.profile.pk), limit=5)
+
+        state = RecommendationState.objects.get(user_profile=self.profile)
+        self.assertEqual(state.current_generation, 2)
+        current = GameRecommendation.objects.current().filter(user_profile=self.profile)
+        self.assertEqual({rec.game_id for rec in current}, {game.id for game, _, _ in refreshed})
+        self.assertTrue(all(rec.generation == 2 for rec in current))
+
+        # Rows that stay are moved in place with their state and feedback
+        kept.refresh_from_db()
+        self.assertEqual(kept.generation, 2)
+        self.assertTrue(kept.saved)
+        self.assertTrue(RecommendationFeedback.objects.filter(recommendation=kept).exists())
+
+        # Superseded rows are invisible until collected in the background
+        self.assertEqual(list(GameRecommendation.objects.stale().values_list('game_id', flat=True)), [initial[1][0].id])
+        response = self.client_for(self.profile).get('/api/recommendations/')
+        self.assertEqual(
+            {item['game']['id'] for item in response.json()},
+            {game.id for game, _, _ in refreshed}
+        )
+
+        collect_stale_recommendations()
+        self.assertFalse(GameRecommendation.objects.stale().exists())
+        self.assertEqual(GameRecommendation.objects.filter(user_profile=self.profile).count(), 5)
+
+    def test_superseded_row_is_reused_when_game_returns(self):
+        engine = RecommendationEngine()
+        initial = engine.generate_recommendations(self.profile, limit=5)
+        rating = GameRating.objects.create(user_profile=self.profile, game=initial[0][0], rating=3)
+        engine.generate_recommendations(UserProfile.objects.get(pk=self.profile.pk), limit=5)
+        rating.delete()
+
+        restored = engine.generate_recommendations(UserProfile.objects.get(pk=self.profile.pk), limit=5)
+
+        self.assertEqual(self.ranking(restored), self.ranking(initial))
+        self.assertEqual(GameRecommendation.objects.current().filter(user_profile=self.profile).count(), 5)
+        self.assertEqual(
+            GameRecommendation.objects.get(user_profile=self.profile, game=initial[0][0]).generation, 3
+        )
+
+    def test_unpublished_generation_is_never_served(self):
+        engine = RecommendationEngine()
+        initial = engine.generate_recommendations(self.profile, limit=5)
+        GameRating.objects.create(user_profile=self.profile, game=initial[0][0], rating=3)
+
+        # A refresh that dies between writing its rows and flipping the pointer
+        with mock.patch('recommendations.engine.flip_generations', side_effect=RuntimeError):
+            with self.assertRaises(RuntimeError):
+                engine.generate_recommendations(UserProfile.objects.get(pk=self.profile.pk), limit=5)
+        orphaned = set(GameRecommendation.objects.orphaned().values_list('game_id', flat=True))
+        self.assertTrue(orphaned)
+        current = GameRecommendation.objects.current().filter(user_profile=self.profile)
+        self.assertEqual({rec.game_id for rec in current}, {game.id for game, _, _ in initial})
+
+        # Its rows stay while a refresh may still be running, then get collected
+        with user_refresh_lock(self.profile.id):
+            collect_stale_recommendations()
+        self.assertEqual(set(GameRecommendation.objects.orphaned().values_list('game_id', flat=True)), orphaned)
+        collect_stale_recommendations()
+        self.assertFalse(GameRecommendation.objects.orphaned().exists())
+        self.assertEqual(GameRecommendation.objects.current().filter(user_profile=self.profile).count(), 5)
+
+        # A writer whose starting generation was replaced meanwhile cannot publish
+        stale_claim = claim_generations([self.profile.id])
+        refreshed = engine.generate_recommendations(UserProfile.objects.get(pk=self.profile.pk), limit=5)
+        self.assertEqual(flip_generations(stale_claim), set())
+        state = RecommendationState.objects.get(user_profile=self.profile)
+        self.assertEqual(state.current_generation, state.next_generation)
+        current = GameRecommendation.objects.current().filter(user_profile=self.profile)
+        self.assertEqual({rec.game_id for rec in current}, {game.id for game, _, _ in refreshed})
+
+    def test_rows_of_a_concurrent_refresh_are_not_taken_over(self):
+        engine = RecommendationEngine()
+        first, second = self.games[1:3]
+        engine.save_recommendations_batch({self.profile.id: [(first, 1.0, [])]})
+
+        # Another refresh has claimed a generation and staged a row, but not flipped yet
+        other_claim = claim_generations([self.profile.id])
+        GameRecommendation.objects.stage([GameRecommendation(
+            user_profile=self.profile, game=second, score=0.9, reason_codes=[], generation=other_claim[self.profile.id][1]
+        )])
+
+        published = engine.save_recommendations_batch({self.profile.id: [(first, 1.0, []), (second, 0.5, [])]})
+
+        # Its row is left alone, and the incomplete list is not published
+        self.assertEqual(published, set())
+        staged = GameRecommendation.objects.get(user_profile=self.profile, game=second)
+        self.assertEqual((staged.generation, staged.score), (other_claim[self.profile.id][1], 0.9))
+        current = GameRecommendation.objects.current().filter(user_profile=self.profile)
+        self.assertEqual([rec.game_id for rec in current], [first.id])
+        self.assertEqual(flip_generations(other_claim), {self.profile.id})
+
+    def test_batch_skips_users_being_refreshed(self):
+        with user_refresh_lock(self.profile.id):
+            results = RecommendationEngine().generate_recommendations_batch([self.profile.id], limit=5)
+
+        self.assertEqual(results, {})
+        self.assertFalse(GameRecommendation.objects.filter(user_profile=self.profile).exists())
+        self.assertEqual(
+            set(RecommendationEngine().generate_recommendations_batch([self.profile.id], limit=5)), {self.profile.id}
+        )
+
+    def test_segment_list_is_served_until_personalized_list_lands(self):
+        UserProfile.objects.filter(pk=self.profile.pk).update(survey_completed=True)
+        client = self.client_for(self.profile)
+
+        with mock.patch('recommendations.tasks.rebuild_segment_recommendations.delay') as delay:
+            cold = client.get('/api/recommendations/')
+            client.get('/api/recommendations/')
+
+        # Without lists nothing is scored inline; one rebuild is enqueued
+        delay.assert_called_once()
+        self.assertEqual(cold['X-Recommendation-Source'], 'segment')
+        self.assertEqual(cold.json(), [])
+
+        rebuild_segment_lists()
+        with mock.patch('recommendations.tasks.rebuild_segment_recommendations.delay') as delay:
+            response = client.get('/api/recommendations/')
+        delay.assert_not_called()
+        self.assertEqual(response['X-Recommendation-Source'], 'segment')
+        self.assertEqual(len(response.json()), 20)
+        self.assertNotIn(self.games[0].id, [item['game']['id'] for item in response.json()])
+        self.assertIn("Genre 2", response.json()[0]['reason'])
+        # Same shape as a personalized item, with nothing to interact with yet
+        self.assertEqual(response.json()[0]['id'], None)
+        self.assertFalse(any(response.json()[0][flag] for flag in ['viewed', 'clicked', 'dismissed', 'saved']))
+
+        # The purchase filters apply to the segment list too
+        free_ids = [game['game']['id'] for game in response.json()[1:4]]
+        Game.objects.filter(id__in=free_ids).update(is_free_to_play=True)
+        UserGamePreferences.objects.create(user_profile=self.profile, willing_to_pay='free_only')
+        with mock.patch('recommendations.tasks.rebuild_segment_recommendations.delay'):
+            free = client.get('/api/recommendations/')
+        self.assertEqual([item['game']['id'] for item in free.json()], free_ids)
+        UserGamePreferences.objects.filter(user_profile=self.profile).delete()
+
+        RecommendationEngine().generate_recommendations(self.profile)
+        personalized = client.get('/api/recommendations/')
+        self.assertNotIn('X-Recommendation-Source', personalized)
+        self.assertTrue(all(item['id'] for item in personalized.json()))
+        self.assertEqual(set(personalized.json()[0]), set(response.json()[0]))
+
+    def test_segment_lists_match_engine_ranking(self):
+        lists = build_segment_lists(size=10)
+
+        self.assertEqual(len(lists), (len(self.genres) + 1) * (len(self.platforms) + 1) * 3)
+
+        # A user whose only preferences are a segment's gets the same ranking
+        user = User.objects.create_user(username='segment', password='secret')
+        GenrePreference.objects.create(user_profile=user.profile, genre=self.genres[3], rank=0)
+        PlatformPreference.objects.create(user_profile=user.profile, platform=self.platforms[0], rank=0)
+        UserGamePreferences.objects.create(user_profile=user.profile, prefers_multiplayer=True)
+        expected = RecommendationEngine().generate_recommendations(user.profile, limit=10)
+
+        self.assertEqual(
+            [(game_id, round(score, 12)) for game_id, score, _ in lists[segment_key(self.genres[3].id, self.platforms[0].id, True)]],
+            self.ranking(expected)
+        )
+
+    def client_for(self, profile):
+        client = APIClient()
+        client.force_authenticate(profile.user)
+        return client
+
+    def test_persistence_query_count_does_not_grow_with_limit(self):
+        engine = RecommendationEngine()
+        get_catalog_features()
+
+        with CaptureQueriesContext(connection) as small:
+            engine.generate_recommendations(UserProfile.objects.get(pk=self.profile.pk), limit=5)
+        GameRecommendation.objects.all().delete()
+        ranking_cache.clear()
+        with CaptureQueriesContext(connection) as large:
+            engine.generate_recommendations(UserProfile.objects.get(pk=self.profile.pk), limit=40)
+
+        self.assertEqual(len(small), len(large))
+
+    def test_list_query_count_does_not_grow_with_rows(self):
+        client = APIClient()
+        client.force_authenticate(self.profile.user)
+
+        def count_queries(limit):
+            RecommendationEngine().generate_recommendations(self.profile, limit=limit)
+            with CaptureQueriesContext(connection) as queries:
+                response = client.get('/api/recommendations/')
+            self.assertEqual(len(response.json()), limit)
+            return len(queries)
+
+        # The first response also caches the reason names
+        count_queries(1)
+        self.assertEqual(count_queries(1), count_queries(3))
+
+    def test_batch_matches_single_user_results(self):
+        other = User.objects.create_user(username='other', password='secret').profile
+        GenrePreference.objects.create(user_profile=other, genre=self.genres[4], rank=0)
+        UserGamePreferences.objects.create(user_profile=other, prefers_multiplayer=False)
+        empty = User.objects.create_user(username='empty', password='secret').profile
+        engine = RecommendationEngine()
+
+        expected = {
+            profile.id: [(game.id, round(score, 12)) for game, score, _ in engine.generate_recommendations(profile)]
+            for profile in [self.profile, other, empty]
+        }
+        GameRecommendation.objects.all().delete()
+
+        results = engine.generate_recommendations_batch([self.profile.id, other.id, empty.id], block_size=2)
+
+        for profile_id, recommendations in results.items():
+            self.assertEqual(
+                [(game.id, round(score, 12)) for game, score, _ in recommendations],
+                expected[profile_id]
+            )
+        self.assertEqual(GameRecommendation.objects.current().filter(user_profile=other).count(), len(expected[other.id]))
+        self.assertEqual(results[empty.id], [])
+
+    def ranking(self, results):
+        return [(game.id, round(score, 12)) for game, score, _ in results]
+
+    def test_incremental_update_backfills_from_overflow(self):
+        engine = RecommendationEngine()
+        initial = engine.generate_recommendations(self.profile, limit=5)
+        GameRating.objects.create(user_profile=self.profile, game=initial[0][0], rating=9)
+        GameRating.objects.create(user_profile=self.profile, game=initial[3][0], rating=4)
+
+        with mock.patch.object(engine, '_generate', side_effect=AssertionError("full recompute")):
+            updated = engine.update_recommendations(UserProfile.objects.get(pk=self.profile.pk), limit=5)
+
+        expected = engine.generate_recommendations(UserProfile.objects.get(pk=self.profile.pk), limit=5)
+        self.assertEqual(self.ranking(updated), self.ranking(expected))
+        self.assertEqual(
+            set(GameRecommendation.objects.current().filter(user_profile=self.profile).values_list('game_id', flat=True)),
+            {game.id for game, _, _ in expected}
+        )
+
+    def test_incremental_update_restores_unrated_game(self):
+        engine = RecommendationEngine()
+        initial = engine.generate_recommendations(self.profile, limit=5)
+        rating = GameRating.objects.create(user_profile=self.profile, game=initial[0][0], rating=9)
+        engine.update_recommendations(UserProfile.objects.get(pk=self.profile.pk), limit=5)
+        rating.delete()
+
+        with mock.patch.object(engine, '_generate', side_effect=AssertionError("full recompute")):
+            restored = engine.update_recommendations(UserProfile.objects.get(pk=self.profile.pk), limit=5)
+
+        self.assertEqual(self.ranking(restored), self.ranking(initial))
+
+    def test_preference_change_forces_full_recompute(self):
+        engine = RecommendationEngine()
+        engine.generate_recommendations(self.profile, limit=5)
+        GenrePreference.objects.filter(user_profile=self.profile, rank=0).update(genre=self.genres[1])
+
+        with mock.patch.object(engine, '_generate', wraps=engine._generate) as full:
+            engine.update_recommendations(UserProfile.objects.get(pk=self.profile.pk), limit=5)
+
+        full.assert_called_once()
+
+    def test_debounced_refresh_runs_once_for_coalesced_calls(self):
+        with mock.patch('recommendations.tasks.refresh_user_recommendations.apply_async'):
+            for _ in range(3):
+                schedule_recommendation_refresh(self.profile.id, full=True)
+
+        result = refresh_user_recommendations.apply((self.profile.id,)).get()
+
+        self.assertEqual(result['message'], "Successfully generated 20 recommendations (2 coalesced calls)")
+        self.assertEqual(result['coalesced'], 2)
+        self.assertEqual(result['metrics']['counts']['recommendations'], 20)
+        self.assertEqual(GameRecommendation.objects.current().filter(user_profile=self.profile).count(), 20)
+
+    def test_metrics_record_every_stage(self):
+        engine = RecommendationEngine()
+        with CaptureQueriesContext(connection) as queries:
+            engine.generate_recommendations(self.profile, limit=5)
+        metrics = engine.metrics.as_dict()
+
+        self.assertEqual(metrics['operation'], 'generate')
+        self.assertEqual(
+            list(metrics['stages']),
+            ['load_preferences', 'catalog', 'candidates', 'scoring', 'ranking', 'blend', 'overflow', 'build_results', 'save']
+        )
+        self.assertEqual(metrics['total_queries'], len(queries))
+        self.assertEqual(metrics['stages']['load_preferences']['queries'], 4)
+        self.assertEqual(metrics['stages']['candidates']['queries'], 0)
+        self.assertGreater(metrics['counts']['candidates'], 5)
+        self.assertEqual(metrics['counts']['recommendations'], 5)
+
+        # A second run with the same preferences reuses the cached ranking
+        engine.generate_recommendations(self.profile, limit=5)
+        metrics = engine.metrics.as_dict()
+        self.assertNotIn('candidates', metrics['stages'])
+        self.assertEqual(metrics['counts']['ranking_cache_hits'], 1)
+
+    def test_candidate_mask_matches_queryset_filters(self):
+        platform_ids = [self.platforms[1].id, self.platforms[3].id]
+        variants = [
+            {},
+            {'prefers_multiplayer': True},
+            {'prefers_multiplayer': False, 'accepts_in_app_purchases': False},
+            {'willing_to_pay': 'free_only'},
+        ]
+        Game.objects.filter(id__in=[game.id for game in self.games[::7]]).update(
+            is_free_to_play=True, has_in_app_purchases=True
+        )
+        # QuerySet.update() sends no signals, so start from a fresh catalog version
+        cache.clear()
+        catalog = get_catalog_features()
+
+        for fields in variants:
+            UserGamePreferences.objects.update_or_create(
+                user_profile=self.profile,
+                defaults={'prefers_multiplayer': None, 'accepts_in_app_purchases': None, 'willing_to_pay': '', **fields}
+            )
+            prefs = load_preferences([self.profile.id])[self.profile.id]
+
+            expected = Game.objects.filter(platforms__id__in=platform_ids).exclude(id=self.games[0].id)
+            if 'prefers_multiplayer' in fields:
+                expected = expected.filter(is_multiplayer=fields['prefers_multiplayer'])
+            if 'willing_to_pay' in fields:
+                expected = expected.filter(is_free_to_play=True)
+            if 'accepts_in_app_purchases' in fields:
+                expected = expected.filter(has_in_app_purchases=fields['accepts_in_app_purchases'])
+
+            with self.assertNumQueries(0):
+                mask = candidate_mask(catalog, prefs)
+            self.assertEqual(set(catalog.game_ids[mask].tolist()), set(expected.values_list('id', flat=True)))
+
+            rows = np.array([1, 5, 9])
+            np.testing.assert_array_equal(candidate_mask(catalog, prefs, rows), mask[rows])
+
+    @override_settings(RECOMMENDATION_METRICS_SINK='recommendations.tests.collect_metrics')
+    def test_task_sends_metrics_to_sink(self):
+        collected_metrics.clear()
+        with self.assertLogs('recommendations.instrumentation', 'INFO') as logs:
+            result = refresh_user_recommendations.apply((self.profile.id,)).get()
+
+        self.assertEqual(result['status'], 'success')
+        self.assertEqual(collected_metrics, [result['metrics']])
+        self.assertEqual(result['metrics']['user_profile_id'], self.profile.id)
+        self.assertIn('recommendation_metrics {', logs.output[0])
+
+    def test_identical_preferences_share_one_ranking(self):
+        twin = User.objects.create_user(username='twin', password='secret').profile
+        for rank, genre in enumerate([self.genres[2], self.genres[0], self.genres[5]]):
+            GenrePreference.objects.create(user_profile=twin, genre=genre, rank=rank)
+        for rank, platform in enumerate([self.platforms[1], self.platforms[3]]):
+            PlatformPreference.objects.create(user_profile=twin, platform=platform, rank=rank)
+        engine = RecommendationEngine()
+
+        own = engine.generate_recommendations(self.profile, limit=5)
+        with mock.patch.object(engine, 'score_candidates', side_effect=AssertionError("rescored")):
+            shared = engine.generate_recommendations(twin, limit=6)
+
+        self.assertEqual(ranking_cache.stats()['hits'], 1)
+        # The twin has not rated games[0], so it may appear in their list only
+        self.assertEqual(
+            [game.id for game, _, _ in shared if game.id != self.games[0].id][:5],
+            [game.id for game, _, _ in own]
+        )
+
+    def test_batch_scores_each_fingerprint_once(self):
+        twins = []
+        for i in range(3):
+            twin = User.objects.create_user(username=f'twin{i}', password='secret').profile
+            GenrePreference.objects.create(user_profile=twin, genre=self.genres[3], rank=0)
+            twins.append(twin.id)
+        engine = RecommendationEngine()
+
+        with mock.patch.object(engine, 'score_catalog_batch', wraps=engine.score_catalog_batch) as scorer:
+            results = engine.generate_recommendations_batch(twins)
+
+        self.assertEqual(len(scorer.call_args[0][1]), 1)
+        self.assertEqual(len({tuple(game.id for game, _, _ in recs) for recs in results.values()}), 1)
+
+    def test_multiplayer_filter(self):
+        UserGamePreferences.objects.create(user_profile=self.profile, prefers_multiplayer=True)
+
+        results = RecommendationEngine().generate_recommendations(self.profile, limit=50)
+
+        self.assertTrue(results)
+        self.assertTrue(all(game.is_multiplayer for game, _, _ in results))
+
+    def test_reason_lists_matching_preferences(self):
+        results = RecommendationEngine().generate_recommendations(self.profile, limit=1)
+        game, score, codes = results[0]
+
+        game_genres = set(game.genres.values_list('id', flat=True))
+        if self.genres[2].id in game_genres:
+            self.assertEqual(codes[0], [reasons.GENRE, self.genres[2].id, None])
+        self.assertLessEqual(len(codes), reasons.MAX_REASONS)
+        self.assertEqual(GameRecommendation.objects.current().get(user_profile=self.profile).reason_codes, codes)
+
+    def test_reason_codes_are_rendered_in_list(self):
+        RecommendationEngine().generate_recommendations(self.profile, limit=10)
+        recommendations = list(
+            GameRecommendation.objects.filter(user_profile=self.profile)
+            .select_related('game__cached_image').prefetch_related('game__genres', 'game__platforms')
+        )
+        self.genres[2].name = "Roguelike"
+        self.genres[2].save()
+
+        # Name maps are loaded once for the whole list, not per row
+        with self.assertNumQueries(2):
+            data = GameRecommendationListSerializer(recommendations, many=True).data
+
+        self.assertEqual(len(data), 10)
+        for item, recommendation in zip(data, recommendations):
+            self.assertEqual(item['reason_codes'], recommendation.reason_codes)
+            self.assertLessEqual(len(item['reason'].split(reasons.SEPARATOR)), reasons.MAX_REASONS)
+            if [reasons.GENRE, self.genres[2].id, None] in recommendation.reason_codes:
+                self.assertIn("Matches your Roguelike genre preference", item['reason'])
+
+        legacy = recommendations[0]
+        legacy.reason_codes = []
+        legacy.reason = "Picked by hand"
+        self.assertEqual(GameRecommendationListSerializer(legacy).data['reason'], "Picked by hand")
+
+
+class TopKTestCase(SimpleTestCase):
+    """Tests for partial top-k selection."""
+
+    def test_matches_full_sort(self):
+        scores = np.random.default_rng(1).random(1000)
+
+        self.assertEqual(list(top_k(scores, 20)), list(np.argsort(-scores)[:20]))
+
+    def test_ties_are_broken_by_position(self):
+        scores = np.array([0.5, 0.9, 0.5, 0.9, 0.5, 0.1])
+
+        self.assertEqual(list(top_k(scores, 4)), [1, 3, 0, 2])
+        self.assertEqual(list(top_k(scores, 10)), [1, 3, 0, 2, 4, 5])
+        self.assertEqual(list(top_k(scores, 0)), [])
+
+
+class RankingCacheTestCase(SimpleTestCase):
+    """Tests for the in-process LRU/TTL ranking cache."""
+
+    def ranking(self, size, complete=False):
+        return RankedCandidates(np.arange(size), np.zeros(size), complete)
+
+    def test_least_recently_used_entry_is_evicted(self):
+        ranking_cache = RankingCache(max_size=2, ttl=60)
+        ranking_cache.set('a', self.ranking(5))
+        ranking_cache.set('b', self.ranking(5))
+        ranking_cache.get('a')
+        ranking_cache.set('c', self.ranking(5))
+
+        self.assertIsNone(ranking_cache.get('b'))
+        self.assertIsNotNone(ranking_cache.get('a'))
+        self.assertEqual(ranking_cache.stats()['evictions'], 1)
+
+    def test_expired_and_shallow_entries_miss(self):
+        ranking_cache = RankingCache(max_size=2, ttl=60)
+        ranking_cache.set('a', self.ranking(5))
+        ranking_cache.set('b', self.ranking(5, complete=True))
+
+        self.assertIsNone(ranking_cache.get('a', depth=10))
+        self.assertIsNotNone(ranking_cache.get('b', depth=10))
+
+        with mock.patch('recommendations.ranking_cache.time.monotonic', return_value=time.monotonic() + 61):
+            self.assertIsNone(ranking_cache.get('b'))
+
+        self.assertEqual(ranking_cache.stats()['hits'], 1)
+        self.assertEqual(ranking_cache.stats()['misses'], 2)
+
+
+class CatalogFeaturesTestCase(TestCase):
+    """Tests for the versioned in-process catalog feature store."""
+
+    def setUp(self):
+        cache.clear()
+        self.genre = Genre.objects.create(name="Action")
+        self.platform = Platform.objects.create(name="PC")
+        self.game = Game.objects.create(title="Quake", metacritic_score=90)
+        self.game.genres.add(self.genre)
+
+    def test_catalog_is_reused_until_version_changes(self):
+        catalog = get_catalog_features()
+
+        self.assertIs(get_catalog_features(), catalog)
+        self.assertEqual(list(catalog.game_ids), [self.game.id])
+        self.assertEqual(list(catalog.genres_of(0)), [self.genre.id])
+
+        self.game.platforms.add(self.platform)
+        rebuilt = get_catalog_features()
+
+        self.assertIsNot(rebuilt, catalog)
+        self.assertEqual(list(rebuilt.platforms_of(0)), [self.platform.id])
+
+    def test_image_only_updates_keep_catalog(self):
+        catalog = get_catalog_features()
+
+        self.game.image_url = "https://example.com/quake.jpg"
+        self.game.save(update_fields=['image_url'])
+
+        self.assertIs(get_catalog_features(), catalog)
+
+    def test_building_takes_constant_queries(self):
+        for i in range(5):
+            Game.objects.create(title=f"Game {i}").genres.add(self.genre)
+        cache.clear()
+
+        with self.assertNumQueries(5):
+            get_catalog_features()
+
+    def test_artifact_is_shared_between_processes(self):
+        with tempfile.TemporaryDirectory() as data_dir, \
+                override_settings(RECOMMENDATION_DATA_DIR=data_dir, RECOMMENDATION_CATALOG_ARTIFACT=True):
+            built = CatalogFeatures.build()
+            catalog = get_catalog_features()
+
+            self.assertIsInstance(catalog.game_ids, np.memmap)
+            self.assertFalse(catalog.game_ids.flags.writeable)
+            self.assertEqual(read_current_version(), catalog.version)
+            for name, array in built.to_arrays().items():
+                np.testing.assert_array_equal(catalog.to_arrays()[name], array)
+            self.assertEqual((catalog.genre_matrix != built.genre_matrix).nnz, 0)
+
+            # Another process maps the published files instead of querying
+            with mock.patch('recommendations.features._catalog', None), self.assertNumQueries(0):
+                mapped = get_catalog_features()
+            self.assertEqual(list(mapped.game_ids), [self.game.id])
+
+            # Newer versions replace the pointer and old ones are removed
+            for i in range(4):
+                Game.objects.create(title=f"Game {i}")
+                catalog = get_catalog_features()
+            self.assertEqual(len(catalog), 5)
+            self.assertEqual(read_current_version(), catalog.version)
+            self.assertEqual(
+                len([name for name in os.listdir(artifact_root()) if name.startswith('v')]),
+                settings.RECOMMENDATION_CATALOG_ARTIFACT_KEEP
+            )
+
+    def test_artifact_removed_while_mapping_falls_back_to_building(self):
+        with tempfile.TemporaryDirectory() as data_dir, \
+                override_settings(RECOMMENDATION_DATA_DIR=data_dir, RECOMMENDATION_CATALOG_ARTIFACT=True):
+            version = get_catalog_features().version
+            self.assertIsNotNone(load_catalog_artifact(version))
+
+            # Another worker's remove_old_artifacts deletes the files mid-read
+            with mock.patch('recommendations.artifact.np.load', side_effect=FileNotFoundError):
+                self.assertIsNone(load_catalog_artifact(version))
+                with mock.patch('recommendations.features._catalog', None):
+                    catalog = get_catalog_features()
+            self.assertEqual(list(catalog.game_ids), [self.game.id])
+
+
+class SimilarityIndexTestCase(TestCase):
+    """Tests for the precomputed item-item neighbor table."""
+
+    def setUp(self):
+        cache.clear()
+        action, strategy, puzzle = (Genre.objects.create(name=name) for name in ["Action", "Strategy", "Puzzle"])
+        pc = Platform.objects.create(name="PC")
+
+        self.quake = Game.objects.create(title="Quake", metacritic_score=90)
+        self.quake.genres.set([action])
+        self.doom = Game.objects.create(title="Doom", metacritic_score=85)
+        self.doom.genres.set([action])
+        self.civ = Game.objects.create(title="Civilization", metacritic_score=90)
+        self.civ.genres.set([strategy])
+        self.tetris = Game.objects.create(title="Tetris", metacritic_score=80)
+        self.tetris.genres.set([puzzle])
+        for game in [self.quake, self.doom, self.civ, self.tetris]:
+            game.platforms.add(pc)
+
+    def test_neighbors_match_dense_ranking(self):
+        catalog = get_catalog_features()
+        # A block size of 1 exercises the blockwise path
+        index = build_similarity_index(catalog, top_n=3, block_size=1)
+
+        neighbors = index.similar_games(self.quake.id)
+
+        self.assertEqual(len(neighbors), 3)
+        self.assertNotIn(self.quake.id, [game_id for game_id, _ in neighbors])
+        self.assertEqual(neighbors[0][0], self.doom.id)
+        similarities = [similarity for _, similarity in neighbors]
+        self.assertEqual(similarities, sorted(similarities, reverse=True))
+        self.assertEqual(index.similar_games(self.quake.id, limit=1), neighbors[:1])
+        self.assertEqual(index.similar_games(-1), [])
+
+    def test_small_catalog_pads_neighbors(self):
+        index = build_similarity_index(get_catalog_features(), top_n=10)
+
+        self.assertEqual(len(index.similar_games(self.civ.id)), 3)
+
+    def test_saved_index_is_reloaded(self):
+        with tempfile.TemporaryDirectory() as data_dir, override_settings(RECOMMENDATION_DATA_DIR=data_dir):
+            self.assertIsNone(get_similarity_index())
+
+            index = build_similarity_index(get_catalog_features(), top_n=2)
+            index.save(similarity_index_path())
+            loaded = get_similarity_index()
+
+            self.assertIsInstance(loaded, SimilarityIndex)
+            self.assertEqual(loaded.version, index.version)
+            self.assertEqual(loaded.similar_games(self.doom.id), index.similar_games(self.doom.id))
+            self.assertEqual([name for name in os.listdir(data_dir) if name.endswith('.npz')], ['similarity.npz'])
+
+            response = self.client.get(f'/api/games/{self.doom.id}/similar/?limit=1')
+            self.assertEqual(response.status_code, 200)
+            self.assertEqual([game['id'] for game in response.json()], [self.quake.id])
+
+
+@override_settings(RECOMMENDATION_COOCCURRENCE_WEIGHT=0)
+class CollaborativeFilteringTestCase(TestCase):
+    """Tests for the ALS factor model trained on ratings."""
+
+    def setUp(self):
+        cache.clear()
+        action = Genre.objects.create(name="Action")
+        pc = Platform.objects.create(name="PC")
+
+        # Identical content, so only other users' ratings can tell the games apart
+        self.games = [Game.objects.create(title=f"Game {i}", metacritic_score=80) for i in range(10)]
+        for game in self.games:
+            game.genres.add(action)
+            game.platforms.add(pc)
+
+        # Two taste groups, each rating half of the catalog highly
+        for i in range(12):
+            group = self.games[:5] if i % 2 else self.games[5:]
+            profile = User.objects.create_user(username=f"rater{i}", password='secret').profile
+            for game in group:
+                GameRating.objects.create(user_profile=profile, game=game, rating=9)
+
+        user = User.objects.create_user(username='newcomer', password='secret')
+        self.profile = user.profile
+        GenrePreference.objects.create(user_profile=self.profile, genre=action, rank=0)
+        PlatformPreference.objects.create(user_profile=self.profile, platform=pc, rank=0)
+        for game in self.games[7:9]:
+            GameRating.objects.create(user_profile=self.profile, game=game, rating=10)
+
+    def test_model_recommends_what_similar_users_rated(self):
+        for implicit in [True, False]:
+            model = train_factor_model(factors=4, iterations=10, implicit=implicit)
+
+            self.assertEqual(model.user_factors.dtype, np.float32)
+            self.assertEqual(model.item_factors.shape, (10, 4))
+            recommended = [game_id for game_id, _ in model.recommend(
+                self.profile.id, limit=3, exclude_game_ids=[game.id for game in self.games[7:9]]
+            )]
+            self.assertCountEqual(recommended, [self.games[i].id for i in (5, 6, 9)])
+
+    def test_low_rating_is_not_a_preference(self):
+        ratings = load_ratings()
+        disliked = np.array([[self.profile.id, self.games[0].id, 2]])
+        neighbors = [game.id for game in self.games[1:5]]
+
+        without = train_factor_model(ratings=ratings, factors=4, iterations=10)
+        with_dislike = train_factor_model(ratings=np.vstack([ratings, disliked]), factors=4, iterations=10)
+
+        # Scoring a game 2/10 does not make the games its fans liked look better
+        self.assertTrue(np.all(
+            with_dislike.score_games(self.profile.id, neighbors) <= without.score_games(self.profile.id, neighbors)
+        ))
+        _, _, matrix = rating_matrix(np.vstack([ratings, disliked]))
+        self.assertEqual(matrix.nnz, len(ratings))
+
+    def test_block_solver_matches_dense_solve(self):
+        ratings = load_ratings()
+        user_ids, game_ids, matrix = rating_matrix(ratings)
+        item_factors = np.random.default_rng(1).standard_normal((len(game_ids), 3)).astype(np.float32)
+
+        with mock.patch('recommendations.collaborative.BLOCK_ELEMENTS', 9 * 4):
+            solved = solve_factors(matrix, item_factors, 0.1, implicit=True)
+
+        y = item_factors.astype(np.float64)
+        confidence = matrix[0].toarray().ravel()
+        observed = confidence > 0
+        a = y.T @ y + y[observed].T @ np.diag(confidence[observed] - 1) @ y[observed] + 0.1 * np.eye(3)
+        np.testing.assert_allclose(solved[0], np.linalg.solve(a, y[observed].T @ confidence[observed]), rtol=1e-4)
+
+    def test_blend_reorders_content_ranking(self):
+        engine = RecommendationEngine()
+        content_order = [game.id for game, _, _ in engine.generate_recommendations(self.profile, limit=3)]
+        self.assertEqual(content_order, [game.id for game in self.games[:3]])
+
+        with tempfile.TemporaryDirectory() as data_dir, \
+                override_settings(RECOMMENDATION_DATA_DIR=data_dir, RECOMMENDATION_COLLABORATIVE_WEIGHT=0.5):
+            model = train_factor_model(factors=4, iterations=10)
+            model.save(factor_model_path())
+
+            results = engine.generate_recommendations(self.profile, limit=3)
+
+        self.assertCountEqual([game.id for game, _, _ in results], [self.games[i].id for i in (5, 6, 9)])
+        self.assertIn('blend', engine.metrics.stages)
+
+
+class CooccurrenceTestCase(TestCase):
+    """Tests for the incrementally maintained "players who liked X also liked Y" index."""
+
+    def setUp(self):
+        cache.clear()
+        action = Genre.objects.create(name="Action")
+        pc = Platform.objects.create(name="PC")
+        self.games = [Game.objects.create(title=f"Game {i}", metacritic_score=80) for i in range(6)]
+        for game in self.games:
+            game.genres.add(action)
+            game.platforms.add(pc)
+
+        self.profiles = [User.objects.create_user(username=f"fan{i}", password='secret').profile for i in range(3)]
+        GenrePreference.objects.create(user_profile=self.profiles[0], genre=action, rank=0)
+        PlatformPreference.objects.create(user_profile=self.profiles[0], platform=pc, rank=0)
+
+    def stored_counts(self):
+        return set(GameCooccurrence.objects.filter(count__gt=0).values_list('game_id', 'other_game_id', 'count'))
+
+    def test_incremental_counts_match_full_rebuild(self):
+        first, second, third = self.profiles
+        GameRating.objects.create(user_profile=first, game=self.games[0], rating=9)
+        GameRating.objects.create(user_profile=first, game=self.games[1], rating=8)
+        low = GameRating.objects.create(user_profile=first, game=self.games[2], rating=5)
+        GameRating.objects.create(user_profile=second, game=self.games[0], rating=10)
+        second.favorite_games.add(self.games[1], self.games[3])
+        third.favorite_games.add(self.games[4])
+        GameRating.objects.create(user_profile=third, game=self.games[4], rating=9)
+
+        # Crossing the threshold up and down, deletes and favorite removals
+        low.rating = 9
+        low.save()
+        GameRating.objects.get(user_profile=first, game=self.games[1]).delete()
+        second.favorite_games.remove(self.games[3])
+        self.games[1].favorited_by.add(third)
+        third.favorite_games.clear()
+
+        incremental = self.stored_counts()
+        self.assertIn((self.games[0].id, self.games[2].id, 1), incremental)
+        self.assertIn((self.games[0].id, self.games[0].id, 2), incremental)
+
+        rebuild_cooccurrence()
+        self.assertEqual(incremental, self.stored_counts())
+
+    def test_neighbors_feed_endpoint_and_ranking(self):
+        first, second, third = self.profiles
+        for profile in [second, third]:
+            for game in self.games[3:5]:
+                GameRating.objects.create(user_profile=profile, game=game, rating=9)
+        GameRating.objects.create(user_profile=third, game=self.games[5], rating=9)
+
+        response = self.client.get(f'/api/games/{self.games[3].id}/also_liked/?limit=2')
+        self.assertEqual([game['id'] for game in response.json()], [self.games[4].id, self.games[5].id])
+        response = self.client.get(f'/api/games/{self.games[3].id}/also_liked/?limit=-1')
+        self.assertEqual([game['id'] for game in response.json()], [self.games[4].id])
+
+        # Once cached, a lookup is a single cache read
+        with self.assertNumQueries(0):
+            self.assertEqual(len(also_liked(self.games[3].id)), 2)
+
+        # A rating change drops the cached lists it affects
+        GameRating.objects.create(user_profile=first, game=self.games[3], rating=10)
+        self.assertEqual(also_liked(self.games[4].id)[0][0], self.games[3].id)
+
+        with override_settings(RECOMMENDATION_COLLABORATIVE_WEIGHT=0):
+            results = RecommendationEngine().generate_recommendations(first, limit=3)
+        self.assertEqual([game.id for game, _, _ in results[:2]], [self.games[4].id, self.games[5].id])
+
+
+class DescriptionIndexTestCase(TestCase):
+    """Tests for the incrementally updated description similarity index."""
+
+    DESCRIPTIONS = [
+        "Fight demons on a space station with a shotgun and a chainsaw.",
+        "Marines fight alien demons across a ruined space colony.",
+        "Build an empire, research technology and conquer rival nations.",
+        "Lead your nation through the ages and research new technology.",
+        "Slay a dragon with your sword on an epic fantasy quest.",
+        "A fantasy quest through haunted kingdoms with sword and sorcery.",
+        "Stack falling blocks to clear lines in this classic puzzle.",
+        "",
+    ]
+
+    def setUp(self):
+        cache.clear()
+        self.games = [
+            Game.objects.create(title=f"Game {i}", description=description)
+            for i, description in enumerate(self.DESCRIPTIONS)
+        ]
+
+    def neighbor_ids(self, index, game):
+        return [game_id for game_id, _ in index.similar_games(game.id)]
+
+    def test_incremental_update_matches_full_build(self):
+        index = descriptions.build_description_index(block_size=3)
+        self.assertEqual(self.neighbor_ids(index, self.games[0])[0], self.games[1].id)
+        self.assertEqual(self.neighbor_ids(index, self.games[7]), [])
+
+        Game.objects.filter(id=self.games[6].id).update(description="Marines fight demons with a plasma rifle.")
+        Game.objects.filter(id=self.games[1].id).update(description="Dragons and sorcery in a fantasy kingdom.")
+        added = Game.objects.create(title="Game 8", description="Research technology to build a space empire.")
+        changed = [self.games[6].id, self.games[1].id, added.id]
+
+        with mock.patch.object(descriptions.vectorizer, 'transform', wraps=descriptions.vectorizer.transform) as transform:
+            self.assertEqual(index.update(descriptions.load_descriptions(changed), block_size=2), 3)
+        # Only the changed descriptions are tokenized again
+        self.assertEqual(sum(len(call.args[0]) for call in transform.call_args_list), 3)
+
+        full = descriptions.build_description_index()
+        np.testing.assert_array_equal(index.game_ids, full.game_ids)
+        np.testing.assert_array_equal(index.term_counts.toarray(), full.term_counts.toarray())
+        np.testing.assert_array_equal(index.document_frequency, full.document_frequency)
+        for game_id in changed:
+            self.assertEqual(index.similar_games(game_id), full.similar_games(game_id))
+        self.assertEqual(self.neighbor_ids(index, self.games[0])[0], self.games[6].id)
+        self.assertNotIn(self.games[1].id, self.neighbor_ids(index, self.games[0])[:1])
+
+        # Re-ranking from the stored vectors folds in the IDF drift of the other games
+        index.rebuild_neighbors()
+        np.testing.assert_array_equal(index.neighbors, full.neighbors)
+        np.testing.assert_allclose(index.similarities, full.similarities, rtol=1e-5)
+
+    def test_pipeline_changes_feed_index_and_endpoint(self):
+        from scraper.pipelines import GameDataPipeline
+
+        pipeline = GameDataPipeline()
+        spider = mock.Mock()
+        with mock.patch('recommendations.tasks.update_description_index.delay') as delay:
+            pipeline.process_item({'title': "Game 2", 'description': self.DESCRIPTIONS[2]}, spider)
+            pipeline.process_item({'title': "Game 7", 'description': "Conquer nations with technology."}, spider)
+            pipeline.process_item({'title': "Game 9", 'description': "Solve a puzzle of falling blocks."}, spider)
+            delay.assert_not_called()
+
+            pipeline.close_spider(spider)
+        new_game = Game.objects.get(title="Game 9")
+        delay.assert_called_once_with(sorted([self.games[7].id, new_game.id]))
+
+        with tempfile.TemporaryDirectory() as data_dir, override_settings(RECOMMENDATION_DATA_DIR=data_dir):
+            # The first update builds the whole index, later ones patch it
+            descriptions.update_description_index([new_game.id])
+            index = descriptions.update_description_index(delay.call_args.args[0])
+            self.assertEqual(index.version, 2)
+            self.assertEqual(descriptions.get_description_index().version, 2)
+
+            response = self.client.get(f'/api/games/{new_game.id}/similar_descriptions/?limit=1')
+            self.assertEqual([game['id'] for game in response.json()], [self.games[6].id])
+
+
+class BenchmarkTestCase(TestCase):
+    """Tests for the synthetic benchmark harness."""
+
+    def setUp(self):
+        cache.clear()
+        ranking_cache.clear()
+
+    def test_benchmark_reports_every_stage(self):
+        profile_ids = create_synthetic_dataset(num_games=40, num_users=6, ratings_per_user=3)
+
+        self.assertEqual(Game.objects.count(), 40)
+        self.assertEqual(UserProfile.objects.filter(survey_completed=True).count(), 6)
+        self.assertFalse(Game.objects.filter(genres=None).exists())
+        self.assertFalse(Game.objects.filter(platforms=None).exists())
+
+        results = run_benchmark(profile_ids, samples=2, batch_size=4)
+
+        self.assertEqual(set(results), {'catalog_build', 'single', 'batch', 'task'})
+        self.assertEqual(results['single']['runs'], 2)
+        self.assertEqual(results['batch']['runs'], 2)
+        for stage in results.values():
+            self.assertLessEqual(stage['p50_ms'], stage['p95_ms'])
+            self.assertGreater(stage['queries_p50'], 0)
+        self.assertTrue(GameRecommendation.objects.filter(user_profile_id__in=profile_ids).exists())
+
+
+class ShardedRecomputeTestCase(TestCase):
+    """Tests for the sharded full recompute."""
+
+    def setUp(self):
+        cache.clear()
+        ranking_cache.clear()
+        self.profile_ids = create_synthetic_dataset(num_games=30, num_users=7, ratings_per_user=2)
+        # Profiles without a completed survey are left alone
+        UserProfile.objects.filter(id=self.profile_ids[3]).update(survey_completed=False)
+
+    def test_shards_cover_surveyed_profiles(self):
+        shards = shard_ranges(2)
+
+        self.assertEqual(shards[0][0], self.profile_ids[0])
+        self.assertEqual(shards[-1][1], self.profile_ids[-1])
+        self.assertEqual(len(shards), 3)
+        self.assertTrue(all(first <= last for first, last in shards))
+
+    def test_recompute_all_reports_throughput(self):
+        finished = []
+        with self.assertLogs('recommendations.sharding', 'WARNING'):
+            totals = recompute_all(workers=4, shard_size=2, batch_size=1, progress=finished.append)
+
+        self.assertEqual(totals['shards'], 3)
+        self.assertEqual(totals['users'], 6)
+        self.assertEqual(sum(shard['users'] for shard in finished), 6)
+        self.assertGreater(totals['users_per_second'], 0)
+        self.assertEqual(
+            totals['recommendations'],
+            GameRecommendation.objects.current().filter(user_profile_id__in=self.profile_ids).count()
+        )
+        self.assertFalse(GameRecommendation.objects.filter(user_profile_id=self.profile_ids[3]).exists())
+
+    @override_settings(RECOMMENDATION_BATCH_SIZE=4)
+    def test_nightly_task_dispatches_shards(self):
+        with mock.patch('recommendations.tasks.recompute_recommendation_shard.delay') as delay:
+            generate_recommendations_for_all_users()
+
+        delay.assert_has_calls([
+            mock.call(self.profile_ids[0], self.profile_ids[4]),
+            mock.call(self.profile_ids[5], self.profile_ids[6]),
+        ])
+
+
+class RecommendationSchedulingTestCase(SimpleTestCase):
+    """Tests for debounced per-user refresh scheduling."""
+
+    def setUp(self):
+        cache.clear()
+        patcher = mock.patch('recommendations.tasks.refresh_user_recommendations.apply_async')
+        self.apply_async = patcher.start()
+        self.apply_async.return_value.id = 'task-1'
+        self.addCleanup(patcher.stop)
+
+    def test_calls_within_window_are_coalesced(self):
+        first = schedule_recommendation_refresh(7, full=False)
+        second = schedule_recommendation_refresh(7, full=False)
+        third = schedule_recommendation_refresh(7, full=True)
+
+        self.apply_async.assert_called_once()
+        self.assertEqual(first, {'enqueued': True, 'task_id': 'task-1', 'coalesced': 0})
+        self.assertEqual((second['enqueued'], second['coalesced']), (False, 1))
+        self.assertEqual(third['coalesced'], 2)
+        self.assertEqual(claim_pending_refresh(7), (True, 2))
+
+    def test_claimed_refresh_allows_a_new_one(self):
+        schedule_recommendation_refresh(7, full=False)
+        self.assertEqual(claim_pending_refresh(7), (False, 0))
+
+        self.assertTrue(schedule_recommendation_refresh(7, full=False)['enqueued'])
+        self.assertEqual(self.apply_async.call_count, 2)
+
+    def test_lock_is_held_per_user(self):
+        with user_refresh_lock(7) as acquired:
+            self.assertTrue(acquired)
+            with user_refresh_lock(7) as acquired_again:
+                self.assertFalse(acquired_again)
+            with user_refresh_lock(8) as other_user:
+                self.assertTrue(other_user)
+
+        with user_refresh_lock(7) as acquired:
+            self.assertTrue(acquired)
@@ -3,14 +3,18 @@ from rest_framework import viewsets, permissions, status, filters
 from rest_framework.decorators import action
 from rest_framework.response import Response
 from django.shortcuts import get_object_or_404
+from django.db.models import Prefetch
 
+from games.models import Game
 from users.models import UserProfile
 from .models import GameRecommendation, RecommendationFeedback
 from .serializers import (
     GameRecommendationListSerializer, GameRecommendationDetailSerializer,
-    RecommendationFeedbackSerializer, RecommendationInteractionSerializer
+    RecommendationFeedbackSerializer, RecommendationInteractionSerializer,
+    SegmentRecommendationSerializer
 )
-from .tasks import generate_recommendations_for_user
+from .scheduling import schedule_recommendation_refresh
+from .segments import segment_recommendations
 
 
 class RecommendationViewSet(viewsets.ReadOnlyModelViewSet):
@@ -22,7 +26,25 @@ class RecommendationViewSet(viewsets.ReadOnlyModelViewSet):
     def get_queryset(self):
         # Only return recommendations for the current user
         user_profile = UserProfile.objects.get(user=self.request.user)
-        return GameRecommendation.objects.filter(user_profile=user_profile)
+        return GameRecommendation.objects.current().filter(user_profile=user_profile).prefetch_related(
+            Prefetch('game', queryset=Game.objects.for_list())
+        )
+    
+    def list(self, request, *args, **kwargs):
+        """
+        List the user's recommendations.
+        
+        Until the personalized list has been computed, the precomputed list
+        of the user's preference segment is served instead.
+        """
+        queryset = self.filter_queryset(self.get_queryset())
+        if not queryset.exists():
+            user_profile = UserProfile.objects.get(user=self.request.user)
+            if user_profile.survey_completed:
+                serializer = SegmentRecommendationSerializer(segment_recommendations(user_profile), many=True)
+                return Response(serializer.data, headers={'X-Recommendation-Source': 'segment'})
+        
+        return super().list(request, *args, **kwargs)
     
     def get_serializer_class(self):
         if self.action == 'retrieve':
@@ -75,11 +97,12 @@ class RecommendationViewSet(viewsets.ReadOnlyModelViewSet):
                 status=status.HTTP_400_BAD_REQUEST
             )
         
-        # Trigger async task to generate recommendations
-        task = generate_recommendations_for_user.delay(user_profile.id)
+        # Trigger async task to generate recommendations (debounced per user)
+        scheduled = schedule_recommendation_refresh(user_profile.id, full=True)
         
         return Response({
             'status': 'success',
             'message': 'Recommendation refresh has been triggered.',
-            'task_id': task.id
+            'task_id': scheduled['task_id'],
+            'coalesced': scheduled['coalesced']
         })
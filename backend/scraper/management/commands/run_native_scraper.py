@@ -135,6 +135,7 @@ class Command(BaseCommand):
                     self.stdout.write(self.style.SUCCESS(f'Saved game: {item.get("title")}'))
                 except Exception as e:
                     self.stdout.write(self.style.ERROR(f'Error saving game {item.get("title")}: {str(e)}'))
+            pipeline.close_spider(spider)
             
             # Update the job status
             job.status = 'completed'
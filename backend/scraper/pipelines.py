@@ -5,6 +5,12 @@ from games.models import Game, Genre, Platform
 class GameDataPipeline:
     """Pipeline to process and save game data to database."""
     
+    # Changed descriptions are sent to the description index in batches of this size
+    DESCRIPTION_BATCH_SIZE = 100
+    
+    def __init__(self):
+        self.changed_descriptions = set()
+    
     def process_item(self, item, spider):
         # Get or create genre objects
         genres = []
@@ -25,6 +31,7 @@ class GameDataPipeline:
         if games.exists():
             # Update existing game
             game = games.first()
+            old_description = game.description
             game.description = item.get('description', game.description)
             game.publisher = item.get('publisher', game.publisher)
             game.developer = item.get('developer', game.developer)
@@ -40,6 +47,9 @@ class GameDataPipeline:
                 game.release_date = item['release_date']
             
             game.save()
+            
+            if game.description != old_description:
+                self.changed_descriptions.add(game.id)
         else:
             # Create new game
             game = Game.objects.create(
@@ -54,6 +64,9 @@ class GameDataPipeline:
                 source_url=item.get('source_url', ''),
                 source_name=item.get('source_name', '')
             )
+            
+            if game.description:
+                self.changed_descriptions.add(game.id)
         
         # Add platform if exists
         if platform:
@@ -63,5 +76,20 @@ class GameDataPipeline:
         for genre in genres:
             game.genres.add(genre)
         
+        if len(self.changed_descriptions) >= self.DESCRIPTION_BATCH_SIZE:
+            self.flush_description_changes()
+        
         spider.logger.info(f"Saved game: {game.title}")
-        return item 
\ No newline at end of file
+        return item
+    
+    def close_spider(self, spider):
+        self.flush_description_changes()
+    
+    def flush_description_changes(self):
+        """Re-vectorize only the games whose description changed since the last flush."""
+        if not self.changed_descriptions:
+            return
+        
+        from recommendations.tasks import update_description_index
+        update_description_index.delay(sorted(self.changed_descriptions))
+        self.changed_descriptions = set()
@@ -5,8 +5,9 @@ from rest_framework.response import Response
 from django.db import transaction
 from django.contrib.auth.models import User
 from django.shortcuts import get_object_or_404
+from django.db.models import Prefetch
 
-from games.models import Platform, Genre
+from games.models import Game, Platform, Genre
 from .models import (
     UserProfile, UserGamePreferences, 
     PlatformPreference, GenrePreference,
@@ -16,7 +17,7 @@ from .serializers import (
     UserProfileSerializer, GamePreferenceSurveySerializer,
     GameRatingSerializer
 )
-from recommendations.tasks import generate_recommendations_for_user
+from recommendations.scheduling import schedule_recommendation_refresh
 
 
 class UserProfileViewSet(viewsets.ModelViewSet):
@@ -26,7 +27,15 @@ class UserProfileViewSet(viewsets.ModelViewSet):
     
     def get_queryset(self):
         # Users can only see their own profile
-        return UserProfile.objects.filter(user=self.request.user)
+        queryset = UserProfile.objects.filter(user=self.request.user)
+        if self.action in ('list', 'retrieve', 'update', 'partial_update'):
+            # UserProfileSerializer lists every rated game
+            queryset = queryset.prefetch_related(
+                Prefetch('gamerating_set', queryset=GameRating.objects.prefetch_related(
+                    Prefetch('game', queryset=Game.objects.for_list())
+                ))
+            )
+        return queryset
     
     def get_object(self):
         # Return the user's profile directly
@@ -160,8 +169,8 @@ class UserProfileViewSet(viewsets.ModelViewSet):
                     user_profile.survey_completed = True
                     user_profile.save()
                 
-                # Generate recommendations asynchronously
-                generate_recommendations_for_user.delay(user_profile.id)
+                # Generate recommendations asynchronously (debounced per user)
+                schedule_recommendation_refresh(user_profile.id, full=True)
                 
                 return Response({
                     'status': 'success',
@@ -177,7 +186,9 @@ class UserProfileViewSet(viewsets.ModelViewSet):
         
         if request.method == 'GET':
             # Get all ratings for this user
-            ratings = GameRating.objects.filter(user_profile=user_profile)
+            ratings = GameRating.objects.filter(user_profile=user_profile).prefetch_related(
+                Prefetch('game', queryset=Game.objects.for_list())
+            )
             serializer = GameRatingSerializer(ratings, many=True)
             return Response(serializer.data)
         
@@ -187,8 +198,8 @@ class UserProfileViewSet(viewsets.ModelViewSet):
             if serializer.is_valid():
                 serializer.save(user_profile=user_profile)
                 
-                # Generate new recommendations
-                generate_recommendations_for_user.delay(user_profile.id)
+                # Update recommendations incrementally (debounced per user)
+                schedule_recommendation_refresh(user_profile.id, full=False)
                 
                 return Response(serializer.data, status=status.HTTP_201_CREATED)
             return Response(serializer.errors, status=status.HTTP_400_BAD_REQUEST)
@@ -206,8 +217,8 @@ class UserProfileViewSet(viewsets.ModelViewSet):
                 if serializer.is_valid():
                     serializer.save()
                     
-                    # Generate new recommendations
-                    generate_recommendations_for_user.delay(user_profile.id)
+                    # Update recommendations incrementally (debounced per user)
+                    schedule_recommendation_refresh(user_profile.id, full=False)
                     
                     return Response(serializer.data)
                 return Response(serializer.errors, status=status.HTTP_400_BAD_REQUEST)
@@ -215,7 +226,7 @@ class UserProfileViewSet(viewsets.ModelViewSet):
             elif request.method == 'DELETE':
                 rating.delete()
                 
-                # Generate new recommendations
-                generate_recommendations_for_user.delay(user_profile.id)
+                # Update recommendations incrementally (debounced per user)
+                schedule_recommendation_refresh(user_profile.id, full=False)
                 
                 return Response(status=status.HTTP_204_NO_CONTENT)